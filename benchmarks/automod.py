@@ -0,0 +1,46 @@
+"""Throughput of the automod spam counters on a synthetic message stream.
+
+Usage: python -m benchmarks.automod [messages] [users]
+"""
+
+import random
+import sys
+import time
+
+from utils.spam import SpamTracker
+
+
+def synthetic_stream(messages: int, users: int, seed: int = 0):
+    rng = random.Random(seed)
+    words = ["hello", "clash", "python", "bot", "help", "codingame", "gg"]
+    now = 0.0
+    for _ in range(messages):
+        now += rng.expovariate(2000)  # ~2000 messages per second
+        content = " ".join(rng.choices(words, k=rng.randint(1, 12)))
+        yield rng.randrange(users), content, rng.random() < 0.05, now
+
+
+def main():
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 5_000
+
+    stream = list(synthetic_stream(messages, users))
+    tracker = SpamTracker(idle=60.0)
+    triggered = 0
+
+    start = time.perf_counter()
+    for user_id, content, mention, now in stream:
+        if tracker.check(user_id, content, int(mention), now) is not None:
+            triggered += 1
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"{messages} messages from {users} users in {elapsed:.3f}s: "
+        f"{messages / elapsed:,.0f} messages/s, "
+        f"{elapsed / messages * 1e6:.2f}us/message, "
+        f"{triggered} triggers, {len(tracker)} tracked users"
+    )
+
+
+if __name__ == "__main__":
+    main()
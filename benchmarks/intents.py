@@ -0,0 +1,303 @@
+"""Memory and CPU of discord.py's state for a synthetic large guild, with all
+the intents (the old setup) and with the intents derived from the cogs.
+
+Each setup runs in its own process. The CPU time is measured on a first
+replay and the memory held by the state with `tracemalloc` on a second one.
+The cogs are imported to read their intents, so the bot environment
+(`TOKEN`) must be set.
+
+Usage: python -m benchmarks.intents [members] [events]
+"""
+
+import discord
+
+import asyncio
+import gc
+import json
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+import typing
+
+GUILD_ID = 10 ** 17
+CHANNELS = 50
+ROLES = 30
+
+
+def rss() -> int:
+    """Resident memory of the process in bytes"""
+    with open("/proc/self/statm") as file:
+        return int(file.read().split()[1]) * 4096
+
+
+def snowflake(index: int) -> str:
+    return str(GUILD_ID + index)
+
+
+def user_data(index: int) -> dict:
+    return {
+        "id": snowflake(1_000_000 + index),
+        "username": f"user{index}",
+        "discriminator": f"{index % 10000:04}",
+        "avatar": None,
+    }
+
+
+def member_data(rng: random.Random, index: int) -> dict:
+    return {
+        "user": user_data(index),
+        "roles": [snowflake(100 + rng.randrange(ROLES))],
+        "joined_at": "2021-01-01T00:00:00+00:00",
+        "nick": None,
+        "deaf": False,
+        "mute": False,
+    }
+
+
+def presence_data(rng: random.Random, index: int) -> dict:
+    return {
+        "user": {"id": snowflake(1_000_000 + index)},
+        "guild_id": str(GUILD_ID),
+        "status": rng.choice(["online", "idle", "dnd"]),
+        "activities": [{"name": "CodinGame", "type": 0}],
+        "client_status": {"desktop": "online"},
+    }
+
+
+def guild_data(
+    rng: random.Random, members: int, intents: discord.Intents
+) -> typing.Tuple[dict, typing.List[dict]]:
+    """The GUILD_CREATE payload and the members sent when chunking.
+
+    Like Discord, the payload of a large guild only has the online members,
+    and only with the `presences` intent."""
+    online = range(0, members, 5) if intents.presences else range(0)
+    data = {
+        "id": str(GUILD_ID),
+        "name": "Large guild",
+        "owner_id": snowflake(1_000_000),
+        "member_count": members,
+        "large": True,
+        "features": [],
+        "emojis": [],
+        "voice_states": [],
+        "roles": [
+            {
+                "id": snowflake(100 + index) if index else str(GUILD_ID),
+                "name": f"role{index}",
+                "permissions": "0",
+                "position": index,
+                "color": 0,
+                "hoist": False,
+                "managed": False,
+                "mentionable": False,
+            }
+            for index in range(ROLES)
+        ],
+        "channels": [
+            {
+                "id": snowflake(200 + index),
+                "type": 0,
+                "name": f"channel{index}",
+                "position": index,
+                "permission_overwrites": [],
+            }
+            for index in range(CHANNELS)
+        ],
+        "members": [member_data(rng, index) for index in online],
+        "presences": [presence_data(rng, index) for index in online],
+    }
+    return data, [member_data(rng, index) for index in range(members)]
+
+
+def events(
+    rng: random.Random, count: int, members: int, intents: discord.Intents
+) -> typing.List[typing.Tuple[str, str]]:
+    """Raw gateway events, only the ones the intents subscribe to"""
+    kinds = [
+        ("PRESENCE_UPDATE", "presences", 70),
+        ("MESSAGE_CREATE", "guild_messages", 15),
+        ("TYPING_START", "guild_typing", 10),
+        ("GUILD_MEMBER_UPDATE", "members", 5),
+    ]
+    names = [name for name, _, _ in kinds]
+    weights = [weight for _, _, weight in kinds]
+    subscribed = {
+        name for name, intent, _ in kinds if getattr(intents, intent)
+    }
+
+    stream = []
+    for index, name in enumerate(rng.choices(names, weights, k=count)):
+        if name not in subscribed:
+            continue
+
+        member = rng.randrange(members)
+        channel = snowflake(200 + rng.randrange(CHANNELS))
+        if name == "PRESENCE_UPDATE":
+            data = presence_data(rng, member)
+        elif name == "MESSAGE_CREATE":
+            data = {
+                "id": snowflake(10_000_000 + index),
+                "channel_id": channel,
+                "guild_id": str(GUILD_ID),
+                "author": user_data(member),
+                "member": member_data(rng, member),
+                "content": "hello " * rng.randint(1, 20),
+                "timestamp": "2021-10-19T13:37:00+00:00",
+                "edited_timestamp": None,
+                "tts": False,
+                "mention_everyone": False,
+                "mentions": [],
+                "mention_roles": [],
+                "attachments": [],
+                "embeds": [],
+                "pinned": False,
+                "type": 0,
+            }
+        elif name == "TYPING_START":
+            data = {
+                "channel_id": channel,
+                "guild_id": str(GUILD_ID),
+                "user_id": snowflake(1_000_000 + member),
+                "timestamp": 1634650620,
+                "member": member_data(rng, member),
+            }
+        else:
+            data = dict(member_data(rng, member), guild_id=str(GUILD_ID))
+        stream.append((name, json.dumps(data)))
+    return stream
+
+
+def setup(
+    name: str,
+) -> typing.Tuple[discord.Intents, discord.MemberCacheFlags, bool]:
+    if name == "all":
+        intents = discord.Intents.all()
+        return intents, discord.MemberCacheFlags.from_intents(intents), True
+
+    from config import Config
+    from utils.intents import required_intents
+
+    return required_intents(Config.DEFAULT_COGS)
+
+
+def replay(
+    intents: discord.Intents,
+    cache_flags: discord.MemberCacheFlags,
+    guild: dict,
+    chunk_members: typing.List[dict],
+    stream: typing.List[typing.Tuple[str, str]],
+) -> typing.Tuple[discord.state.ConnectionState, float, float]:
+    """Load the guild and replay the events in a new state, get the state
+    and the CPU time of both"""
+    state = discord.state.ConnectionState(
+        dispatch=lambda *args, **kwargs: None,
+        handlers={},
+        hooks={},
+        syncer=None,
+        http=None,
+        loop=asyncio.new_event_loop(),
+        intents=intents,
+        member_cache_flags=cache_flags,
+        chunk_guilds_at_startup=False,
+    )
+
+    start = time.process_time()
+    cached = state._add_guild_from_data(guild)
+    # What the chunk requests of discord.py add to the cache
+    for data in chunk_members:
+        member = discord.Member(data=data, guild=cached, state=state)
+        if cache_flags.joined:
+            cached._add_member(member)
+    load_time = time.process_time() - start
+
+    parsers = state.parsers
+    start = time.process_time()
+    for event, raw in stream:
+        parsers[event](json.loads(raw))
+    return state, load_time, time.process_time() - start
+
+
+def run(name: str, members: int, count: int):
+    intents, cache_flags, chunk = setup(name)
+    rng = random.Random(0)
+    guild, chunk_members = guild_data(rng, members, intents)
+    stream = events(rng, count, members, intents)
+    if not chunk:
+        chunk_members = []
+
+    # CPU time without tracing the allocations
+    gc.collect()
+    before = rss()
+    state, load_time, replay_time = replay(
+        intents, cache_flags, guild, chunk_members, stream
+    )
+    resident = rss() - before
+    cached_members = len(state._get_guild(GUILD_ID).members)
+    del state
+    gc.collect()
+
+    # Memory held by the state, RSS is too noisy as the payloads were
+    # allocated and freed in the same arenas
+    tracemalloc.start()
+    state, _, _ = replay(intents, cache_flags, guild, chunk_members, stream)
+    gc.collect()
+    traced, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(
+        json.dumps(
+            {
+                "intents": sum(1 for _, value in intents if value),
+                "cache": [flag for flag, value in cache_flags if value],
+                "chunk": chunk,
+                "memory": traced,
+                "rss": resident,
+                "cached_members": cached_members,
+                "load": load_time,
+                "events": len(stream),
+                "replay": replay_time,
+            }
+        )
+    )
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--run":
+        return run(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]))
+
+    members = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 200_000
+
+    for name in ("all", "minimal"):
+        output = subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "benchmarks.intents",
+                "--run",
+                name,
+                str(members),
+                str(count),
+            ],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout
+        result = json.loads(output.splitlines()[-1])
+        print(
+            f"{name:>8}: {result['intents']} intents, member cache "
+            f"{'/'.join(result['cache']) or 'none'}, chunk {result['chunk']}: "
+            f"{result['cached_members']} members cached, "
+            f"{result['memory'] / 2 ** 20:.1f} MiB held by the state "
+            f"({result['rss'] / 2 ** 20:+.1f} MiB RSS), "
+            f"load {result['load']:.2f}s CPU, "
+            f"{result['events']} of {count} events in "
+            f"{result['replay']:.2f}s CPU"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Log calls per second with the handlers called directly and behind the
+queue of `LogPipeline`, writing to a file and to a slow stream.
+
+Usage: python -m benchmarks.logging [records]
+"""
+
+import io
+import logging
+import os
+import sys
+import tempfile
+import time
+
+from utils import LogPipeline, NoColorFormatter, color
+
+FORMAT = "[{asctime}.{msecs:0>3.0f}] {name:>15}: {levelname:>8}: {message}"
+
+
+class SlowStream(io.StringIO):
+    """Stream that stalls like a terminal or a pipe under load"""
+
+    def write(self, text):
+        time.sleep(0.00002)
+        return super().write(text)
+
+
+def make_logger(name: str, folder: str):
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+
+    file_handler = logging.FileHandler(
+        os.path.join(folder, f"{name}.log"), mode="w", encoding="utf-8"
+    )
+    file_handler.setFormatter(NoColorFormatter(fmt=FORMAT, style="{"))
+    stream_handler = logging.StreamHandler(SlowStream())
+    stream_handler.setFormatter(logging.Formatter(fmt=FORMAT, style="{"))
+
+    handlers = [file_handler, stream_handler]
+    for handler in handlers:
+        logger.addHandler(handler)
+    return logger, handlers
+
+
+def run(logger: logging.Logger, records: int) -> float:
+    start = time.perf_counter()
+    for index in range(records):
+        logger.info(color(f"guild #channel @user {index}: ", "cyan") + "hi")
+    return time.perf_counter() - start
+
+
+def main():
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+
+    with tempfile.TemporaryDirectory() as folder:
+        logger, handlers = make_logger("direct", folder)
+        direct = run(logger, records)
+
+        logger, handlers = make_logger("queued", folder)
+        pipeline = LogPipeline(logger, handlers, maxsize=records + 1)
+        pipeline.start()
+        queued = run(logger, records)
+        drain_start = time.perf_counter()
+        pipeline.stop()
+        drain = time.perf_counter() - drain_start
+
+    print(f"direct handlers: {records / direct:>10,.0f} calls/s")
+    print(
+        f"queued handlers: {records / queued:>10,.0f} calls/s "
+        f"(listener thread drained the rest in {drain:.2f}s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Cold start time of the bot, from the process start to the end of its
+startup phase (the gateway connection isn't included).
+
+Each run is a new process in a temporary folder. Exits with an error when
+the median is over the budget, to catch new imports slowing down restarts.
+
+Usage: python -m benchmarks.startup [runs] [budget in s]
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import asyncio, json
+
+from utils.imports import ImportProfiler, process_uptime
+
+profiler = ImportProfiler()
+profiler.start()
+from config import Config
+import bot
+profiler.stop()
+imported = process_uptime()
+
+Config.METRICS_PORT = None
+
+
+async def main():
+    client = bot.CodinGameBot()
+    await client.setup()
+    await client.start_services()
+    ready = process_uptime()
+    await client.close()
+    return client, ready
+
+
+client, ready = asyncio.get_event_loop().run_until_complete(main())
+print(json.dumps({
+    "imported": imported,
+    "ready": ready,
+    "steps": client.startup_times,
+    "imports": profiler.report(10),
+}))
+"""
+
+
+def run(folder: str) -> dict:
+    os.makedirs(os.path.join(folder, "log"), exist_ok=True)
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    env.setdefault("TOKEN", "benchmark")
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD],
+        cwd=folder,
+        env=env,
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    budget = float(sys.argv[2]) if len(sys.argv) > 2 else None
+
+    with tempfile.TemporaryDirectory() as folder:
+        # The first run fills the bytecode caches
+        run(folder)
+        results = [run(folder) for _ in range(runs)]
+
+    print(results[-1]["imports"])
+    print()
+    steps = results[-1]["steps"]
+    for step in steps:
+        median = statistics.median(result["steps"][step] for result in results)
+        print(f"{step:>28}: {median * 1000:>8.1f} ms")
+
+    imported = statistics.median(result["imported"] for result in results)
+    ready = statistics.median(result["ready"] for result in results)
+    print(
+        f"median of {runs} runs: imports done after {imported:.3f}s, "
+        f"startup done after {ready:.3f}s"
+    )
+
+    if budget is not None and ready > budget:
+        print(f"startup is over the budget of {budget:.3f}s")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
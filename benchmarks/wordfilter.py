@@ -0,0 +1,58 @@
+"""Cost of matching a message against blocklists of growing size.
+
+Usage: python -m benchmarks.wordfilter
+"""
+
+import random
+import re
+import string
+import time
+
+from utils.wordfilter import WordFilter
+
+
+def random_words(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    return [
+        "".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 10)))
+        for _ in range(count)
+    ]
+
+
+def per_call(func, argument, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(argument)
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    rng = random.Random(1)
+    vocabulary = ["hello", "how", "do", "i", "solve", "this", "clash", "python"]
+    message = " ".join(rng.choices(vocabulary, k=50))
+    words = random_words(5000)
+
+    print(f"message of {len(message)} characters")
+    for size in [10, 100, 1000, 5000]:
+        entries = words[:size]
+
+        build_start = time.perf_counter()
+        word_filter = WordFilter(entries)
+        build = time.perf_counter() - build_start
+
+        regexes = [re.compile(rf"\b{re.escape(word)}\b") for word in entries]
+
+        def regex_loop(text: str):
+            text = text.casefold()
+            return next((r for r in regexes if r.search(text)), None)
+
+        automaton = per_call(word_filter.search, message, 1000)
+        loop = per_call(regex_loop, message, max(10, 10000 // size))
+        print(
+            f"{size:>5} entries: automaton {automaton * 1e6:7.1f}us, "
+            f"re.search loop {loop * 1e6:9.1f}us, build {build * 1e3:.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
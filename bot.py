@@ -1,29 +1,103 @@
 import discord
+from discord.backoff import ExponentialBackoff
 from discord.ext import commands
+from discord.gateway import DiscordWebSocket, ReconnectWebSocket
 
-import codingame
+import aiohttp
+import asyncio
 import datetime
 import functools
+import importlib
 import logging
 import logging.handlers
+import math
 import os
 import sys
+import time
 import traceback
 import typing
 
 from config import Config
-from utils import indent, color, NoColorFormatter
+from utils import (
+    indent,
+    color,
+    NoColorFormatter,
+    LogPipeline,
+    LazyMessage,
+    SamplingFilter,
+)
+from utils.logging import CompressingRotatingFileHandler, JsonFormatter
+from utils.cache import Cache
+from utils.context import Context
+from utils.database import connect
+from utils.errors import ErrorTracker, trim_traceback
+from utils.http import HTTPPool
+from utils.imports import lazy_import, process_uptime
+from utils.infractions import Escalation, InfractionStore
+from utils.intents import enabled, required_intents
+from utils.ipc import IPCClient
+from utils.metrics import Metrics, MetricsServer
+from utils.monitor import Block, LoopMonitor
+from utils.outbox import Outbox, Priority
+from utils.sessions import GatewaySession, SessionStore
+from utils.timers import TimerManager
+from utils.tracing import Tracer, mark
+
+if typing.TYPE_CHECKING:
+    import codingame
+else:
+    codingame = lazy_import("codingame")
 
 os.environ["JISHAKU_NO_UNDERSCORE"] = "True"
 os.environ["JISHAKU_HIDE"] = "True"
 
+# Events whose guild is in `id` instead of `guild_id`
+GUILD_EVENTS = {"GUILD_CREATE", "GUILD_UPDATE", "GUILD_DELETE"}
 
-class CodinGameBot(commands.Bot):
+# One gateway connection per shard in the same process when sharded
+BaseBot = commands.AutoShardedBot if Config.SHARDED else commands.Bot
+
+
+def cluster_path(path: str) -> str:
+    """Path of a file written by each cluster, suffixed by the cluster ID so
+    the workers don't rotate the same log files"""
+    if Config.CLUSTER_ID is None:
+        return path
+    root, extension = os.path.splitext(path)
+    return f"{root}.{Config.CLUSTER_ID}{extension}"
+
+
+class CodinGameBot(BaseBot):
     def __init__(self, **kwargs):
+        if Config.SHARDED:
+            kwargs.setdefault("shard_count", Config.SHARD_COUNT)
+            kwargs.setdefault("shard_ids", Config.SHARD_IDS)
+
+        # Only subscribe to the events and cache the members the cogs need
+        intents, member_cache_flags, chunk_guilds = required_intents(
+            Config.DEFAULT_COGS + Config.DEFERRED_COGS,
+            intents=Config.INTENTS,
+            member_cache=Config.MEMBER_CACHE,
+            chunk_guilds=Config.CHUNK_GUILDS,
+        )
+        # Created first, discord.py uses the HTTP pool
+        self.metrics = Metrics()
+        self.http_pool = HTTPPool(
+            self.metrics,
+            limit=Config.HTTP_LIMIT,
+            limit_per_host=Config.HTTP_LIMIT_PER_HOST,
+            keepalive=Config.HTTP_KEEPALIVE,
+            dns_ttl=Config.HTTP_DNS_TTL,
+            timeout=Config.HTTP_TIMEOUT,
+            connect_timeout=Config.HTTP_CONNECT_TIMEOUT,
+        )
+        kwargs.setdefault("connector", self.http_pool.connector)
         super().__init__(
             command_prefix=Config.PREFIX,
             case_insensitive=True,
-            intents=discord.Intents.all(),
+            intents=intents,
+            member_cache_flags=member_cache_flags,
+            chunk_guilds_at_startup=chunk_guilds,
             owner_id=Config.OWNER_ID,
             allowed_mentions=discord.AllowedMentions(
                 everyone=False, roles=False
@@ -31,9 +105,117 @@ class CodinGameBot(commands.Bot):
             **kwargs,
         )
         self.start_time: datetime = datetime.datetime.now(datetime.timezone.utc)
-        self.cg_client: typing.Optional[codingame.Client] = None
+        self._cg_client: typing.Optional["codingame.Client"] = None
+        self._http_session: typing.Optional[aiohttp.ClientSession] = None
+        self.is_setup = False
+        self.ready_count = 0
+        # Time taken by each step of `setup`, in seconds
+        self.startup_times: typing.Dict[str, float] = {}
+        self.errors = ErrorTracker(Config.ERROR_REPORT_WINDOW)
+        self.error_digest_task: typing.Optional[asyncio.Task] = None
+        # Commands are ignored while draining before a shutdown
+        self.draining = False
+        # Event handlers still running and their event, awaited when draining
+        self.pending_tasks: typing.Dict[asyncio.Task, str] = {}
 
         self.init_log(Config.LOG_LEVEL)
+        self.logger.info(
+            f"intents: {', '.join(enabled(intents))}, member cache: "
+            f"{', '.join(enabled(member_cache_flags)) or 'none'}, "
+            f"chunk guilds: {chunk_guilds}"
+        )
+
+        self.metrics.describe(
+            "bot_command_duration_seconds", "Duration of the commands"
+        )
+        self.metrics.describe(
+            "bot_listener_duration_seconds", "Duration of the log listeners"
+        )
+        self.metrics.describe(
+            "codingame_request_duration_seconds",
+            "Duration of the CodinGame API requests",
+        )
+        self.metrics.describe(
+            "bot_gateway_events_total", "Gateway events received by shard"
+        )
+        self.metrics.gauge(
+            "bot_shard_latency_seconds",
+            lambda: {
+                (("shard", str(shard_id)),): latency
+                for shard_id, latency in self.shard_latencies()
+                if not math.isnan(latency)
+            },
+            "Heartbeat latency of each shard",
+        )
+        self.tracer = Tracer(Config.TRACE_THRESHOLD, Config.TRACE_BUFFER_SIZE)
+        self.before_invoke(self.trace_before_invoke)
+        self.after_invoke(self.trace_after_invoke)
+
+        self.loop_monitor = LoopMonitor(
+            self.loop,
+            self.metrics,
+            self.logger.getChild("loop"),
+            interval=Config.LOOP_MONITOR_INTERVAL,
+            threshold=Config.LOOP_BLOCK_THRESHOLD,
+            debug=Config.LOOP_DEBUG,
+            alert_threshold=Config.LOOP_LAG_ALERT,
+            alert_interval=Config.LOOP_ALERT_INTERVAL,
+            on_alert=self.send_loop_alert,
+        )
+
+        self.metrics_server = (
+            MetricsServer(
+                self.metrics,
+                Config.METRICS_HOST,
+                # One port per cluster
+                Config.METRICS_PORT + (Config.CLUSTER_ID or 0),
+                self.logger.getChild("metrics"),
+            )
+            if Config.METRICS_PORT
+            else None
+        )
+
+        # Bus between the clusters, when started by the launcher
+        self.ipc = (
+            IPCClient(
+                Config.IPC_PATH,
+                Config.CLUSTER_ID,
+                self.logger.getChild("ipc"),
+            )
+            if Config.CLUSTER_ID is not None
+            else None
+        )
+
+        # Messages are sent by priority, the command replies first
+        self.outbox = Outbox(
+            self.http,
+            self.metrics,
+            self.logger.getChild("outbox"),
+            concurrency=Config.SEND_CONCURRENCY,
+            reserved=Config.SEND_RESERVED,
+        )
+
+        self.cache = Cache(
+            self.logger.getChild("cache"),
+            maxsize=Config.CACHE_SIZE,
+            url=Config.CACHE_URL,
+            timeout=Config.CACHE_TIMEOUT,
+            metrics=self.metrics,
+        )
+
+        self.db = connect(Config.DATABASE)
+        self.sessions = SessionStore(self.db)
+        self.timers = TimerManager(self, self.db)
+        self.infractions = InfractionStore(
+            self.db,
+            {
+                rule: Escalation(
+                    action,
+                    datetime.timedelta(seconds=duration) if duration else None,
+                )
+                for rule, (action, duration) in Config.ESCALATIONS.items()
+            },
+        )
 
     def init_log(self, level=logging.INFO):
         self.logger: logging.Logger = logging.getLogger("bot")
@@ -53,8 +235,11 @@ class CodinGameBot(commands.Bot):
         )
 
         # INFO file handler
-        file_handler = logging.FileHandler(
-            "log/root.log", mode="w", encoding="utf-8"
+        file_handler = CompressingRotatingFileHandler(
+            cluster_path("log/root.log"),
+            max_bytes=Config.LOG_MAX_BYTES,
+            interval=Config.LOG_ROTATE_INTERVAL,
+            backup_count=Config.LOG_BACKUP_COUNT,
         )
         file_handler.setLevel(logging.INFO)
 
@@ -77,17 +262,55 @@ class CodinGameBot(commands.Bot):
 
         # ERROR file handler
         error_handler = logging.handlers.RotatingFileHandler(
-            "log/error.log", maxBytes=2 ** 16, backupCount=10, encoding="utf-8"
+            cluster_path("log/error.log"),
+            maxBytes=2 ** 16,
+            backupCount=10,
+            encoding="utf-8",
         )
         error_handler.setLevel(logging.ERROR)
 
         error_handler.setFormatter(file_formatter)
         self.logger.addHandler(error_handler)
 
+        handlers = [file_handler, stdout_handler, stderr_handler, error_handler]
+
+        # JSON lines file handler
+        if Config.LOG_JSON:
+            json_handler = CompressingRotatingFileHandler(
+                cluster_path(Config.LOG_JSON),
+                max_bytes=Config.LOG_MAX_BYTES,
+                interval=Config.LOG_ROTATE_INTERVAL,
+                backup_count=Config.LOG_BACKUP_COUNT,
+            )
+            json_handler.setLevel(logging.DEBUG)
+
+            json_handler.setFormatter(JsonFormatter())
+            self.logger.addHandler(json_handler)
+            handlers.append(json_handler)
+
+        # Move the handlers to a thread so they don't block the event loop
+        self.log_pipeline = LogPipeline(
+            self.logger,
+            handlers,
+            maxsize=Config.LOG_QUEUE_SIZE,
+            policy=Config.LOG_QUEUE_POLICY,
+        )
+        self.log_pipeline.start()
+
         # Child loggers
         self.message_logger = self.logger.getChild("message")
+        self.message_logger.addFilter(
+            SamplingFilter(
+                Config.MESSAGE_LOG_SAMPLE_RATES,
+                Config.MESSAGE_LOG_BYTES_PER_SECOND,
+            )
+        )
         self.command_logger = self.logger.getChild("command")
 
+        # Slow callbacks are logged by asyncio when the loop is in debug mode
+        if Config.LOOP_DEBUG:
+            logging.getLogger("asyncio").addHandler(self.log_pipeline.handler)
+
     # --------------------------------------------------------------------------
     # Cogs
 
@@ -100,15 +323,411 @@ class CodinGameBot(commands.Bot):
         self.logger.debug(color(f"loaded cog `{name}`", "yellow"))
 
     # --------------------------------------------------------------------------
-    # Events
+    # Startup
+
+    async def start(self, *args, **kwargs):
+        await self.setup()
+        await self.start_services()
+        await super().start(*args, **kwargs)
+
+    async def setup(self):
+        """Load the extensions before logging in, so commands work as soon as
+        the gateway is ready. The extensions are kept when the client is
+        restarted"""
+        if self.is_setup:
+            return
 
-    async def on_ready(self):
-        self.cg_client = codingame.Client(is_async=True)
+        total = time.perf_counter()
+
+        for extension in Config.DEFAULT_COGS:
+            # Loaded before a failed startup
+            if extension in self.extensions:
+                continue
+
+            start = time.perf_counter()
+            self.load_extension(extension)
+            elapsed = self.startup_times[extension] = (
+                time.perf_counter() - start
+            )
+            self.logger.info(
+                f"loaded extension `{extension}` in {elapsed * 1000:.1f} ms"
+            )
+
+        if Config.DEFERRED_COGS:
+            self.loop.create_task(self.load_deferred_extensions())
+
+        self.is_setup = True
+        self.logger.info(
+            color(
+                f"loaded all cogs, startup took "
+                f"{(time.perf_counter() - total) * 1000:.1f} ms",
+                "green",
+            )
+        )
+
+    async def start_services(self):
+        """Start the background jobs, stopped by `close`"""
+        self.log_pipeline.start()
+        # Only one cluster receives the commands and events of the guild
+        if self.handles_guild(Config.GUILD):
+            self.timers.start()
+        self.loop_monitor.start()
+        self.outbox.start()
+        if self.metrics_server is not None:
+            start = time.perf_counter()
+            try:
+                await self.metrics_server.start()
+            except OSError as error:
+                self.logger.error(f"couldn't serve the metrics: {error}")
+            self.startup_times["metrics server"] = time.perf_counter() - start
+        if self.error_digest_task is None or self.error_digest_task.done():
+            self.error_digest_task = self.loop.create_task(
+                self.send_error_digests()
+            )
+        if self.ipc is not None:
+            self.ipc.start()
+        self.cache.start()
+
+    async def load_deferred_extensions(self):
+        """Load the extensions that aren't needed to start, once ready. Their
+        modules are imported in a thread so the event loop isn't blocked"""
+        await self.wait_until_ready()
+
+        for extension in Config.DEFERRED_COGS:
+            start = time.perf_counter()
+            try:
+                await self.loop.run_in_executor(
+                    None, importlib.import_module, extension
+                )
+                self.load_extension(extension)
+            except Exception as error:
+                await self.handle_error(error)
+                continue
+
+            elapsed = self.startup_times[extension] = (
+                time.perf_counter() - start
+            )
+            self.logger.info(
+                f"loaded deferred extension `{extension}` in "
+                f"{elapsed * 1000:.1f} ms"
+            )
 
-        for cog in Config.DEFAULT_COGS:
-            self.load_extension(cog)
+    @property
+    def cg_client(self) -> "codingame.Client":
+        """The CodinGame client, created on first use"""
+        if self._cg_client is None:
+            client = codingame.Client(is_async=True)
+            # Replace the session the client creates by one using the pool
+            http = client._state.http
+            unused = http._AsyncHTTPClient__session
+            http._AsyncHTTPClient__session = self.http_pool.session(
+                headers=http.headers
+            )
+            self.loop.create_task(unused.close())
+            self._cg_client = client
+        return self._cg_client
+
+    @property
+    def http_session(self) -> aiohttp.ClientSession:
+        """Session of the cogs for other websites, using the HTTP pool"""
+        if self._http_session is None or self._http_session.closed:
+            self._http_session = self.http_pool.session()
+        return self._http_session
+
+    async def login(self, token: str, *, bot: bool = True):
+        await super().login(token, bot=bot)
+        # discord.py creates its session when logging in, its requests are
+        # counted with the others
+        session = self.http._HTTPClient__session
+        session._trace_configs.append(self.http_pool.trace_config)
+
+    # --------------------------------------------------------------------------
+    # Gateway
+
+    async def connect(self, *, reconnect=True):
+        """`Client.connect`, but the first connection resumes the session of
+        the previous process when there's one"""
+        if Config.SHARDED:
+            return await super().connect(reconnect=reconnect)
+
+        backoff = ExponentialBackoff()
+        ws_params = {"initial": True, "shard_id": self.shard_id}
+
+        session = (
+            self.sessions.pop(self.shard_id or 0, Config.SESSION_MAX_AGE)
+            if Config.SESSION_RESUME
+            else None
+        )
+        if session is not None:
+            # An invalid session makes the gateway identify again
+            self.logger.info(
+                f"resuming session `{session.session_id}` at sequence "
+                f"{session.sequence}, saved {session.age:.1f}s ago"
+            )
+            ws_params.update(
+                gateway=session.gateway,
+                session=session.session_id,
+                sequence=session.sequence,
+                resume=True,
+            )
 
-        self.logger.info(color("loaded all cogs", "green"))
+        while not self.is_closed():
+            try:
+                coro = DiscordWebSocket.from_client(self, **ws_params)
+                self.ws = await asyncio.wait_for(coro, timeout=60.0)
+                ws_params["initial"] = False
+                while True:
+                    await self.ws.poll_event()
+            except ReconnectWebSocket as e:
+                self.logger.info(f"gateway requested to {e.op} the websocket")
+                self.dispatch("disconnect")
+                ws_params.update(
+                    sequence=self.ws.sequence,
+                    resume=e.resume,
+                    session=self.ws.session_id,
+                )
+                continue
+            except (
+                OSError,
+                discord.HTTPException,
+                discord.GatewayNotFound,
+                discord.ConnectionClosed,
+                aiohttp.ClientError,
+                asyncio.TimeoutError,
+            ) as exc:
+                self.dispatch("disconnect")
+                if not reconnect:
+                    await self.close()
+                    if (
+                        isinstance(exc, discord.ConnectionClosed)
+                        and exc.code == 1000
+                    ):
+                        return
+                    raise
+
+                if self.is_closed():
+                    return
+
+                # Connection reset by peer
+                if isinstance(exc, OSError) and exc.errno in (54, 10054):
+                    ws_params.update(
+                        sequence=self.ws.sequence,
+                        initial=False,
+                        resume=True,
+                        session=self.ws.session_id,
+                    )
+                    continue
+
+                if isinstance(exc, discord.ConnectionClosed):
+                    if exc.code == 4014:
+                        raise discord.PrivilegedIntentsRequired(
+                            exc.shard_id
+                        ) from None
+                    if exc.code != 1000:
+                        await self.close()
+                        raise
+
+                retry = backoff.delay()
+                self.logger.warning(
+                    f"gateway connection lost ({exc!r}), reconnecting in "
+                    f"{retry:.2f}s"
+                )
+                await asyncio.sleep(retry)
+                # Resuming a session that was lost makes the gateway
+                # invalidate it, then the connection identifies again
+                ws_params.update(
+                    sequence=self.ws.sequence if self.ws else None,
+                    resume=self.ws is not None,
+                    session=self.ws.session_id if self.ws else None,
+                )
+
+    def shard_of(self, guild_id: typing.Optional[int]) -> int:
+        """Shard receiving the events of a guild, DMs are sent to shard 0"""
+        if guild_id is None:
+            return 0
+        return (guild_id >> 22) % (self.shard_count or 1)
+
+    def handles_guild(self, guild_id: int) -> bool:
+        """Whether the guild is on a shard of this process"""
+        if not Config.SHARDED or self.shard_ids is None:
+            return True
+        return self.shard_of(guild_id) in self.shard_ids
+
+    def shard_latencies(self) -> typing.List[typing.Tuple[int, float]]:
+        if Config.SHARDED:
+            return self.latencies
+        return [(self.shard_id or 0, self.latency)]
+
+    def dispatch(self, event_name, *args, **kwargs):
+        # Counted here rather than in a listener, which would create a task
+        # for every gateway message
+        if event_name == "socket_response":
+            self.count_gateway_event(args[0])
+        super().dispatch(event_name, *args, **kwargs)
+
+    def count_gateway_event(self, message: dict):
+        event = message.get("t")
+        data = message.get("d")
+        if event is None or not isinstance(data, dict):
+            return
+
+        guild_id = data.get("id" if event in GUILD_EVENTS else "guild_id")
+        self.metrics.inc(
+            "bot_gateway_events_total",
+            shard=str(self.shard_of(guild_id and int(guild_id))),
+            event=event,
+        )
+
+    def save_session(self) -> typing.Optional[GatewaySession]:
+        """Store the gateway session so the next process can resume it"""
+        if self.ws is None or self.ws.session_id is None:
+            return None
+
+        session = self.sessions.save(
+            self.shard_id or 0,
+            self.ws.session_id,
+            self.ws.sequence,
+            self.ws.gateway,
+        )
+        self.logger.info(
+            f"saved session `{session.session_id}` at sequence "
+            f"{session.sequence}"
+        )
+        return session
+
+    async def on_resumed(self):
+        if self.user is not None:
+            self.logger.info(color("resumed the gateway session", "yellow"))
+            return
+
+        # The session of the previous process was resumed, there is no READY
+        # so the cache is empty
+        start = time.perf_counter()
+        await self.restore_cache()
+        self.logger.info(
+            f"resumed the session of the previous process, rebuilt the cache "
+            f"of {len(self.guilds)} guilds in "
+            f"{(time.perf_counter() - start) * 1000:.1f} ms"
+        )
+        self._ready.set()
+        self.dispatch("ready")
+
+    async def restore_cache(self):
+        """Cache the bot user, its guilds and their channels from the API,
+        what READY and GUILD_CREATE usually contain"""
+        state = self._connection
+        state.user = user = discord.ClientUser(
+            state=state, data=await self.http.get_user("@me")
+        )
+        state._users[user.id] = user
+
+        # The guilds are listed by pages of 100
+        guild_ids = []
+        after = None
+        while True:
+            page = await self.http.get_guilds(100, after=after)
+            guild_ids += [int(partial["id"]) for partial in page]
+            if len(page) < 100:
+                break
+            after = page[-1]["id"]
+
+        # Bounded so the other requests aren't held by the global rate limit
+        semaphore = asyncio.Semaphore(10)
+
+        async def restore_guild(guild_id: int):
+            async with semaphore:
+                data, channels, member = await asyncio.gather(
+                    self.http.get_guild(guild_id),
+                    self.http.get_all_guild_channels(guild_id),
+                    self.http.get_member(guild_id, user.id),
+                )
+            data["channels"] = channels
+            guild = state._add_guild_from_data(data)
+            guild._add_member(
+                discord.Member(data=member, guild=guild, state=state)
+            )
+            if state._guild_needs_chunking(guild):
+                await guild.chunk()
+
+        results = await asyncio.gather(
+            *(restore_guild(guild_id) for guild_id in guild_ids),
+            return_exceptions=True,
+        )
+        for guild_id, result in zip(guild_ids, results):
+            if isinstance(result, Exception):
+                self.logger.warning(
+                    f"couldn't restore the cache of guild {guild_id}: "
+                    f"{type(result).__name__}: {result}"
+                )
+
+    # --------------------------------------------------------------------------
+    # Shutdown
+
+    def _schedule_event(self, coro, event_name, *args, **kwargs):
+        task = super()._schedule_event(coro, event_name, *args, **kwargs)
+        self.pending_tasks[task] = event_name
+        task.add_done_callback(
+            lambda task: self.pending_tasks.pop(task, None)
+        )
+        return task
+
+    async def drain(self, timeout: float) -> int:
+        """Stop accepting commands and dispatching timers, and wait for the
+        running event handlers (commands, log messages, ...) to finish.
+        Returns the number of handlers still running after `timeout`"""
+        self.draining = True
+        self.timers.stop()
+
+        current = asyncio.current_task()
+        pending = {
+            task
+            for task in self.pending_tasks
+            if task is not current and not task.done()
+        }
+        self.logger.info(
+            color(
+                f"draining {len(pending)} running event handlers, waiting "
+                f"up to {timeout:.0f}s",
+                "yellow",
+            )
+        )
+        if pending:
+            _, pending = await asyncio.wait(pending, timeout=timeout)
+        if pending:
+            self.logger.warning(
+                f"{len(pending)} event handlers still running after "
+                f"draining: "
+                + ", ".join(sorted({self.pending_tasks[t] for t in pending}))
+            )
+        return len(pending)
+
+    def clear(self):
+        """Reset the client so it can be started again after it was closed,
+        the extensions stay loaded.
+
+        Unlike `Client.clear`, the HTTP session isn't recreated here, logging
+        in creates a new one and there is none if the client crashed before"""
+        self._closed = False
+        self._ready.clear()
+        self._connection.clear()
+        self.draining = False
+
+    # --------------------------------------------------------------------------
+    # Events
+
+    async def on_ready(self):
+        self.ready_count += 1
+        if self.ready_count == 1:
+            self.startup_times["ready"] = process_uptime()
+            self.logger.info(
+                f"ready {self.startup_times['ready']:.2f}s after the process "
+                "started"
+            )
+        else:
+            # `on_ready` fires again when the gateway session is recreated
+            self.logger.info(
+                color(f"ready again (#{self.ready_count})", "yellow")
+            )
 
         await self.change_presence(
             activity=discord.Game(name=f"{Config.PREFIX}help")
@@ -118,9 +737,41 @@ class CodinGameBot(commands.Bot):
         self.logger.info(color(f"logged in as user `{self.user}`", "green"))
 
     async def close(self):
-        await self.cg_client.close()
+        if self.is_closed():
+            return
+
+        self.timers.stop()
+        self.loop_monitor.stop()
+        if self.error_digest_task is not None:
+            self.error_digest_task.cancel()
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+        if self._cg_client is not None:
+            await self._cg_client.close()
+            self._cg_client = None
+        if self._http_session is not None:
+            await self._http_session.close()
+            self._http_session = None
+        if self.ipc is not None:
+            await self.ipc.stop()
+        self.cache.stop()
+        # Before discord.py closes its session
+        await self.outbox.stop()
+
+        ws = self.ws
+        keep_session = Config.SESSION_RESUME and ws is not None and ws.open
+        if keep_session:
+            # `Client.close` closes the websocket with code 1000, which ends
+            # the session, so it's closed after with another code
+            self.ws = None
         await super().close()
+        if keep_session:
+            self.ws = ws
+            await ws.close(code=4000)
+            self.save_session()
+
         self.logger.info(color("logged out", "red"))
+        self.log_pipeline.stop()
 
     async def on_message(self, message: discord.Message):
         await self.wait_until_ready()
@@ -128,6 +779,23 @@ class CodinGameBot(commands.Bot):
         if message.author.bot:
             return
 
+        if self.message_logger.isEnabledFor(logging.INFO):
+            # The message is only formatted if the record is emitted
+            self.message_logger.info(
+                LazyMessage(self.format_message_log, message),
+                extra={
+                    "guild_id": message.guild and message.guild.id,
+                    "channel_id": message.channel.id,
+                    "user_id": message.author.id,
+                    "size": len(message.content)
+                    + 100 * len(message.attachments),
+                },
+            )
+
+        await self.process_commands(message)
+
+    @staticmethod
+    def format_message_log(message: discord.Message) -> str:
         message_info: str = (
             (
                 f"{message.guild} ({message.guild.id}): "
@@ -143,20 +811,25 @@ class CodinGameBot(commands.Bot):
             49,
         )
 
-        self.message_logger.info(color(message_info, "cyan") + message_text)
-
-        await self.process_commands(message)
+        return color(message_info, "cyan") + message_text
 
     async def process_commands(self, message: discord.Message):
-        if message.author.bot:
+        if message.author.bot or self.draining:
             return
 
-        ctx: commands.Context = await self.get_context(message=message)
+        trace = self.tracer.start("")
+        ctx: commands.Context = await self.get_context(
+            message=message, cls=Context
+        )
+        mark("get_context")
 
         if ctx.command is None:
+            self.tracer.finish(trace)
             return
 
         ctx.full_name = " ".join(ctx.invoked_parents + [ctx.invoked_with])
+        trace.name = ctx.full_name
+        trace.info.update(self.log_extra(ctx))
 
         command_info: str = (
             (f"{ctx.guild} ({ctx.guild.id}): " if ctx.guild is not None else "")
@@ -167,12 +840,41 @@ class CodinGameBot(commands.Bot):
             + "`"
         )
 
-        self.command_logger.info(color(command_info, "purple"))
+        self.command_logger.info(
+            color(command_info, "purple"), extra=self.log_extra(ctx)
+        )
 
+        start = time.perf_counter()
         try:
             await self.invoke(ctx)
         except Exception as exc:
+            ctx.command_failed = True
             await self.dispatch("command_error", ctx, exc)
+        finally:
+            # `ctx.command` is the subcommand that was invoked, if any
+            self.metrics.observe(
+                "bot_command_duration_seconds",
+                time.perf_counter() - start,
+                command=ctx.command.qualified_name,
+                status="error" if ctx.command_failed else "success",
+            )
+            if self.tracer.finish(
+                trace, "failed" if ctx.command_failed else "other"
+            ):
+                self.command_logger.info(
+                    f"slow command `{ctx.full_name}`: "
+                    f"{trace.duration * 1000:.0f} ms",
+                    extra=self.log_extra(ctx),
+                )
+
+    @staticmethod
+    async def trace_before_invoke(ctx: commands.Context):
+        # Checks, cooldowns and converters run before the hooks
+        mark(f"checks & converters: {ctx.command.qualified_name}")
+
+    @staticmethod
+    async def trace_after_invoke(ctx: commands.Context):
+        mark(f"callback: {ctx.command.qualified_name}")
 
     async def on_command_error(
         self, ctx: commands.Context, exception: Exception
@@ -187,6 +889,7 @@ class CodinGameBot(commands.Bot):
         self.command_logger.warning(
             f"{ctx.full_name} raised exception: {exception}",
             exc_info=(type(exception), exception, exception.__traceback__),
+            extra=self.log_extra(ctx),
         )
 
         if isinstance(error, commands.CheckFailure):
@@ -245,9 +948,15 @@ class CodinGameBot(commands.Bot):
         self.logger.exception(
             "Unhandled error",
             exc_info=(type(exception), exception, exception.__traceback__),
+            extra=self.log_extra(ctx) if ctx else None,
         )
         stack = traceback.extract_tb(exception.__traceback__)
 
+        # Only report the first occurrence of an error within the window
+        stats, report = self.errors.record(exception, stack)
+        if not report:
+            return
+
         error_embed = self.embed(
             title="Unhandled error",
             description=f"`{stack[-1].name}` raised an unhandled error",
@@ -281,23 +990,103 @@ class CodinGameBot(commands.Bot):
             name="Type", value=f"`{type(exception).__name__}`", inline=True
         )
         error_embed.add_field(name="Error", value=f"`{exception}`", inline=True)
+        if stats.count > 1:
+            error_embed.add_field(
+                name="Occurrences",
+                value=f"{stats.unreported} since the last report, "
+                f"{stats.count} in total",
+                inline=True,
+            )
+        error_embed.set_footer(text=f"Fingerprint: {stats.fingerprint}")
 
-        tb = "".join(traceback.format_tb(exception.__traceback__))
-        if len(tb) + 9 > 1024:
-            for limit in range(-len(stack), 0):
-                tb = "".join(
-                    traceback.format_tb(exception.__traceback__, limit)
-                )
-                if len(tb) + 9 <= 1024:
-                    break
-
+        tb = trim_traceback(stack, 1024 - 9)
         error_embed.add_field(
             name="Full traceback",
             value=f"```py\n{tb}```",
             inline=False,
         )
 
-        await self.owner.send(embed=error_embed)
+        self.errors.reported(stats)
+        await self.outbox.send(
+            self.owner, Priority.DIAGNOSTICS, embed=error_embed
+        )
+
+    async def send_error_digests(self):
+        """DM the owner a summary of the errors that weren't reported"""
+        while True:
+            await asyncio.sleep(Config.ERROR_DIGEST_INTERVAL)
+            pending = self.errors.digest()
+            if not pending:
+                continue
+
+            embed = self.embed(
+                title="Unhandled errors digest",
+                description=f"{sum(count for _, count in pending)} "
+                f"unreported errors in the last "
+                f"{Config.ERROR_DIGEST_INTERVAL // 60} minutes",
+                color=discord.Colour.red(),
+            )
+            for stats, count in pending[:25]:
+                embed.add_field(
+                    name=f"{stats.name} × {count}",
+                    value=f"`{stats.location}`\n"
+                    f"Fingerprint: `{stats.fingerprint}`",
+                    inline=False,
+                )
+
+            try:
+                await self.outbox.send(
+                    self.owner, Priority.DIAGNOSTICS, embed=embed
+                )
+            except Exception:
+                self.logger.exception("Couldn't send the errors digest")
+
+    async def send_loop_alert(self, p99: float, blocks: typing.List[Block]):
+        """DM the owner that the event loop is lagging"""
+        embed = self.embed(
+            title="Event loop lag",
+            description=f"p99 lag over the last heartbeats: {p99 * 1000:.0f} ms"
+            f"\n{len(blocks)} blocks since the last alert",
+            color=discord.Colour.orange(),
+        )
+        for block in blocks[-3:]:
+            stack = "".join(block.stack.format()[-4:])[-1000 + 9 :]
+            embed.add_field(
+                name=f"Blocked for more than {block.duration:.2f}s at "
+                + time.strftime("%H:%M:%S", time.localtime(block.started_at)),
+                value=f"```py\n{stack}```",
+                inline=False,
+            )
+
+        try:
+            await self.outbox.send(
+                self.owner, Priority.DIAGNOSTICS, embed=embed
+            )
+        except Exception:
+            self.logger.exception("Couldn't send the event loop alert")
+
+    @staticmethod
+    def log_extra(ctx: commands.Context) -> dict:
+        """Context of a command, as fields of the structured logs"""
+        return {
+            "guild_id": ctx.guild and ctx.guild.id,
+            "channel_id": ctx.channel.id,
+            "user_id": ctx.author.id,
+            "command": getattr(ctx, "full_name", None)
+            or (ctx.command and ctx.command.qualified_name),
+        }
+
+    def cache_stats(self) -> typing.Dict[str, typing.Any]:
+        """Caches reported by `profile mem`, cogs can define the same method
+        to report theirs"""
+        return {
+            "timers": self.timers,
+            "infraction counts": self.infractions,
+            "error stats": self.errors,
+            "slow traces": self.tracer,
+            "metrics": self.metrics,
+            "cache": self.cache.local.entries,
+        }
 
     @property
     def owner(self) -> discord.User:
@@ -0,0 +1,321 @@
+import discord
+from discord.ext import commands
+
+import datetime
+import re
+import time
+import typing
+
+from config import Config
+from utils import color
+from utils.outbox import Priority
+from utils.simhash import DuplicateDetector
+from utils.spam import SpamTracker
+from utils.wordfilter import REGEX_PREFIX, Match, WordFilter, check_regex
+
+if typing.TYPE_CHECKING:
+    from bot import CodinGameBot
+    from .moderation import Moderation
+
+
+INTENTS = discord.Intents(guilds=True, guild_messages=True)
+
+
+def setup(bot: "CodinGameBot"):
+    bot.add_cog(Automod(bot=bot))
+
+
+class Automod(commands.Cog):
+    """Automatic spam protection."""
+
+    def __init__(self, bot):
+        self.bot: "CodinGameBot" = bot
+        self.logger = self.bot.logger.getChild("automod")
+
+        self.spam = SpamTracker(
+            rate=Config.AUTOMOD_RATE,
+            duplicates=Config.AUTOMOD_DUPLICATES,
+            mentions=Config.AUTOMOD_MENTIONS,
+            idle=Config.AUTOMOD_IDLE,
+        )
+        self.duplicates = DuplicateDetector(
+            channels=Config.DUPLICATE_CHANNELS,
+            window=Config.DUPLICATE_WINDOW,
+            distance=Config.DUPLICATE_DISTANCE,
+            min_length=Config.DUPLICATE_MIN_LENGTH,
+        )
+
+        self.bot.db.execute(
+            "CREATE TABLE IF NOT EXISTS blocklist ("
+            "entry TEXT PRIMARY KEY, "
+            "moderator_id INTEGER NOT NULL, "
+            "created_at REAL NOT NULL)"
+        )
+        self.filter = WordFilter(self.blocklist_entries())
+
+    # --------------------------------------------------------------------------
+    # Helper methods
+
+    @property
+    def moderation(self) -> typing.Optional["Moderation"]:
+        return self.bot.get_cog("Moderation")
+
+    @staticmethod
+    def is_exempt(message: discord.Message) -> bool:
+        return (
+            message.author.bot
+            or message.guild is None
+            or message.guild.id != Config.GUILD
+            or not isinstance(message.author, discord.Member)
+            or message.author.guild_permissions.manage_messages
+        )
+
+    def blocklist_entries(self) -> typing.List[str]:
+        """The entries of the config and the database, without the regexes
+        that can't be combined with the others"""
+        entries = []
+        for entry in Config.BLOCKLIST + [
+            row["entry"]
+            for row in self.bot.db.execute(
+                "SELECT entry FROM blocklist ORDER BY created_at"
+            )
+        ]:
+            if entry.startswith(REGEX_PREFIX):
+                try:
+                    check_regex(entry[len(REGEX_PREFIX) :])
+                except (re.error, ValueError) as error:
+                    self.logger.warning(
+                        f"ignored blocklist entry `{entry}`: {error}"
+                    )
+                    continue
+            entries.append(entry)
+        return entries
+
+    async def rebuild_filter(self):
+        """Compile the blocklist in a thread and swap the new filter in"""
+        self.filter = await self.bot.loop.run_in_executor(
+            None, WordFilter, self.blocklist_entries()
+        )
+        self.logger.info(f"blocklist rebuilt with {len(self.filter)} entries")
+
+    async def filter_message(self, message: discord.Message) -> bool:
+        """Delete `message` if it contains a blocklist entry"""
+        match: typing.Optional[Match] = self.filter.search(message.content)
+        if match is None:
+            return False
+
+        self.logger.info(
+            color(
+                f"message of user `{message.author}` in channel "
+                f"`{message.channel}` matched blocklist entry "
+                f"`{match.pattern}`",
+                "yellow",
+            )
+        )
+
+        try:
+            await message.delete()
+        except discord.NotFound:
+            pass
+
+        if self.moderation is None:
+            return True
+
+        reason = f"Blocked content in {message.channel.mention}"
+        log_embed = self.moderation.log_embed(
+            "warn", message.author, self.bot.user, reason
+        )
+        log_embed.add_field(
+            name="Blocklist entry", value=f"`{match.pattern}`", inline=False
+        )
+        await self.bot.outbox.send(
+            self.moderation.log_channel, Priority.MODERATION, embed=log_embed
+        )
+
+        await self.moderation.record_infraction(
+            "warn", message.guild, message.author, self.bot.user, reason
+        )
+        return True
+
+    async def flag_duplicates(
+        self, message: discord.Message, channel_ids: typing.Set[int]
+    ):
+        """Report near-duplicates of `message` posted in `channel_ids`"""
+        self.logger.info(
+            color(
+                f"user `{message.author}` posted near-duplicate messages "
+                f"in {len(channel_ids)} channels",
+                "yellow",
+            )
+        )
+
+        if self.moderation is None:
+            return
+
+        embed = self.bot.embed(
+            title="**Cross-channel spam**",
+            description=(
+                f"{message.author.mention} posted near-duplicate messages in "
+                f"{len(channel_ids)} channels within "
+                f"{Config.DUPLICATE_WINDOW:.0f} seconds\n"
+                f"[Jump to message]({message.jump_url})"
+            ),
+            color=discord.Colour.orange(),
+            footer=f"ID: {message.author.id}",
+        )
+        embed.set_author(
+            name=message.author, icon_url=message.author.avatar_url
+        )
+        embed.add_field(
+            name="Channels",
+            value=", ".join(f"<#{channel_id}>" for channel_id in channel_ids),
+            inline=False,
+        )
+        embed.add_field(
+            name="Content",
+            value=f"{message.content:.1021}"
+            f"{'...' if len(message.content) > 1021 else ''}",
+            inline=False,
+        )
+        await self.bot.outbox.send(
+            self.moderation.log_channel, Priority.MODERATION, embed=embed
+        )
+
+    @property
+    def reasons(self) -> typing.Dict[str, str]:
+        return {
+            "rate": "Sending messages too quickly",
+            "duplicate": "Sending the same message repeatedly",
+            "mentions": "Mentioning too many users",
+        }
+
+    def cache_stats(self) -> typing.Dict[str, typing.Any]:
+        """Caches reported by `profile mem`"""
+        return {
+            "spam trackers": self.spam,
+            "recent messages hashes": self.duplicates,
+            "blocklist filter": self.filter,
+        }
+
+    # --------------------------------------------------------------------------
+    # Events
+
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message):
+        if self.is_exempt(message):
+            return
+
+        try:
+            if await self.filter_message(message):
+                return
+        except Exception as error:
+            return await self.bot.handle_error(error)
+
+        channel_ids = self.duplicates.check(
+            message.author.id, message.channel.id, message.content
+        )
+        if channel_ids is not None:
+            try:
+                await self.flag_duplicates(message, channel_ids)
+            except Exception as error:
+                await self.bot.handle_error(error)
+
+        rule = self.spam.check(
+            message.author.id,
+            message.content,
+            len(message.raw_mentions) + len(message.raw_role_mentions),
+        )
+        if rule is None:
+            return
+
+        # Start from a clean slate so one burst only triggers one action
+        self.spam.reset(message.author.id)
+        self.logger.info(
+            color(
+                f"user `{message.author}` triggered spam rule `{rule}` "
+                f"in channel `{message.channel}`",
+                "yellow",
+            )
+        )
+
+        if self.moderation is None:
+            return
+
+        try:
+            await self.moderation.mute_member(
+                message.author,
+                self.bot.user,
+                self.reasons[rule],
+                datetime.timedelta(seconds=Config.AUTOMOD_MUTE_DURATION),
+            )
+        except Exception as error:
+            await self.bot.handle_error(error)
+
+    @commands.Cog.listener()
+    async def on_message_edit(
+        self, before: discord.Message, after: discord.Message
+    ):
+        if self.is_exempt(after) or before.content == after.content:
+            return
+
+        try:
+            await self.filter_message(after)
+        except Exception as error:
+            await self.bot.handle_error(error)
+
+    # --------------------------------------------------------------------------
+    # Commands
+
+    @commands.group(name="blocklist", aliases=["bl"])
+    @commands.guild_only()
+    @commands.has_guild_permissions(manage_messages=True)
+    async def blocklist(self, ctx: commands.Context):
+        """Manage the words, links and regexes deleted by the automod."""
+        if ctx.invoked_subcommand is None:
+            return await ctx.send_help(self.bot.get_command("blocklist"))
+
+    @blocklist.command(name="add")
+    async def blocklist_add(self, ctx: commands.Context, *, entry: str):
+        """Add an entry: `word`, `word*`, `*word*` or `re:regex`."""
+        # Checked with the others, the regexes are combined into one
+        try:
+            WordFilter(self.blocklist_entries() + [entry])
+        except Exception as error:
+            return await ctx.send(f"Invalid entry: {error}")
+
+        self.bot.db.execute(
+            "INSERT OR IGNORE INTO blocklist (entry, moderator_id, created_at) "
+            "VALUES (?, ?, ?)",
+            (entry, ctx.author.id, time.time()),
+        )
+        await self.rebuild_filter()
+        await ctx.message.delete()
+        await ctx.send(f"Added an entry to the blocklist ({len(self.filter)})")
+
+    @blocklist.command(name="remove", aliases=["rm"])
+    async def blocklist_remove(self, ctx: commands.Context, *, entry: str):
+        """Remove an entry."""
+        cursor = self.bot.db.execute(
+            "DELETE FROM blocklist WHERE entry = ?", (entry,)
+        )
+        if not cursor.rowcount:
+            return await ctx.send("Entry not found")
+
+        await self.rebuild_filter()
+        await ctx.send(
+            f"Removed an entry from the blocklist ({len(self.filter)})"
+        )
+
+    @blocklist.command(name="list")
+    async def blocklist_list(self, ctx: commands.Context):
+        """DM the list of entries."""
+        paginator = commands.Paginator()
+        for entry in self.filter.entries:
+            paginator.add_line(entry)
+
+        if not paginator.pages:
+            return await ctx.send("The blocklist is empty")
+
+        for page in paginator.pages:
+            await self.bot.outbox.send(ctx.author, Priority.INTERACTIVE, page)
+        await ctx.send(f"Sent {len(self.filter)} entries in DM")
@@ -1,13 +1,31 @@
 import discord
 from discord.ext import commands
 
-import codingame
+import contextlib
+import functools
+import json
 import typing
 
 from utils import color
+from utils.imports import lazy_import
+from utils.tracing import span
 
 if typing.TYPE_CHECKING:
+    import codingame
     from bot import CodinGameBot
+else:
+    # Only imported when the first command is used
+    codingame = lazy_import("codingame")
+
+
+# Seconds the responses of each API function are cached, the others aren't
+CACHE_TTLS = {
+    "Search.search": 60 * 60,
+    "CodinGamer.findCodingamePointsStatsByHandle": 5 * 60,
+    "CodinGamer.findCodinGamerPublicInformations": 5 * 60,
+    # Players join until the clash starts
+    "ClashOfCode.findClashByHandle": 15,
+}
 
 
 def setup(bot: "CodinGameBot"):
@@ -20,13 +38,46 @@ class CodinGame(commands.Cog):
     def __init__(self, bot):
         self.bot: "CodinGameBot" = bot
         self.logger = self.bot.logger.getChild("commands")
+        # Client whose requests go through the cache
+        self._cached_client: typing.Optional["codingame.Client"] = None
 
     # --------------------------------------------------------------------------
     # Helper methods
 
     @property
-    def client(self) -> codingame.Client:
-        return self.bot.cg_client
+    def client(self) -> "codingame.Client":
+        client = self.bot.cg_client
+        if client is not self._cached_client:
+            # The objects are built from the JSON of the API, so it's the
+            # JSON that is cached
+            http = client._state.http
+            http.request = functools.partial(self.cached_request, http.request)
+            self._cached_client = client
+        return client
+
+    async def cached_request(
+        self,
+        request: typing.Callable[..., typing.Awaitable[typing.Any]],
+        service: str,
+        func: str,
+        parameters: typing.Optional[list] = None,
+    ):
+        ttl = CACHE_TTLS.get(f"{service}.{func}")
+        if ttl is None:
+            return await request(service, func, parameters)
+
+        key = f"codingame:{service}.{func}:{json.dumps(parameters)}"
+        return await self.bot.cache.get_or_set(
+            key, lambda: request(service, func, parameters), ttl
+        )
+
+    @contextlib.contextmanager
+    def timed(self, method: str):
+        """Time a request to the CodinGame API"""
+        with span(f"codingame: {method}"), self.bot.metrics.time(
+            "codingame_request_duration_seconds", method=method
+        ):
+            yield
 
     @staticmethod
     def clean(text: str):
@@ -35,7 +86,7 @@ class CodinGame(commands.Cog):
         )
 
     def embed_codingamer(
-        self, ctx: commands.Context, codingamer: codingame.CodinGamer
+        self, ctx: commands.Context, codingamer: "codingame.CodinGamer"
     ) -> discord.Embed:
         embed = self.bot.embed(
             ctx=ctx,
@@ -66,7 +117,9 @@ class CodinGame(commands.Cog):
         return embed
 
     def embed_clash_of_code(
-        self, ctx: commands.Context, clash_of_code: codingame.ClashOfCode
+        self,
+        ctx: commands.Context,
+        clash_of_code: "codingame.ClashOfCode",
     ) -> discord.Embed:
         embed = self.bot.embed(
             ctx=ctx,
@@ -134,13 +187,15 @@ class CodinGame(commands.Cog):
     ):
         """Get a Codingamer from its username or public handle."""
         try:
-            codingamer: codingame.CodinGamer = await self.client.get_codingamer(
-                codingamer
-            )
+            with self.timed("get_codingamer"):
+                codingamer: codingame.CodinGamer = (
+                    await self.client.get_codingamer(codingamer)
+                )
         except (ValueError, codingame.CodinGamerNotFound) as error:
             return await ctx.send(self.clean(str(error)))
 
-        embed = self.embed_codingamer(ctx, codingamer)
+        with span("embed"):
+            embed = self.embed_codingamer(ctx, codingamer)
         await ctx.send(embed=embed)
 
     @codingame.command(name="clash_of_code", aliases=["clash", "coc"])
@@ -151,13 +206,15 @@ class CodinGame(commands.Cog):
     ):
         """Get a Clash of Code from its public handle."""
         try:
-            clash_of_code: codingame.ClashOfCode = (
-                await self.client.get_clash_of_code(public_handle)
-            )
+            with self.timed("get_clash_of_code"):
+                clash_of_code: codingame.ClashOfCode = (
+                    await self.client.get_clash_of_code(public_handle)
+                )
         except (ValueError, codingame.ClashOfCodeNotFound) as error:
             return await ctx.send(self.clean(str(error)))
 
-        embed = self.embed_clash_of_code(ctx, clash_of_code)
+        with span("embed"):
+            embed = self.embed_clash_of_code(ctx, clash_of_code)
         await ctx.send(embed=embed)
 
     @codingame.command(
@@ -165,14 +222,16 @@ class CodinGame(commands.Cog):
     )
     async def pending_clash_of_code(self, ctx: commands.Context):
         """Get a pending public Clash of Code."""
-        clash_of_code: codingame.ClashOfCode = (
-            await self.client.get_pending_clash_of_code()
-        )
+        with self.timed("get_pending_clash_of_code"):
+            clash_of_code: codingame.ClashOfCode = (
+                await self.client.get_pending_clash_of_code()
+            )
 
         if clash_of_code is None:
             return await ctx.send(
                 "No pending clashes currently, try again later."
             )
 
-        embed = self.embed_clash_of_code(ctx, clash_of_code)
+        with span("embed"):
+            embed = self.embed_clash_of_code(ctx, clash_of_code)
         await ctx.send(embed=embed)
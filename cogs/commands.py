@@ -5,6 +5,7 @@ import asyncio
 import typing
 
 from utils import color
+from utils.ipc import IPCError
 
 if typing.TYPE_CHECKING:
     from bot import CodinGameBot
@@ -20,10 +21,21 @@ class Commands(commands.Cog):
     def __init__(self, bot):
         self.bot: "CodinGameBot" = bot
         self.logger = self.bot.logger.getChild("commands")
+        if self.bot.ipc is not None:
+            self.bot.ipc.handlers["logout"] = self.ipc_logout
+
+    def cog_unload(self):
+        if self.bot.ipc is not None:
+            self.bot.ipc.handlers.pop("logout", None)
 
     # --------------------------------------------------------------------------
     # Helper methods
 
+    async def ipc_logout(self) -> bool:
+        self.logger.warning(color("logging out, requested by IPC", "red"))
+        asyncio.ensure_future(self.bot.logout())
+        return True
+
     @property
     def invite_link(self):
         return (
@@ -41,12 +53,20 @@ class Commands(commands.Cog):
         ctx: commands.Context,
         seconds_before_logout: int = 0,
     ):
-        """Logout the bot"""
+        """Logout the bot, all its clusters when started by the launcher"""
 
         await asyncio.sleep(seconds_before_logout)
         self.logger.warning(color("logging out", "red"))
         await ctx.send("**Logging out...**")
         try:
+            if self.bot.ipc is not None:
+                try:
+                    await self.bot.ipc.publish("logout")
+                    return
+                except (IPCError, ConnectionError) as error:
+                    self.logger.warning(
+                        f"couldn't log out the other clusters: {error}"
+                    )
             await self.bot.logout()
         except Exception as error:
             embed = self.bot.embed(
@@ -59,7 +79,19 @@ class Commands(commands.Cog):
     async def ping(self, ctx: commands.Context):
         """Check the bot latency"""
 
-        await ctx.send(f"Pong! `{int(self.bot.latency*1000)}ms`")
+        latencies = self.bot.shard_latencies()
+        if len(latencies) == 1:
+            return await ctx.send(f"Pong! `{int(self.bot.latency*1000)}ms`")
+
+        current = ctx.guild.shard_id if ctx.guild is not None else 0
+        await ctx.send(
+            f"Pong! `{int(self.bot.latency*1000)}ms` on average\n"
+            + "\n".join(
+                f"Shard {shard_id}: `{int(latency*1000)}ms`"
+                + (" (this server)" if shard_id == current else "")
+                for shard_id, latency in latencies
+            )
+        )
 
     @commands.command()
     async def invite(self, ctx: commands.Context):
@@ -2,16 +2,31 @@ import discord
 from discord.ext import commands
 
 import datetime
+import time
 import typing
 from functools import wraps
 
 from config import Config
 from utils import indent, color
+from utils.outbox import Priority
 
 if typing.TYPE_CHECKING:
     from bot import CodinGameBot
 
 
+# Gateway events and member cache needed by the listeners
+INTENTS = discord.Intents(
+    guilds=True,
+    guild_messages=True,
+    members=True,
+    bans=True,
+    voice_states=True,
+)
+# `on_member_update` only has the member before the update if it's cached
+MEMBER_CACHE = discord.MemberCacheFlags.from_intents(INTENTS)
+CHUNK_GUILDS = True
+
+
 def setup(bot: "CodinGameBot"):
     bot.add_cog(Log(bot=bot))
 
@@ -31,10 +46,20 @@ def log(func: typing.Callable):
         if guild is None or guild.id != Config.GUILD:
             return
 
+        start = time.perf_counter()
+        status = "success"
         try:
             await func(self, *args)
         except Exception as error:
+            status = "error"
             await self.bot.handle_error(error)
+        finally:
+            self.bot.metrics.observe(
+                "bot_listener_duration_seconds",
+                time.perf_counter() - start,
+                listener=func.__name__,
+                status=status,
+            )
 
     return wrapper
 
@@ -146,7 +171,9 @@ class Log(commands.Cog):
             inline=False,
         )
 
-        await self.log_channel.send(embed=log_embed)
+        await self.bot.outbox.send(
+            self.log_channel, Priority.SERVER_LOG, embed=log_embed
+        )
 
     @commands.Cog.listener()
     @log
@@ -173,7 +200,9 @@ class Log(commands.Cog):
             user=message.author,
         )
 
-        await self.log_channel.send(embed=log_embed)
+        await self.bot.outbox.send(
+            self.log_channel, Priority.SERVER_LOG, embed=log_embed
+        )
 
     @commands.Cog.listener()
     @log
@@ -197,7 +226,9 @@ class Log(commands.Cog):
             guild=messages[0].guild,
         )
 
-        await self.log_channel.send(embed=log_embed)
+        await self.bot.outbox.send(
+            self.log_channel, Priority.SERVER_LOG, embed=log_embed
+        )
 
     # ---------------------------------------------------------------------------------------------
     # Guild channel events
@@ -214,7 +245,9 @@ class Log(commands.Cog):
             guild=channel.guild,
         )
 
-        await self.log_channel.send(embed=log_embed)
+        await self.bot.outbox.send(
+            self.log_channel, Priority.SERVER_LOG, embed=log_embed
+        )
 
     @commands.Cog.listener()
     @log
@@ -228,7 +261,9 @@ class Log(commands.Cog):
             guild=channel.guild,
         )
 
-        await self.log_channel.send(embed=log_embed)
+        await self.bot.outbox.send(
+            self.log_channel, Priority.SERVER_LOG, embed=log_embed
+        )
 
     # ---------------------------------------------------------------------------------------------
     # Guild role events
@@ -260,7 +295,9 @@ class Log(commands.Cog):
             ),
         )
 
-        await self.log_channel.send(embed=log_embed)
+        await self.bot.outbox.send(
+            self.log_channel, Priority.SERVER_LOG, embed=log_embed
+        )
 
     @commands.Cog.listener()
     @log
@@ -283,7 +320,9 @@ class Log(commands.Cog):
             guild=role.guild,
         )
 
-        await self.log_channel.send(embed=log_embed)
+        await self.bot.outbox.send(
+            self.log_channel, Priority.SERVER_LOG, embed=log_embed
+        )
 
     @commands.Cog.listener()
     @log
@@ -332,7 +371,9 @@ class Log(commands.Cog):
             ),
         )
 
-        await self.log_channel.send(embed=log_embed)
+        await self.bot.outbox.send(
+            self.log_channel, Priority.SERVER_LOG, embed=log_embed
+        )
 
     # ---------------------------------------------------------------------------------------------
     # Guild available events
@@ -407,7 +448,9 @@ class Log(commands.Cog):
             inline=False,
         )
 
-        await self.log_channel.send(embed=log_embed)
+        await self.bot.outbox.send(
+            self.log_channel, Priority.SERVER_LOG, embed=log_embed
+        )
 
     @commands.Cog.listener()
     @log
@@ -453,7 +496,9 @@ class Log(commands.Cog):
             inline=False,
         )
 
-        await self.log_channel.send(embed=log_embed)
+        await self.bot.outbox.send(
+            self.log_channel, Priority.SERVER_LOG, embed=log_embed
+        )
 
     @commands.Cog.listener()
     @log
@@ -467,7 +512,9 @@ class Log(commands.Cog):
         )
         log_embed.set_thumbnail(url=user.avatar_url)
 
-        await self.log_channel.send(embed=log_embed)
+        await self.bot.outbox.send(
+            self.log_channel, Priority.SERVER_LOG, embed=log_embed
+        )
 
     @commands.Cog.listener()
     @log
@@ -481,7 +528,9 @@ class Log(commands.Cog):
         )
         log_embed.set_thumbnail(url=user.avatar_url)
 
-        await self.log_channel.send(embed=log_embed)
+        await self.bot.outbox.send(
+            self.log_channel, Priority.SERVER_LOG, embed=log_embed
+        )
 
     @commands.Cog.listener()
     @log
@@ -544,7 +593,9 @@ class Log(commands.Cog):
         else:
             return
 
-        await self.log_channel.send(embed=log_embed)
+        await self.bot.outbox.send(
+            self.log_channel, Priority.SERVER_LOG, embed=log_embed
+        )
 
     @commands.Cog.listener()
     @log
@@ -621,4 +672,6 @@ class Log(commands.Cog):
         else:
             return
 
-        await self.log_channel.send(embed=log_embed)
+        await self.bot.outbox.send(
+            self.log_channel, Priority.SERVER_LOG, embed=log_embed
+        )
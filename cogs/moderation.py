@@ -6,26 +6,47 @@ import typing
 from functools import wraps
 
 from config import Config
+from utils.infractions import ACTIONS
+from utils.outbox import Priority
+from utils.time import parse_duration, format_duration
 
 if typing.TYPE_CHECKING:
     from bot import CodinGameBot
 
 
+# The members are looked up in the cache when a mute expires
+INTENTS = discord.Intents(guilds=True, members=True)
+MEMBER_CACHE = discord.MemberCacheFlags.from_intents(INTENTS)
+CHUNK_GUILDS = True
+
+
 def setup(bot: "CodinGameBot"):
     bot.add_cog(Moderation(bot=bot))
 
 
 def moderation(func: typing.Callable):
     @wraps(func)
-    async def wrapper(self: "Moderation", ctx: commands.Context, *args):
+    async def wrapper(
+        self: "Moderation", ctx: commands.Context, *args, **kwargs
+    ):
         if ctx.guild is None or ctx.guild.id != Config.GUILD:
             return
 
-        await func(self, ctx, *args)
+        await func(self, ctx, *args, **kwargs)
 
     return wrapper
 
 
+class Duration(commands.Converter):
+    async def convert(
+        self, ctx: commands.Context, argument: str
+    ) -> datetime.timedelta:
+        try:
+            return parse_duration(argument)
+        except ValueError as error:
+            raise commands.BadArgument(str(error)) from error
+
+
 class Moderation(commands.Cog):
     def __init__(self, bot):
         self.bot: "CodinGameBot" = bot
@@ -65,7 +86,7 @@ class Moderation(commands.Cog):
         embed.add_field(name="Moderator", value=moderator.mention)
         embed.add_field(name="Reason", value=reason)
         if duration:
-            embed.add_field(name="Duration", value=duration)
+            embed.add_field(name="Duration", value=format_duration(duration))
 
         embed.set_author(name=user, icon_url=user.avatar_url)
 
@@ -91,6 +112,176 @@ class Moderation(commands.Cog):
 
         return embed
 
+    def muted_role(self, guild: discord.Guild) -> typing.Optional[discord.Role]:
+        return discord.utils.get(guild.roles, name=Config.MUTED_ROLE)
+
+    async def record_infraction(
+        self,
+        action: str,
+        guild: discord.Guild,
+        user: discord.User,
+        moderator: discord.User,
+        reason: str = None,
+        duration: datetime.timedelta = None,
+        *,
+        escalate: bool = True,
+    ):
+        """Record an infraction and apply the escalation it triggers"""
+
+        _, escalation = self.bot.infractions.add(
+            guild.id, user.id, moderator.id, action, reason, duration
+        )
+        if escalation is None or not escalate:
+            return
+
+        count = self.bot.infractions.count(guild.id, user.id, action)
+        reason = f"Automatic {escalation.action} after {count} {action}s"
+        self.logger.info(
+            f"escalating infractions of user `{user}` in guild `{guild}`: "
+            f"{escalation.action}"
+        )
+
+        member: discord.Member = guild.get_member(user.id)
+        if escalation.action == "mute":
+            if member is not None:
+                await self.mute_member(
+                    member,
+                    self.bot.user,
+                    reason,
+                    escalation.duration,
+                    escalate=False,
+                )
+
+        elif escalation.action == "kick":
+            if member is not None:
+                await guild.kick(member, reason=reason)
+                await self.record_infraction(
+                    "kick", guild, user, self.bot.user, reason, escalate=False
+                )
+
+                # Modlog embed
+                log_embed = self.log_embed("kick", user, self.bot.user, reason)
+                await self.bot.outbox.send(
+                    self.log_channel, Priority.MODERATION, embed=log_embed
+                )
+
+        elif escalation.action == "ban":
+            await guild.ban(user, reason=reason, delete_message_days=0)
+            if escalation.duration:
+                self.bot.timers.create(
+                    "tempban",
+                    datetime.datetime.now(datetime.timezone.utc)
+                    + escalation.duration,
+                    guild_id=guild.id,
+                    user_id=user.id,
+                    moderator_id=self.bot.user.id,
+                )
+            await self.record_infraction(
+                "ban",
+                guild,
+                user,
+                self.bot.user,
+                reason,
+                escalation.duration,
+                escalate=False,
+            )
+
+            # Modlog embed
+            log_embed = self.log_embed(
+                "ban", user, self.bot.user, reason, escalation.duration
+            )
+            await self.bot.outbox.send(
+                self.log_channel, Priority.MODERATION, embed=log_embed
+            )
+
+    async def mute_member(
+        self,
+        member: discord.Member,
+        moderator: discord.User,
+        reason: str = None,
+        duration: datetime.timedelta = None,
+        *,
+        escalate: bool = True,
+    ):
+        """Mute a member, and schedule the unmute if there is a `duration`"""
+
+        role = self.muted_role(member.guild)
+        if role is None:
+            raise commands.BadArgument(
+                f"There is no `{Config.MUTED_ROLE}` role in this server"
+            )
+
+        await member.add_roles(role, reason=reason)
+
+        # Replace any pending unmute
+        for timer in self.bot.timers.find(
+            "mute", guild_id=member.guild.id, user_id=member.id
+        ):
+            self.bot.timers.cancel(timer)
+
+        if duration:
+            self.bot.timers.create(
+                "mute",
+                datetime.datetime.now(datetime.timezone.utc) + duration,
+                guild_id=member.guild.id,
+                user_id=member.id,
+                moderator_id=moderator.id,
+            )
+
+        self.logger.info(
+            f"user `{member}` muted in guild `{member.guild}` "
+            f"for `{format_duration(duration) if duration else 'ever'}` "
+            f"for reason `{reason}`"
+        )
+
+        # Modlog embed
+        log_embed = self.log_embed("mute", member, moderator, reason, duration)
+        await self.bot.outbox.send(
+            self.log_channel, Priority.MODERATION, embed=log_embed
+        )
+
+        await self.record_infraction(
+            "mute",
+            member.guild,
+            member,
+            moderator,
+            reason,
+            duration,
+            escalate=escalate,
+        )
+
+    async def unmute_member(
+        self,
+        member: discord.Member,
+        moderator: discord.User,
+        reason: str = None,
+    ):
+        """Unmute a member and cancel its pending unmute"""
+
+        for timer in self.bot.timers.find(
+            "mute", guild_id=member.guild.id, user_id=member.id
+        ):
+            self.bot.timers.cancel(timer)
+
+        role = self.muted_role(member.guild)
+        if role is not None and role in member.roles:
+            await member.remove_roles(role, reason=reason)
+
+        self.logger.info(
+            f"user `{member}` unmuted in guild `{member.guild}` "
+            f"for reason `{reason}`"
+        )
+
+        # Modlog embed
+        log_embed = self.log_embed("unmute", member, moderator, reason)
+        await self.bot.outbox.send(
+            self.log_channel, Priority.MODERATION, embed=log_embed
+        )
+
+        await self.record_infraction(
+            "unmute", member.guild, member, moderator, reason
+        )
+
     async def cog_check(self, ctx) -> bool:
         return ctx.guild is not None
 
@@ -99,7 +290,7 @@ class Moderation(commands.Cog):
 
     @commands.command("purge")
     @commands.has_guild_permissions(manage_messages=True)
-    @moderation()
+    @moderation
     async def purge(self, ctx: commands.Context, number_of_messages: int):
         """Delete a number of messages (limit: 1000)"""
 
@@ -111,7 +302,7 @@ class Moderation(commands.Cog):
 
     @commands.command("kick")
     @commands.has_guild_permissions(kick_members=True)
-    @moderation()
+    @moderation
     async def kick(
         self, ctx: commands.Context, user: discord.Member, *, reason: str = None
     ):
@@ -135,8 +326,10 @@ class Moderation(commands.Cog):
 
         # DM the user
         try:
-            await user.send(
-                f"You were kicked from {ctx.guild.name} for reason: {reason}"
+            await self.bot.outbox.send(
+                user,
+                Priority.MODERATION,
+                f"You were kicked from {ctx.guild.name} for reason: {reason}",
             )
         except discord.Forbidden:
             self.logger.info(
@@ -154,11 +347,17 @@ class Moderation(commands.Cog):
 
         # Modlog embed
         log_embed = self.log_embed("kick", user, ctx.author, reason)
-        await self.log_channel.send(embed=log_embed)
+        await self.bot.outbox.send(
+            self.log_channel, Priority.MODERATION, embed=log_embed
+        )
+
+        await self.record_infraction(
+            "kick", ctx.guild, user, ctx.author, reason
+        )
 
     @commands.command("ban")
     @commands.has_guild_permissions(ban_members=True)
-    @moderation()
+    @moderation
     async def ban(
         self,
         ctx: commands.Context,
@@ -202,8 +401,10 @@ class Moderation(commands.Cog):
 
         # DM the user
         try:
-            await user.send(
-                f"You were banned from {ctx.guild.name} for reason: {reason}"
+            await self.bot.outbox.send(
+                user,
+                Priority.MODERATION,
+                f"You were banned from {ctx.guild.name} for reason: {reason}",
             )
         except discord.Forbidden:
             self.logger.info(
@@ -221,11 +422,17 @@ class Moderation(commands.Cog):
 
         # Modlog embed
         log_embed = self.log_embed("ban", user, ctx.author, reason)
-        await self.log_channel.send(embed=log_embed)
+        await self.bot.outbox.send(
+            self.log_channel, Priority.MODERATION, embed=log_embed
+        )
+
+        await self.record_infraction(
+            "ban", ctx.guild, user, ctx.author, reason
+        )
 
     @commands.command("unban")
     @commands.has_guild_permissions(ban_members=True)
-    @moderation()
+    @moderation
     async def unban(
         self,
         ctx: commands.Context,
@@ -241,8 +448,10 @@ class Moderation(commands.Cog):
 
         # DM the user
         try:
-            await user.send(
-                f"You were unbanned from {ctx.guild.name} for reason: {reason}"
+            await self.bot.outbox.send(
+                user,
+                Priority.MODERATION,
+                f"You were unbanned from {ctx.guild.name} for reason: {reason}",
             )
         except discord.Forbidden:
             self.logger.info(
@@ -260,7 +469,300 @@ class Moderation(commands.Cog):
 
         # Modlog embed
         log_embed = self.log_embed("unban", user, ctx.author, reason)
-        await self.log_channel.send(embed=log_embed)
+        await self.bot.outbox.send(
+            self.log_channel, Priority.MODERATION, embed=log_embed
+        )
+
+        await self.record_infraction(
+            "unban", ctx.guild, user, ctx.author, reason
+        )
+
+    @commands.command("tempban")
+    @commands.has_guild_permissions(ban_members=True)
+    @moderation
+    async def tempban(
+        self,
+        ctx: commands.Context,
+        user: discord.User,
+        duration: Duration,
+        *,
+        reason: str = None,
+    ):
+        """Ban a member for a duration (like `1d12h`) with an optional reason"""
+
+        # Checks
+        if user == self.bot.user:
+            return await ctx.send("I can't ban myself")
+
+        if user == ctx.author:
+            return await ctx.send("You can't ban yourself")
+
+        member: discord.Member = ctx.guild.get_member(user.id)
+        if member and member.top_role.position >= ctx.author.top_role.position:
+            return await ctx.send(
+                "You can't ban a user who has a higher role than you"
+            )
+
+        # Ban
+        await ctx.guild.ban(user, reason=reason, delete_message_days=1)
+        await ctx.message.delete()
+
+        # Replace any pending unban
+        for timer in self.bot.timers.find(
+            "tempban", guild_id=ctx.guild.id, user_id=user.id
+        ):
+            self.bot.timers.cancel(timer)
+
+        self.bot.timers.create(
+            "tempban",
+            datetime.datetime.now(datetime.timezone.utc) + duration,
+            guild_id=ctx.guild.id,
+            user_id=user.id,
+            moderator_id=ctx.author.id,
+        )
+
+        # DM the user
+        try:
+            await self.bot.outbox.send(
+                user,
+                Priority.MODERATION,
+                f"You were banned from {ctx.guild.name} for "
+                f"{format_duration(duration)} for reason: {reason}",
+            )
+        except discord.Forbidden:
+            self.logger.info(
+                f"user `{user}` banned from guild `{ctx.guild}` for "
+                f"`{format_duration(duration)}` for reason `{reason}` "
+                "(couldn't DM them)"
+            )
+        else:
+            self.logger.info(
+                f"user `{user}` banned from guild `{ctx.guild}` for "
+                f"`{format_duration(duration)}` for reason `{reason}`"
+            )
+
+        # Success embed
+        success_embed = self.success_embed("ban", user)
+        await ctx.send(embed=success_embed)
+
+        # Modlog embed
+        log_embed = self.log_embed("ban", user, ctx.author, reason, duration)
+        await self.bot.outbox.send(
+            self.log_channel, Priority.MODERATION, embed=log_embed
+        )
+
+        await self.record_infraction(
+            "ban", ctx.guild, user, ctx.author, reason, duration
+        )
+
+    @commands.command("warn")
+    @commands.has_guild_permissions(kick_members=True)
+    @moderation
+    async def warn(
+        self, ctx: commands.Context, user: discord.Member, *, reason: str = None
+    ):
+        """Warn a member with an optional reason"""
+
+        # Checks
+        if user == self.bot.user:
+            return await ctx.send("I can't warn myself")
+
+        if user == ctx.author:
+            return await ctx.send("You can't warn yourself")
+
+        if user.top_role.position >= ctx.author.top_role.position:
+            return await ctx.send(
+                "You can't warn a user who has a higher role than you"
+            )
+
+        await ctx.message.delete()
+
+        # DM the user
+        try:
+            await self.bot.outbox.send(
+                user,
+                Priority.MODERATION,
+                f"You were warned in {ctx.guild.name} for reason: {reason}",
+            )
+        except discord.Forbidden:
+            self.logger.info(
+                f"user `{user}` warned in guild `{ctx.guild}` "
+                f"for reason `{reason}` (couldn't DM them)"
+            )
+        else:
+            self.logger.info(
+                f"user `{user}` warned in guild `{ctx.guild}` for reason `{reason}`"
+            )
+
+        # Success embed
+        success_embed = self.success_embed("warn", user)
+        await ctx.send(embed=success_embed)
+
+        # Modlog embed
+        log_embed = self.log_embed("warn", user, ctx.author, reason)
+        await self.bot.outbox.send(
+            self.log_channel, Priority.MODERATION, embed=log_embed
+        )
+
+        await self.record_infraction(
+            "warn", ctx.guild, user, ctx.author, reason
+        )
+
+    @commands.command("infractions", aliases=["history"])
+    @commands.has_guild_permissions(kick_members=True)
+    @moderation
+    async def infractions(self, ctx: commands.Context, user: discord.User):
+        """Show the infraction history of a user"""
+
+        counts = self.bot.infractions.counts(ctx.guild.id, user.id)
+        history = self.bot.infractions.history(ctx.guild.id, user.id, limit=10)
+
+        embed = self.bot.embed(
+            title=f"**Infractions of {user}**",
+            description=", ".join(
+                f"{counts[action]} {action}{'s' * (counts[action] > 1)}"
+                for action in ACTIONS
+                if counts.get(action)
+            )
+            or "No infractions",
+            ctx=ctx,
+        )
+        embed.set_author(name=user, icon_url=user.avatar_url)
+
+        for infraction in history:
+            moderator = self.bot.get_user(infraction.moderator_id)
+            embed.add_field(
+                name=f"#{infraction.id} {infraction.action.title()} • "
+                + infraction.created.strftime("%d/%m/%Y %H:%M"),
+                value=(
+                    f"Moderator: {moderator or infraction.moderator_id}\n"
+                    f"Reason: {infraction.reason}"
+                    + (
+                        "\nDuration: "
+                        + format_duration(
+                            datetime.timedelta(seconds=infraction.duration)
+                        )
+                        if infraction.duration
+                        else ""
+                    )
+                ),
+                inline=False,
+            )
+
+        await ctx.send(embed=embed)
+
+    @commands.command("mute")
+    @commands.has_guild_permissions(manage_roles=True)
+    @moderation
+    async def mute(
+        self,
+        ctx: commands.Context,
+        user: discord.Member,
+        duration: typing.Optional[Duration] = None,
+        *,
+        reason: str = None,
+    ):
+        """Mute a member, for an optional duration (like `30m`), with an
+        optional reason"""
+
+        # Checks
+        if user == self.bot.user:
+            return await ctx.send("I can't mute myself")
+
+        if user == ctx.author:
+            return await ctx.send("You can't mute yourself")
+
+        if user.top_role.position >= ctx.author.top_role.position:
+            return await ctx.send(
+                "You can't mute a user who has a higher role than you"
+            )
+
+        # Mute
+        await self.mute_member(user, ctx.author, reason, duration)
+        await ctx.message.delete()
+
+        # Success embed
+        success_embed = self.success_embed("mute", user)
+        await ctx.send(embed=success_embed)
+
+    @commands.command("unmute")
+    @commands.has_guild_permissions(manage_roles=True)
+    @moderation
+    async def unmute(
+        self,
+        ctx: commands.Context,
+        user: discord.Member,
+        *,
+        reason: str = None,
+    ):
+        """Unmute a member with an optional reason"""
+
+        # Unmute
+        await self.unmute_member(user, ctx.author, reason)
+        await ctx.message.delete()
+
+        # Success embed
+        success_embed = self.success_embed("unmute", user)
+        await ctx.send(embed=success_embed)
+
+    # ---------------------------------------------------------------------------------------------
+    # Timer events
+
+    @commands.Cog.listener()
+    async def on_mute_timer_complete(self, timer):
+        guild: discord.Guild = self.bot.get_guild(timer.data["guild_id"])
+        if guild is None:
+            return
+
+        member: discord.Member = guild.get_member(timer.data["user_id"])
+        if member is None:
+            self.logger.info(
+                f"mute of user `{timer.data['user_id']}` expired "
+                f"but they left guild `{guild}`"
+            )
+            return
+
+        try:
+            await self.unmute_member(
+                member,
+                self.bot.user,
+                f"Mute of {format_duration(timer.duration)} expired",
+            )
+        except Exception as error:
+            await self.bot.handle_error(error)
+
+    @commands.Cog.listener()
+    async def on_tempban_timer_complete(self, timer):
+        guild: discord.Guild = self.bot.get_guild(timer.data["guild_id"])
+        if guild is None:
+            return
+
+        user = discord.Object(timer.data["user_id"])
+        reason = f"Ban of {format_duration(timer.duration)} expired"
+
+        try:
+            await guild.unban(user, reason=reason)
+        except discord.NotFound:
+            # Already unbanned by hand
+            return
+        except Exception as error:
+            return await self.bot.handle_error(error)
+
+        user = self.bot.get_user(user.id) or await self.bot.fetch_user(user.id)
+        self.logger.info(
+            f"user `{user}` unbanned from guild `{guild}` "
+            f"for reason `{reason}`"
+        )
+
+        # Modlog embed
+        log_embed = self.log_embed("unban", user, self.bot.user, reason)
+        await self.bot.outbox.send(
+            self.log_channel, Priority.MODERATION, embed=log_embed
+        )
+
+        await self.record_infraction(
+            "unban", guild, user, self.bot.user, reason
+        )
 
     # ---------------------------------------------------------------------------------------------
     # Command errors
@@ -357,3 +859,75 @@ class Moderation(commands.Cog):
 
         else:
             await self.bot.handle_error(error, ctx=ctx)
+
+    @tempban.error
+    async def tempban_error(self, ctx: commands.Context, error):
+        error = getattr(error, "original", error)
+        self.logger.warning(
+            f"command `{ctx.command.name}` raised exception: {error}"
+        )
+
+        # Missing argument
+        if isinstance(error, commands.errors.MissingRequiredArgument):
+            return await ctx.send_help("tempban")
+
+        # User not found
+        elif isinstance(error, commands.errors.UserNotFound):
+            return await ctx.send("User not found, you should use their id")
+
+        # Invalid duration
+        elif isinstance(error, commands.errors.BadArgument):
+            return await ctx.send(str(error))
+
+        # Can't ban
+        elif isinstance(error, discord.Forbidden):
+            return await ctx.send("User is higher than the bot")
+
+        else:
+            await self.bot.handle_error(error, ctx=ctx)
+
+    @warn.error
+    @mute.error
+    @unmute.error
+    async def mute_error(self, ctx: commands.Context, error):
+        error = getattr(error, "original", error)
+        self.logger.warning(
+            f"command `{ctx.command.name}` raised exception: {error}"
+        )
+
+        # Missing argument
+        if isinstance(error, commands.errors.MissingRequiredArgument):
+            return await ctx.send_help(ctx.command.name)
+
+        # User not found
+        elif isinstance(error, commands.errors.MemberNotFound):
+            return await ctx.send("User not found")
+
+        # No muted role
+        elif isinstance(error, commands.errors.BadArgument):
+            return await ctx.send(str(error))
+
+        # Can't edit roles
+        elif isinstance(error, discord.Forbidden):
+            return await ctx.send("User is higher than the bot")
+
+        else:
+            await self.bot.handle_error(error, ctx=ctx)
+
+    @infractions.error
+    async def infractions_error(self, ctx: commands.Context, error):
+        error = getattr(error, "original", error)
+        self.logger.warning(
+            f"command `{ctx.command.name}` raised exception: {error}"
+        )
+
+        # Missing argument
+        if isinstance(error, commands.errors.MissingRequiredArgument):
+            return await ctx.send_help("infractions")
+
+        # User not found
+        elif isinstance(error, commands.errors.UserNotFound):
+            return await ctx.send("User not found, you should use their id")
+
+        else:
+            await self.bot.handle_error(error, ctx=ctx)
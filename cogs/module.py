@@ -1,11 +1,20 @@
 import discord
 from discord.ext import commands
 
-import sphobjinv
 import typing
 
+from utils.imports import lazy_import
+from utils.tracing import span
+
 if typing.TYPE_CHECKING:
+    import sphobjinv
     from bot import CodinGameBot
+else:
+    # Only imported when the docs are searched
+    sphobjinv = lazy_import("sphobjinv")
+
+
+DOCS_TTL = 60 * 60
 
 
 def setup(bot: "CodinGameBot"):
@@ -15,6 +24,10 @@ def setup(bot: "CodinGameBot"):
 class Module(commands.Cog):
     def __init__(self, bot):
         self.bot: "CodinGameBot" = bot
+        # Last parsed inventory and its compressed data
+        self._inventory: typing.Optional[
+            typing.Tuple[bytes, "sphobjinv.Inventory"]
+        ] = None
 
     # --------------------------------------------------------------------------
     # Helper methods
@@ -42,9 +55,22 @@ class Module(commands.Cog):
     def docs_url(self) -> str:
         return f"https://{self.module_name}.readthedocs.io/en/latest/"
 
-    @property
-    def docs_inventory(self) -> sphobjinv.Inventory:
-        return sphobjinv.Inventory(url=self.docs_url + "objects.inv")
+    async def docs_inventory(self) -> "sphobjinv.Inventory":
+        """The inventory of the docs, cached as the compressed `objects.inv`
+        and only parsed again when it changes"""
+
+        async def fetch() -> bytes:
+            async with self.bot.http_session.get(
+                self.docs_url + "objects.inv", raise_for_status=True
+            ) as response:
+                return await response.read()
+
+        data = await self.bot.cache.get_or_set(
+            f"docs:{self.module_name}", fetch, DOCS_TTL
+        )
+        if self._inventory is None or self._inventory[0] != data:
+            self._inventory = (data, sphobjinv.Inventory(zlib=data))
+        return self._inventory[1]
 
     # --------------------------------------------------------------------------
     # Commands
@@ -77,11 +103,13 @@ class Module(commands.Cog):
                 reference=self.get_replied_reference(ctx),
             )
 
-        inventory = self.docs_inventory
-        best_matches = [
-            inventory.objects[index]
-            for _, index in inventory.suggest(query, with_index=True)
-        ][:10]
+        with span("docs inventory"):
+            inventory = await self.docs_inventory()
+        with span("suggest"):
+            best_matches = [
+                inventory.objects[index]
+                for _, index in inventory.suggest(query, with_index=True)
+            ][:10]
 
         if not best_matches:
             return await ctx.send("No matches found.")
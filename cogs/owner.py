@@ -0,0 +1,664 @@
+import discord
+from discord.ext import commands
+
+import argparse
+import asyncio
+import collections
+import io
+import re
+import shlex
+import threading
+import time
+import tracemalloc
+import typing
+
+from config import Config
+from utils import http, logsearch, memory, metrics
+from utils.ipc import IPCError
+from utils.profiler import StackSampler, short_path
+from utils.time import parse_duration
+
+if typing.TYPE_CHECKING:
+    from bot import CodinGameBot
+
+
+# The paginator is browsed with reactions
+INTENTS = discord.Intents(guild_reactions=True, dm_reactions=True)
+
+
+def setup(bot: "CodinGameBot"):
+    bot.add_cog(Owner(bot=bot))
+
+
+class ArgumentParser(argparse.ArgumentParser):
+    """`ArgumentParser` that raises `commands.BadArgument` instead of
+    exiting"""
+
+    def error(self, message: str):
+        raise commands.BadArgument(message)
+
+
+def parse_time(text: str) -> float:
+    """Parse a duration ago (`2h`) or a date (`19/10/2021 13:37`)"""
+    try:
+        return time.time() - parse_duration(text).total_seconds()
+    except ValueError:
+        pass
+
+    for date_format in ("%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M", "%d/%m/%Y"):
+        try:
+            return time.mktime(time.strptime(text, date_format))
+        except ValueError:
+            pass
+
+    raise argparse.ArgumentTypeError(f"invalid time: `{text}`")
+
+
+class Owner(commands.Cog):
+    """Commands to debug the bot in production."""
+
+    def __init__(self, bot):
+        self.bot: "CodinGameBot" = bot
+        self.logger = self.bot.logger.getChild("owner")
+        # Only one profiling session at a time
+        self.profiling = asyncio.Lock()
+        # Baseline of `profile mem diff`
+        self.snapshot: typing.Optional[tracemalloc.Snapshot] = None
+        if self.bot.ipc is not None:
+            self.bot.ipc.handlers["stats"] = self.local_stats
+
+    def cog_unload(self):
+        if self.bot.ipc is not None:
+            self.bot.ipc.handlers.pop("stats", None)
+        if self.snapshot is not None:
+            self.snapshot = None
+            tracemalloc.stop()
+
+    # --------------------------------------------------------------------------
+    # Helper methods
+
+    async def paginate(
+        self,
+        ctx: commands.Context,
+        pages: typing.List[str],
+        *,
+        title: str = "",
+        timeout: float = 120.0,
+    ):
+        """Send `pages` in an embed that can be browsed with reactions"""
+        if not pages:
+            return
+
+        index = 0
+
+        def embed() -> discord.Embed:
+            return self.bot.embed(
+                title=f"{title} • Page {index + 1}/{len(pages)}",
+                description=pages[index],
+                ctx=ctx,
+            )
+
+        message: discord.Message = await ctx.send(embed=embed())
+        if len(pages) == 1:
+            return
+
+        reactions = ["⏮️", "◀️", "▶️", "⏭️"]
+        for reaction in reactions:
+            await message.add_reaction(reaction)
+
+        def check(reaction: discord.Reaction, user: discord.User) -> bool:
+            return (
+                reaction.message.id == message.id
+                and user.id == ctx.author.id
+                and str(reaction.emoji) in reactions
+            )
+
+        while True:
+            try:
+                reaction, user = await self.bot.wait_for(
+                    "reaction_add", check=check, timeout=timeout
+                )
+            except asyncio.TimeoutError:
+                break
+
+            emoji = str(reaction.emoji)
+            index = {
+                "⏮️": 0,
+                "◀️": max(index - 1, 0),
+                "▶️": min(index + 1, len(pages) - 1),
+                "⏭️": len(pages) - 1,
+            }[emoji]
+            await message.edit(embed=embed())
+
+            try:
+                await message.remove_reaction(reaction, user)
+            except discord.HTTPException:
+                pass
+
+        try:
+            await message.clear_reactions()
+        except discord.HTTPException:
+            pass
+
+    @staticmethod
+    def format_summaries(
+        summaries: typing.List[metrics.Summary], limit: int = 15
+    ) -> str:
+        """Table of the busiest entries of a histogram"""
+        if not summaries:
+            return "No data yet"
+
+        def ms(seconds: float) -> str:
+            return "inf" if seconds == float("inf") else f"{seconds * 1000:.0f}"
+
+        width = max(len(summary.name) for summary in summaries[:limit])
+        lines = [
+            f"{'name':<{width}} {'count':>6} {'err':>4} {'avg':>6} "
+            f"{'p50':>6} {'p99':>6}"
+        ]
+        for summary in summaries[:limit]:
+            histogram = summary.histogram
+            lines.append(
+                f"{summary.name:<{width}} {histogram.count:>6} "
+                f"{summary.errors:>4} {ms(histogram.mean):>6} "
+                f"{ms(histogram.quantile(0.5)):>6} "
+                f"{ms(histogram.quantile(0.99)):>6}"
+            )
+        return "```\n" + "\n".join(lines)[:1000] + "```"
+
+    def cache_sizes(self) -> typing.List[memory.CacheSize]:
+        """Approximate size of the caches of discord.py, the bot and cogs"""
+        guilds = self.bot.guilds
+        sizes = memory.cache_sizes(
+            {
+                "guilds": guilds,
+                "members": [
+                    member for guild in guilds for member in guild.members
+                ],
+                "users": self.bot.users,
+                "channels": [
+                    channel for guild in guilds for channel in guild.channels
+                ]
+                + self.bot.private_channels,
+                "roles": [role for guild in guilds for role in guild.roles],
+                "emojis": self.bot.emojis,
+                "messages": list(self.bot.cached_messages),
+            },
+            exclude=(discord.Client, discord.state.ConnectionState),
+        )
+
+        # `cache_stats` returns the caches of the bot or a cog by name
+        caches = {}
+        for owner in [self.bot] + list(self.bot.cogs.values()):
+            cache_stats = getattr(owner, "cache_stats", None)
+            if cache_stats is None:
+                continue
+            prefix = "bot" if owner is self.bot else owner.qualified_name
+            for name, cache in cache_stats().items():
+                caches[f"{prefix}: {name}"] = cache
+
+        return sizes + memory.cache_sizes(caches, exclude=(discord.Client,))
+
+    @staticmethod
+    def filter_snapshot(snapshot: tracemalloc.Snapshot) -> tracemalloc.Snapshot:
+        return snapshot.filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                tracemalloc.Filter(False, "<unknown>"),
+            )
+        )
+
+    # --------------------------------------------------------------------------
+    # Commands
+
+    @commands.command(name="stats", hidden=True)
+    @commands.is_owner()
+    async def stats(self, ctx: commands.Context):
+        """Latency of the commands, listeners, API requests and sent messages,
+        with the loop lag, shards and HTTP pool of each cluster.
+
+        Durations are in milliseconds, the percentiles are the upper bounds
+        of their histogram buckets."""
+        embed = self.bot.embed(
+            title="Stats",
+            description=f"Since {self.bot.start_time:%d/%m/%Y %H:%M:%S} UTC",
+            ctx=ctx,
+        )
+
+        results = None
+        if self.bot.ipc is not None:
+            try:
+                results = await self.bot.ipc.broadcast("stats")
+            except (IPCError, asyncio.TimeoutError) as error:
+                embed.description += f"\nOnly this cluster: {error}"
+        if not results:
+            results = {Config.CLUSTER_ID or 0: await self.local_stats()}
+
+        failed = {
+            cluster: result["error"]
+            for cluster, result in results.items()
+            if "error" in result
+        }
+        results = {
+            cluster: result
+            for cluster, result in sorted(results.items())
+            if cluster not in failed
+        }
+        if len(results) > 1:
+            embed.description += f"\n{len(results)} clusters"
+
+        registry = metrics.Metrics()
+        for result in results.values():
+            registry.load(result["metrics"])
+        for name, metric, label in (
+            ("Commands", "bot_command_duration_seconds", "command"),
+            ("Log listeners", "bot_listener_duration_seconds", "listener"),
+            ("CodinGame API", "codingame_request_duration_seconds", "method"),
+            ("Sent messages", "bot_send_duration_seconds", "priority"),
+        ):
+            embed.add_field(
+                name=name,
+                value=self.format_summaries(registry.summarize(metric, label)),
+                inline=False,
+            )
+
+        def prefix(cluster: int) -> str:
+            return f"Cluster {cluster}: " if len(results) > 1 else ""
+
+        embed.add_field(
+            name="Event loop lag",
+            value="\n".join(
+                f"{prefix(cluster)}p50 {result['lag'][0] * 1000:.0f} ms, "
+                f"p99 {result['lag'][1] * 1000:.0f} ms, "
+                f"{result['blocks']} recent blocks"
+                for cluster, result in results.items()
+            ),
+            inline=False,
+        )
+
+        events = collections.Counter()
+        for labels, count in registry.counters.get(
+            "bot_gateway_events_total", {}
+        ).items():
+            events[dict(labels)["shard"]] += count
+        embed.add_field(
+            name="Shards",
+            value="\n".join(
+                f"`{shard_id}`: {latency * 1000:.0f} ms, "
+                f"{events[str(shard_id)]:.0f} events"
+                for shard_id, latency in sorted(
+                    tuple(shard)
+                    for result in results.values()
+                    for shard in result["shards"]
+                )
+            )[:1024],
+            inline=False,
+        )
+
+        rates = http.reuse_rates(registry)
+        embed.add_field(
+            name="HTTP pool",
+            value="\n".join(
+                f"{prefix(cluster)}{result['http']['acquired']} in use, "
+                f"{result['http']['idle']} idle, limit "
+                f"{result['http']['limit']}"
+                for cluster, result in results.items()
+            )
+            + "".join(
+                f"\n`{host}`: {rate:.0%} reused connections"
+                for host, rate in sorted(rates.items())
+            ),
+            inline=False,
+        )
+
+        endpoints = [
+            prefix(cluster) + result["endpoint"]
+            for cluster, result in results.items()
+            if result["endpoint"]
+        ]
+        if endpoints:
+            embed.add_field(
+                name="Endpoint", value="\n".join(endpoints), inline=False
+            )
+        if failed:
+            embed.add_field(
+                name="Failed clusters",
+                value="\n".join(
+                    f"Cluster {cluster}: {error}"
+                    for cluster, error in failed.items()
+                ),
+                inline=False,
+            )
+
+        await ctx.send(embed=embed)
+
+    async def local_stats(self) -> dict:
+        """Stats of this process, combined across the clusters by `stats`"""
+        monitor = self.bot.loop_monitor
+        server = self.bot.metrics_server
+        return {
+            "metrics": self.bot.metrics.dump(),
+            "lag": [monitor.percentile(0.5), monitor.percentile(0.99)],
+            "blocks": len(monitor.blocks),
+            "shards": self.bot.shard_latencies(),
+            "http": self.bot.http_pool.usage(),
+            "endpoint": f"http://{server.host}:{server.port}/metrics"
+            if server is not None and server.server is not None
+            else None,
+        }
+
+    @commands.group(name="trace", hidden=True)
+    @commands.is_owner()
+    async def trace(self, ctx: commands.Context):
+        """Inspect the commands slower than the trace threshold."""
+        if ctx.invoked_subcommand is None:
+            return await ctx.send_help(self.bot.get_command("trace"))
+
+    @trace.command(name="last")
+    async def trace_last(self, ctx: commands.Context, index: int = 1):
+        """Show the stages of the `index`-th most recent slow command."""
+        trace = self.bot.tracer.last(max(index, 1) - 1)
+        if trace is None:
+            return await ctx.send(
+                f"Only {len(self.bot.tracer)} slow commands were traced "
+                f"(slower than {self.bot.tracer.threshold}s)."
+            )
+
+        embed = self.bot.embed(
+            title=f"Trace of `{trace.name}`",
+            description=f"```\n{trace.format()[:4000]}```",
+            ctx=ctx,
+        )
+        embed.add_field(
+            name="Started at",
+            value=time.strftime(
+                "%d/%m/%Y %H:%M:%S", time.localtime(trace.started_at)
+            ),
+        )
+        for name in ("guild_id", "channel_id", "user_id"):
+            if trace.info.get(name):
+                embed.add_field(name=name, value=trace.info[name])
+        await ctx.send(embed=embed)
+
+    @trace.command(name="list")
+    async def trace_list(self, ctx: commands.Context):
+        """List the slow commands that were traced, most recent first."""
+        traces = list(reversed(self.bot.tracer.traces))
+        if not traces:
+            return await ctx.send("No slow commands were traced.")
+
+        paginator = commands.Paginator(max_size=2000)
+        for index, trace in enumerate(traces, 1):
+            paginator.add_line(
+                f"{index:>3}. "
+                + time.strftime("%H:%M:%S", time.localtime(trace.started_at))
+                + f" {trace.duration * 1000:>8.0f} ms  {trace.name}"
+            )
+        await self.paginate(
+            ctx, paginator.pages, title=f"{len(traces)} slow commands"
+        )
+
+    @commands.group(name="profile", hidden=True)
+    @commands.is_owner()
+    async def profile(self, ctx: commands.Context):
+        """Profile the running bot."""
+        if ctx.invoked_subcommand is None:
+            return await ctx.send_help(self.bot.get_command("profile"))
+
+    @profile.command(name="cpu")
+    async def profile_cpu(self, ctx: commands.Context, seconds: float = 10.0):
+        """Sample the stacks of all the threads for some seconds.
+
+        Sends the stacks in the collapsed format (for `flamegraph.pl` or
+        speedscope) and the busiest functions of the event loop thread."""
+        if self.profiling.locked():
+            return await ctx.send("A profiling session is already running.")
+        if not 0 < seconds <= 300:
+            raise commands.BadArgument("The duration must be 0 to 300s.")
+
+        async with self.profiling:
+            sampler = StackSampler(Config.PROFILE_INTERVAL)
+            await ctx.send(f"Profiling for {seconds:g}s...")
+            self.logger.info(f"started CPU profiling for {seconds:g}s")
+
+            sampler.start()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                sampler.stop()
+
+        self.logger.info(
+            f"CPU profiling done: {sampler.samples} samples, "
+            f"overhead {sampler.overhead_ratio:.2%}"
+        )
+
+        own, total = sampler.top(10, thread=threading.current_thread().name)
+
+        def table(rows: typing.List[typing.Tuple[str, int]]) -> str:
+            lines = [
+                f"{count / max(sampler.samples, 1):>6.1%} {label}"
+                for label, count in rows
+            ]
+            return "```\n" + "\n".join(lines)[:1000] + "```" if lines else "-"
+
+        embed = self.bot.embed(
+            title=f"CPU profile of {sampler.duration:.1f}s",
+            description=f"{sampler.samples} samples every "
+            f"{sampler.interval * 1000:g} ms, sampler overhead "
+            f"{sampler.overhead_ratio:.2%} of a CPU",
+            ctx=ctx,
+        )
+        embed.add_field(name="Event loop: self", value=table(own), inline=False)
+        embed.add_field(
+            name="Event loop: total", value=table(total), inline=False
+        )
+
+        file = discord.File(
+            io.BytesIO(sampler.collapsed().encode()),
+            filename=f"profile-{time.strftime('%Y%m%d-%H%M%S')}.collapsed",
+        )
+        await ctx.send(embed=embed, file=file)
+
+    @profile.group(name="mem", invoke_without_command=True)
+    async def profile_mem(self, ctx: commands.Context):
+        """Show the approximate size of the caches.
+
+        Use `start`, `diff` and `stop` to find the allocations that grow."""
+        start = time.perf_counter()
+        sizes = self.cache_sizes()
+        elapsed = time.perf_counter() - start
+
+        lines = [
+            f"{cache.name[:32]:<32} "
+            f"{'-' if cache.count is None else cache.count:>7} "
+            f"{memory.format_bytes(cache.size):>10}"
+            for cache in sizes
+        ]
+        embed = self.bot.embed(
+            title="Caches",
+            description="```\n" + "\n".join(lines)[:4000] + "```",
+            ctx=ctx,
+        )
+        embed.add_field(
+            name="Total",
+            value=memory.format_bytes(sum(cache.size for cache in sizes)),
+        )
+        embed.add_field(name="Measured in", value=f"{elapsed * 1000:.0f} ms")
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            embed.add_field(
+                name="Traced memory",
+                value=f"{memory.format_bytes(current)} "
+                f"(peak {memory.format_bytes(peak)})",
+            )
+        await ctx.send(embed=embed)
+
+    @profile_mem.command(name="start")
+    async def profile_mem_start(self, ctx: commands.Context, frames: int = 1):
+        """Start tracing the allocations and take the baseline snapshot.
+
+        Tracing slows down the allocations, stop it when you're done."""
+        if self.snapshot is not None:
+            return await ctx.send(
+                "Memory profiling is already running, use `diff` or `stop`."
+            )
+
+        tracemalloc.start(max(1, min(frames, 25)))
+        self.snapshot = self.filter_snapshot(tracemalloc.take_snapshot())
+        self.logger.info("started memory profiling")
+        await ctx.send("Memory profiling started.")
+
+    @profile_mem.command(name="diff")
+    async def profile_mem_diff(self, ctx: commands.Context, limit: int = 10):
+        """Show the allocation sites that grew the most since `start`."""
+        if self.snapshot is None:
+            return await ctx.send("Memory profiling isn't running.")
+
+        def compare() -> typing.List[tracemalloc.StatisticDiff]:
+            snapshot = self.filter_snapshot(tracemalloc.take_snapshot())
+            return snapshot.compare_to(self.snapshot, "lineno")
+
+        async with ctx.typing():
+            stats = await self.bot.loop.run_in_executor(None, compare)
+
+        growth = sum(stat.size_diff for stat in stats)
+        lines = [
+            f"{memory.format_bytes(stat.size_diff):>10} "
+            f"{stat.count_diff:>+7} "
+            f"{short_path(stat.traceback[0].filename)}"
+            f":{stat.traceback[0].lineno}"
+            for stat in stats[: max(1, min(limit, 25))]
+            if stat.size_diff > 0
+        ]
+
+        current, peak = tracemalloc.get_traced_memory()
+        embed = self.bot.embed(
+            title="Allocations since the snapshot",
+            description="```\n"
+            + ("\n".join(lines) or "Nothing grew")[:4000]
+            + "```",
+            ctx=ctx,
+        )
+        embed.add_field(name="Growth", value=memory.format_bytes(growth))
+        embed.add_field(
+            name="Traced memory",
+            value=f"{memory.format_bytes(current)} "
+            f"(peak {memory.format_bytes(peak)})",
+        )
+        await ctx.send(embed=embed)
+
+    @profile_mem.command(name="stop")
+    async def profile_mem_stop(self, ctx: commands.Context):
+        """Stop tracing the allocations."""
+        if self.snapshot is None:
+            return await ctx.send("Memory profiling isn't running.")
+
+        self.snapshot = None
+        tracemalloc.stop()
+        self.logger.info("stopped memory profiling")
+        await ctx.send("Memory profiling stopped.")
+
+    @profile_cpu.error
+    async def profile_error(self, ctx: commands.Context, error):
+        error = getattr(error, "original", error)
+        if isinstance(error, commands.errors.BadArgument):
+            return await ctx.send(str(error))
+        await self.bot.handle_error(error, ctx=ctx)
+
+    @commands.group(name="logs", hidden=True)
+    @commands.is_owner()
+    async def logs(self, ctx: commands.Context):
+        """Inspect the log files."""
+        if ctx.invoked_subcommand is None:
+            return await ctx.send_help(self.bot.get_command("logs"))
+
+    @logs.command(
+        name="search",
+        usage="<pattern> [--since] [--until] [--level] [--logger] [--file] "
+        "[--limit]",
+    )
+    async def logs_search(self, ctx: commands.Context, *, arguments: str):
+        """Search the log files with a regex, newest records first.
+
+        `--since`/`--until` take a duration ago (`2h`) or a date
+        (`19/10/2021 13:37`), `--level` is the minimum level, `--logger`
+        includes the child loggers and `--file` is `root` or `error`."""
+        parser = ArgumentParser(prog="logs search", add_help=False)
+        parser.add_argument("pattern", nargs="+")
+        parser.add_argument("--since", type=parse_time)
+        parser.add_argument("--until", type=parse_time)
+        parser.add_argument(
+            "--level",
+            type=str.upper,
+            choices=list(logsearch.LEVELS),
+        )
+        parser.add_argument("--logger")
+        parser.add_argument("--file", choices=["root", "error"], default="root")
+        parser.add_argument("--limit", type=int, default=100)
+
+        try:
+            args = parser.parse_args(shlex.split(arguments))
+        except ValueError as error:
+            raise commands.BadArgument(str(error)) from error
+
+        pattern = " ".join(args.pattern)
+        try:
+            re.compile(pattern)
+        except re.error as error:
+            raise commands.BadArgument(f"Invalid regex: {error}") from error
+
+        # The workers of the launcher write their own files, see `cluster_path`
+        name = f"{args.file}.log"
+        if Config.CLUSTER_ID is not None:
+            name = f"{args.file}.{Config.CLUSTER_ID}.log"
+
+        start = time.perf_counter()
+        async with ctx.typing():
+            results = await self.bot.loop.run_in_executor(
+                None,
+                lambda: logsearch.search(
+                    pattern,
+                    name=name,
+                    since=args.since,
+                    until=args.until,
+                    min_level=args.level,
+                    logger=args.logger,
+                    limit=min(args.limit, 1000),
+                ),
+            )
+        elapsed = time.perf_counter() - start
+
+        self.logger.info(
+            f"searched logs for `{pattern}`: {len(results)} results "
+            f"in {elapsed:.2f}s"
+        )
+        if not results:
+            return await ctx.send(f"No results found in {elapsed:.2f}s.")
+
+        paginator = commands.Paginator(max_size=2000)
+        for result in results:
+            for line in result.text.splitlines():
+                paginator.add_line(line[:1900])
+
+        await self.paginate(
+            ctx,
+            paginator.pages,
+            title=f"{len(results)} results in {elapsed:.2f}s",
+        )
+
+    @logs_search.error
+    async def logs_search_error(self, ctx: commands.Context, error):
+        error = getattr(error, "original", error)
+        self.logger.warning(
+            f"command `{ctx.command.name}` raised exception: {error}"
+        )
+
+        if isinstance(error, commands.errors.MissingRequiredArgument):
+            return await ctx.send_help(ctx.command)
+
+        elif isinstance(error, commands.errors.BadArgument):
+            return await ctx.send(str(error))
+
+        else:
+            await self.bot.handle_error(error, ctx=ctx)
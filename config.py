@@ -22,21 +22,131 @@ class BaseConfig:
     PREFIX: str
     OWNER_ID: int = 401346079733317634
     LOG_LEVEL: int
+    LOG_MAX_BYTES: int = 16 * 1024 * 1024
+    LOG_ROTATE_INTERVAL: int = 24 * 60 * 60  # seconds
+    LOG_BACKUP_COUNT: int = 14
+    LOG_JSON: typing.Optional[str] = "log/bot.jsonl"  # None to disable
+    LOG_QUEUE_SIZE: int = 10_000
+    LOG_QUEUE_POLICY: str = "drop"  # or "block" when the log queue is full
+    # Fraction of the messages logged, by channel or guild ID
+    MESSAGE_LOG_SAMPLE_RATES: typing.Dict[int, float] = {}
+    MESSAGE_LOG_BYTES_PER_SECOND: typing.Optional[int] = 64 * 1024
 
     DEFAULT_COGS = [
-        "jishaku",
         "cogs._help",
         "cogs.commands",
         "cogs.codingame",
         "cogs.log",
         "cogs.moderation",
+        "cogs.automod",
+        "cogs.owner",
         "cogs.module",
     ]
+    # Loaded in the background once the bot is ready
+    DEFERRED_COGS: typing.List[str] = [
+        "jishaku",
+    ]
+
+    # Gateway
+    # The intents, member cache flags and chunking are derived from the
+    # `INTENTS`, `MEMBER_CACHE` and `CHUNK_GUILDS` of the cogs, these
+    # override them, for example `{"presences": True}`
+    INTENTS: typing.Dict[str, bool] = {}
+    MEMBER_CACHE: typing.Dict[str, bool] = {}
+    CHUNK_GUILDS: typing.Optional[bool] = None
+    # Resume the gateway session of the previous process on restart. The
+    # cache is rebuilt from the API, and the events missed while restarting
+    # for guilds that aren't cached yet are lost. Not in sharded mode
+    SESSION_RESUME: bool = False
+    SESSION_MAX_AGE: int = 60  # in s, older sessions are identified again
+    # Several gateway connections in the process, with `AutoShardedBot`.
+    # Overridden by the environment of the workers started by the launcher
+    SHARDED: bool = False
+    SHARD_COUNT: typing.Optional[int] = None  # None to use Discord's count
+    SHARD_IDS: typing.Optional[typing.List[int]] = None  # all by default
+
+    # Cluster
+    CLUSTERS: int = 2  # worker processes started by `launcher.py`
+    # Set by the launcher for its workers, `None` when run with `run.py`
+    CLUSTER_ID: typing.Optional[int] = (
+        int(os.environ["CLUSTER_ID"]) if "CLUSTER_ID" in os.environ else None
+    )
+    IPC_PATH: str = "data/ipc.sock"
+
+    # Supervisor
+    # Base of the jittered exponential backoff between restarts, in s
+    RESTART_DELAY: float = 1.0
+    # Time given to the running commands and log messages on SIGTERM, in s
+    DRAIN_TIMEOUT: float = 20.0
+
+    # Errors
+    ERROR_REPORT_WINDOW: int = 10 * 60  # report each error once per window
+    ERROR_DIGEST_INTERVAL: int = 60 * 60
+
+    # Metrics
+    METRICS_HOST: str = "127.0.0.1"
+    METRICS_PORT: typing.Optional[int] = 9100  # None to disable the endpoint
+    # Commands slower than this (in s) are kept for `trace`
+    TRACE_THRESHOLD: float = 1.0
+    TRACE_BUFFER_SIZE: int = 50
+
+    # Event loop monitor
+    LOOP_MONITOR_INTERVAL: float = 0.5  # heartbeat interval in s
+    LOOP_BLOCK_THRESHOLD: float = 0.25  # capture the stack when this late
+    LOOP_DEBUG: bool = False  # asyncio slow callback detection, has overhead
+    LOOP_LAG_ALERT: float = 1.0  # alert the owner when p99 lag is above
+    LOOP_ALERT_INTERVAL: int = 15 * 60
+    PROFILE_INTERVAL: float = 0.005  # CPU profiler sampling interval in s
+
+    # Storage
+    DATABASE: str = "data/bot.db"
+    CACHE_SIZE: int = 1024  # entries kept in memory by each process
+    # Cache shared by the processes, for example "redis://localhost:6379/0".
+    # None to only cache in memory
+    CACHE_URL: typing.Optional[str] = os.environ.get("CACHE_URL")
+    CACHE_TIMEOUT: float = 0.5  # in s, Redis is skipped when slower
+
+    # HTTP pool shared by Discord, CodinGame and the docs
+    HTTP_LIMIT: int = 100  # open connections in total
+    HTTP_LIMIT_PER_HOST: int = 30
+    HTTP_KEEPALIVE: float = 30.0  # seconds an idle connection is kept
+    HTTP_DNS_TTL: int = 5 * 60  # seconds a resolved host is cached
+    HTTP_TIMEOUT: float = 30.0  # whole request, not Discord's
+    HTTP_CONNECT_TIMEOUT: float = 10.0
+    # Messages sent at once, and slots of these kept for the command replies
+    SEND_CONCURRENCY: int = 5
+    SEND_RESERVED: int = 1
 
     # Guild
     GUILD: int
     SERVER_LOG_CHANNEL: int
     MOD_LOG_CHANNEL: int
+    MUTED_ROLE: str = "Muted"
+
+    # Moderation
+    # (action, nth infraction of that action): (action to take, duration in s)
+    ESCALATIONS: typing.Dict[
+        typing.Tuple[str, int], typing.Tuple[str, typing.Optional[int]]
+    ] = {
+        ("warn", 3): ("mute", 60 * 60),
+        ("warn", 5): ("mute", 24 * 60 * 60),
+        ("warn", 7): ("ban", None),
+    }
+
+    # Automod
+    AUTOMOD_RATE: typing.Tuple[int, float] = (8, 10.0)  # messages per seconds
+    AUTOMOD_DUPLICATES: typing.Tuple[int, int] = (4, 10)  # same in last msgs
+    AUTOMOD_MENTIONS: typing.Tuple[int, float] = (10, 30.0)  # mentions per sec
+    AUTOMOD_IDLE: float = 5 * 60  # seconds before forgetting a user
+    AUTOMOD_MUTE_DURATION: int = 10 * 60
+    # Near-duplicate messages posted in this many channels within the window
+    DUPLICATE_CHANNELS: int = 3
+    DUPLICATE_WINDOW: float = 60.0
+    DUPLICATE_DISTANCE: int = 12  # differing bits out of 64
+    DUPLICATE_MIN_LENGTH: int = 30
+    # Entries added with `blocklist add` are stored in the database
+    # `word` whole word, `word*` or `*word*` part of a word, `re:...` regex
+    BLOCKLIST: typing.List[str] = []
 
 class ProdConfig(BaseConfig):
     PREFIX = "!"
@@ -57,3 +167,12 @@ class DevConfig(BaseConfig):
     MOD_LOG_CHANNEL = 754240243615662142
 
 Config: typing.Type[BaseConfig] = DevConfig if DEV else ProdConfig
+
+# Shards of a worker of the launcher
+if "SHARD_IDS" in os.environ:
+    Config.SHARDED = True
+    Config.SHARD_IDS = [
+        int(shard) for shard in os.environ["SHARD_IDS"].split(",")
+    ]
+if "SHARD_COUNT" in os.environ:
+    Config.SHARD_COUNT = int(os.environ["SHARD_COUNT"])
@@ -0,0 +1,144 @@
+"""Run the bot in several processes, each one with a range of the shards.
+
+The workers are `run.py` processes, their shards and cluster ID are set in
+their environment. They talk through the IPC bus served here, and a worker
+is restarted when it crashes, not when it logs out.
+
+Usage: python launcher.py [clusters]
+"""
+
+import discord
+from discord.backoff import ExponentialBackoff
+
+import asyncio
+import logging
+import os
+import signal
+import sys
+import time
+import typing
+
+from config import Config
+from utils import color
+from utils.ipc import IPCServer
+
+logger = logging.getLogger("launcher")
+
+
+def split_shards(
+    shard_count: int, clusters: int
+) -> typing.List[typing.List[int]]:
+    """Contiguous ranges of shards, as even as possible"""
+    size, extra = divmod(shard_count, clusters)
+    ranges = []
+    start = 0
+    for cluster in range(clusters):
+        end = start + size + (cluster < extra)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+async def recommended_shards() -> int:
+    http = discord.http.HTTPClient()
+    try:
+        await http.static_login(Config.TOKEN, bot=True)
+        shard_count, _ = await http.get_bot_gateway()
+    finally:
+        await http.close()
+    return shard_count
+
+
+class Worker:
+    """A `run.py` process running the shards of a cluster"""
+
+    def __init__(self, cluster: int, shard_ids: typing.List[int], count: int):
+        self.cluster = cluster
+        self.shard_ids = shard_ids
+        self.shard_count = count
+        self.process: typing.Optional[asyncio.subprocess.Process] = None
+        self.stopping = False
+
+    async def run(self):
+        """Start the process, and start it again until it exits cleanly"""
+        backoff = ExponentialBackoff(Config.RESTART_DELAY)
+        env = dict(
+            os.environ,
+            CLUSTER_ID=str(self.cluster),
+            SHARD_COUNT=str(self.shard_count),
+            SHARD_IDS=",".join(map(str, self.shard_ids)),
+        )
+
+        while not self.stopping:
+            self.process = await asyncio.create_subprocess_exec(
+                sys.executable, "run.py", env=env
+            )
+            logger.info(
+                f"started cluster {self.cluster} (pid {self.process.pid}) "
+                f"with shards {self.shard_ids[0]}-{self.shard_ids[-1]}"
+            )
+            started = time.perf_counter()
+            code = await self.process.wait()
+            if code == 0 or self.stopping:
+                logger.info(f"cluster {self.cluster} exited")
+                return
+
+            delay = backoff.delay()
+            logger.warning(
+                color(
+                    f"cluster {self.cluster} crashed with code {code} after "
+                    f"{time.perf_counter() - started:.0f}s, restarting in "
+                    f"{delay:.2f}s",
+                    "red",
+                )
+            )
+            await asyncio.sleep(delay)
+
+    def stop(self):
+        """Let the worker drain and log out"""
+        self.stopping = True
+        if self.process is not None and self.process.returncode is None:
+            self.process.send_signal(signal.SIGTERM)
+
+
+async def main():
+    clusters = int(sys.argv[1]) if len(sys.argv) > 1 else Config.CLUSTERS
+    shard_count = Config.SHARD_COUNT or await recommended_shards()
+    clusters = min(clusters, shard_count)
+    logger.info(f"launching {shard_count} shards in {clusters} clusters")
+
+    server = IPCServer(Config.IPC_PATH, logger.getChild("ipc"))
+    await server.start()
+
+    workers = [
+        Worker(cluster, shard_ids, shard_count)
+        for cluster, shard_ids in enumerate(
+            split_shards(shard_count, clusters)
+        )
+    ]
+
+    def stop(name: str):
+        logger.warning(color(f"received {name}, stopping the clusters", "red"))
+        for worker in workers:
+            worker.stop()
+
+    loop = asyncio.get_event_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop, sig.name)
+
+    try:
+        await asyncio.gather(*(worker.run() for worker in workers))
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        format="[{asctime}.{msecs:0>3.0f}] {name:>15}: {levelname:>8}: "
+        "{message}",
+        datefmt="%d/%m/%Y %H:%M:%S",
+        style="{",
+        level=logging.INFO,
+    )
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(main())
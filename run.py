@@ -1,20 +1,119 @@
 import asyncio
+import signal
+import time
+import typing
+
+from utils.imports import ImportProfiler
+
+# Time the imports of the bot, reported in dev mode
+import_profiler = ImportProfiler()
+import_profiler.start()
+
+from discord.backoff import ExponentialBackoff  # noqa: E402
+
+from bot import CodinGameBot  # noqa: E402
+from config import DEV, Config  # noqa: E402
+from utils import color  # noqa: E402
+
+import_profiler.stop()
+
+
+async def report_startup(bot: CodinGameBot):
+    """Print the time taken by the imports and each startup step"""
+    print(import_profiler.report())
+
+    await bot.wait_until_ready()
+    print("startup step: time [ms]")
+    for step, elapsed in bot.startup_times.items():
+        if step != "ready":
+            print(f"{step:>28}: {elapsed * 1000:>8.1f}")
+    print(f"ready {bot.startup_times['ready']:.2f}s after the process started")
+
+
+async def report_recovery(bot: CodinGameBot, failed_at: float):
+    """Log the time between a crash and the client being ready again"""
+    await bot.wait_until_ready()
+    bot.logger.info(
+        color(
+            f"recovered {time.perf_counter() - failed_at:.2f}s after the crash",
+            "green",
+        )
+    )
+
+
+async def shutdown(bot: CodinGameBot, stopping: asyncio.Event, name: str):
+    """Let the running commands and log messages finish, then log out"""
+    if stopping.is_set():
+        return
+    stopping.set()
+
+    bot.logger.warning(color(f"received {name}, shutting down", "red"))
+    await bot.drain(Config.DRAIN_TIMEOUT)
+    await bot.close()
 
-from bot import CodinGameBot
-from config import Config
 
 async def main():
     bot = CodinGameBot()
+    if DEV:
+        asyncio.ensure_future(report_startup(bot))
+
+    loop = asyncio.get_event_loop()
+    stopping = asyncio.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(
+            sig,
+            lambda sig=sig: asyncio.ensure_future(
+                shutdown(bot, stopping, sig.name)
+            ),
+        )
 
+    # Restart the client when it crashes, the delay is reset once it has
+    # been running for a while
+    backoff = ExponentialBackoff(Config.RESTART_DELAY)
+    recovery: typing.Optional[asyncio.Future] = None
     try:
-        await bot.start(Config.TOKEN)
-    except Exception as exc:
-        try:
-            await bot.handle_error(exc)
-        except Exception:
-            pass
+        while True:
+            try:
+                await bot.start(Config.TOKEN)
+            except Exception as exc:
+                # Measured from the first of consecutive crashes
+                if recovery is None or (
+                    recovery.done() and not recovery.cancelled()
+                ):
+                    failed_at = time.perf_counter()
+                try:
+                    await bot.handle_error(exc)
+                except Exception:
+                    pass
+            else:
+                # Logged out with the `logout` command or by a signal
+                break
+
+            await bot.close()
+            if stopping.is_set():
+                break
+
+            delay = backoff.delay()
+            bot.logger.warning(
+                color(f"client crashed, restarting in {delay:.2f}s", "red")
+            )
+            try:
+                await asyncio.wait_for(stopping.wait(), delay)
+                break
+            except asyncio.TimeoutError:
+                pass
+
+            bot.clear()
+            if recovery is not None and not recovery.done():
+                recovery.cancel()
+            recovery = asyncio.ensure_future(report_recovery(bot, failed_at))
     finally:
+        if recovery is not None:
+            recovery.cancel()
         await bot.close()
+        # Kept open across the restarts
+        await bot.http_pool.close()
+
 
 if __name__ == "__main__":
     loop = asyncio.get_event_loop()
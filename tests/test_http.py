@@ -0,0 +1,38 @@
+import asyncio
+
+import aiohttp
+from aiohttp import web
+
+from utils.http import HTTPPool
+from utils.metrics import Metrics
+
+
+def test_appended_trace_config():
+    """The trace config works when appended to a session created without it,
+    like the one of discord.py"""
+
+    async def main():
+        app = web.Application()
+        app.router.add_get("/", lambda request: web.Response(text="ok"))
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+
+        pool = HTTPPool(Metrics())
+        session = aiohttp.ClientSession(connector=pool.connector)
+        session._trace_configs.append(pool.trace_config)
+        try:
+            async with session.get(f"http://127.0.0.1:{port}/") as response:
+                assert await response.text() == "ok"
+        finally:
+            await session.close()
+            await pool.close()
+            await runner.cleanup()
+        return pool.metrics
+
+    metrics = asyncio.new_event_loop().run_until_complete(main())
+    assert metrics.counters["bot_http_requests_total"] == {
+        (("host", "127.0.0.1"), ("status", "200")): 1
+    }
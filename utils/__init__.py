@@ -1,2 +1,2 @@
-from .logging import NoColorFormatter
+from .logging import NoColorFormatter, LogPipeline, LazyMessage, SamplingFilter
 from .text import indent, dedent, shorten, color, uncolor
@@ -0,0 +1,415 @@
+"""Cache shared by the cogs, in memory and optionally in Redis.
+
+Each process keeps the values it used in an LRU. With a Redis URL, the values
+are also stored in Redis, serialized with msgpack, so the other processes get
+them without calling the API again. Changing or deleting a key publishes it on
+a channel, and the other processes drop their copy."""
+
+from discord.backoff import ExponentialBackoff
+
+import asyncio
+import collections
+import logging
+import os
+import time
+import typing
+import urllib.parse
+import uuid
+
+import msgpack
+
+from .metrics import Metrics
+
+Value = typing.Any
+
+
+class CacheError(Exception):
+    pass
+
+
+# Redis being down, hanging or answering with an error
+ERRORS = (
+    OSError,
+    asyncio.IncompleteReadError,
+    asyncio.TimeoutError,
+    CacheError,
+)
+
+
+class LRUCache:
+    """Entries with a TTL, the least recently used are evicted when full"""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        # key: (expires at, value)
+        self.entries: typing.OrderedDict[
+            str, typing.Tuple[float, Value]
+        ] = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def get(self, key: str) -> typing.Optional[Value]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self.entries[key]
+            return None
+
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Value, ttl: float):
+        self.entries[key] = (time.monotonic() + ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def delete(self, key: str) -> bool:
+        return self.entries.pop(key, None) is not None
+
+    def clear(self):
+        self.entries.clear()
+
+
+# ------------------------------------------------------------------------------
+# Redis protocol
+
+
+def encode_command(*args) -> bytes:
+    """A command in the RESP format, as an array of bulk strings"""
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, str):
+            arg = arg.encode()
+        elif isinstance(arg, (int, float)):
+            arg = str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+async def read_reply(reader: asyncio.StreamReader):
+    """Read a RESP reply, errors are raised as `CacheError`"""
+    line = await reader.readline()
+    if not line:
+        raise ConnectionResetError("Redis closed the connection")
+
+    kind, payload = line[:1], line[1:-2]
+    if kind == b"+":
+        return payload.decode()
+    if kind == b"-":
+        raise CacheError(payload.decode())
+    if kind == b":":
+        return int(payload)
+    if kind == b"$":
+        length = int(payload)
+        if length == -1:
+            return None
+        return (await reader.readexactly(length + 2))[:-2]
+    if kind == b"*":
+        length = int(payload)
+        if length == -1:
+            return None
+        return [await read_reply(reader) for _ in range(length)]
+    raise CacheError(f"Unknown reply type {kind!r}")
+
+
+class RedisConnection:
+    """A connection to a Redis server, or anything speaking its protocol.
+
+    Commands are sent one at a time, or pipelined with `pipeline`. They
+    raise `CacheError` when Redis doesn't answer in `timeout` seconds,
+    connecting and waiting for the other commands included."""
+
+    def __init__(self, url: str, timeout: float = 0.5):
+        parsed = urllib.parse.urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+
+        self.reader: typing.Optional[asyncio.StreamReader] = None
+        self.writer: typing.Optional[asyncio.StreamWriter] = None
+        self.lock = asyncio.Lock()
+
+    @property
+    def connected(self) -> bool:
+        return self.writer is not None and not self.writer.is_closing()
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(
+            self.host, self.port
+        )
+        if self.password:
+            await self._pipeline([("AUTH", self.password)])
+        if self.db:
+            await self._pipeline([("SELECT", self.db)])
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    async def execute(self, *args):
+        return (await self.pipeline([args]))[0]
+
+    async def pipeline(self, commands: typing.List[tuple]) -> list:
+        """Send the commands at once and read their replies, reconnecting
+        if needed"""
+        try:
+            return await asyncio.wait_for(
+                self._locked_pipeline(commands), self.timeout
+            )
+        except asyncio.TimeoutError:
+            raise CacheError(f"no answer in {self.timeout:g}s") from None
+
+    async def _locked_pipeline(self, commands: typing.List[tuple]) -> list:
+        async with self.lock:
+            if not self.connected:
+                await self.connect()
+            try:
+                return await self._pipeline(commands)
+            except (
+                ConnectionError,
+                asyncio.IncompleteReadError,
+                asyncio.CancelledError,
+            ):
+                # Unread replies would be read by the next command, also
+                # when cancelled by the timeout
+                self.close()
+                raise
+
+    async def _pipeline(self, commands: typing.List[tuple]) -> list:
+        self.writer.write(b"".join(encode_command(*args) for args in commands))
+        await self.writer.drain()
+
+        replies = []
+        error = None
+        for _ in commands:
+            try:
+                replies.append(await read_reply(self.reader))
+            except CacheError as exc:
+                error = error or exc
+                replies.append(None)
+        if error is not None:
+            raise error
+        return replies
+
+
+class RedisCache:
+    """Values serialized with msgpack in Redis, and a channel to publish the
+    keys changed by a process"""
+
+    def __init__(
+        self,
+        url: str,
+        logger: logging.Logger,
+        *,
+        prefix: str = "cgbot:",
+        channel: str = "cgbot:invalidate",
+        timeout: float = 0.5,
+    ):
+        self.url = url
+        self.logger = logger
+        self.prefix = prefix
+        self.channel = channel
+        self.timeout = timeout
+        self.connection = RedisConnection(url, timeout)
+
+    async def get(
+        self, key: str
+    ) -> typing.Tuple[typing.Optional[Value], typing.Optional[float]]:
+        """The value and its remaining TTL in seconds, or `(None, None)`"""
+        data, ttl = await self.connection.pipeline(
+            [("GET", self.prefix + key), ("PTTL", self.prefix + key)]
+        )
+        if data is None:
+            return None, None
+        return msgpack.unpackb(data, raw=False), max(ttl, 0) / 1000
+
+    async def set(self, key: str, value: Value, ttl: float, message: str):
+        """Store a value and publish `message` on the channel"""
+        await self.connection.pipeline(
+            [
+                (
+                    "SET",
+                    self.prefix + key,
+                    msgpack.packb(value, use_bin_type=True),
+                    "PX",
+                    int(ttl * 1000),
+                ),
+                ("PUBLISH", self.channel, message),
+            ]
+        )
+
+    async def delete(self, key: str, message: str):
+        """Delete a value and publish `message` on the channel"""
+        await self.connection.pipeline(
+            [
+                ("DEL", self.prefix + key),
+                ("PUBLISH", self.channel, message),
+            ]
+        )
+
+    async def subscribe(self, callback: typing.Callable[[str], None]):
+        """Call `callback` with each message of the channel, reconnecting
+        until cancelled"""
+        backoff = ExponentialBackoff()
+        while True:
+            connection = RedisConnection(self.url, self.timeout)
+            try:
+                try:
+                    await asyncio.wait_for(
+                        self.start_subscription(connection), self.timeout
+                    )
+                except asyncio.TimeoutError:
+                    raise CacheError(
+                        f"no answer in {self.timeout:g}s"
+                    ) from None
+                self.logger.info(f"subscribed to `{self.channel}`")
+                while True:
+                    reply = await read_reply(connection.reader)
+                    if reply[0] == b"message":
+                        callback(reply[2].decode())
+            except ERRORS as error:
+                delay = backoff.delay()
+                self.logger.warning(
+                    f"cache subscription lost ({error}), retrying in "
+                    f"{delay:.1f}s"
+                )
+                await asyncio.sleep(delay)
+            finally:
+                connection.close()
+
+    async def start_subscription(self, connection: RedisConnection):
+        await connection.connect()
+        connection.writer.write(encode_command("SUBSCRIBE", self.channel))
+        await connection.writer.drain()
+        # The confirmation, the messages come after
+        await read_reply(connection.reader)
+
+    def close(self):
+        self.connection.close()
+
+
+# ------------------------------------------------------------------------------
+# Cache
+
+
+class Cache:
+    """The in-memory LRU, in front of Redis if there's a URL.
+
+    Redis errors are logged and treated as misses, the cache is never the
+    reason a command fails."""
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        *,
+        maxsize: int = 1024,
+        url: str = None,
+        timeout: float = 0.5,
+        metrics: Metrics = None,
+    ):
+        self.logger = logger
+        self.local = LRUCache(maxsize)
+        self.remote = RedisCache(url, logger, timeout=timeout) if url else None
+        self.metrics = metrics
+        # Ignore the invalidations published by this process
+        self.id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._task: typing.Optional[asyncio.Task] = None
+
+        if self.metrics is not None:
+            self.metrics.describe(
+                "bot_cache_requests_total",
+                "Cache lookups by layer and result",
+            )
+
+    def __len__(self) -> int:
+        return len(self.local)
+
+    def start(self):
+        if self.remote is not None and (
+            self._task is None or self._task.done()
+        ):
+            self._task = asyncio.ensure_future(
+                self.remote.subscribe(self.on_invalidate)
+            )
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.remote is not None:
+            self.remote.close()
+
+    def on_invalidate(self, message: str):
+        sender, _, key = message.partition(":")
+        if sender != self.id:
+            self.local.delete(key)
+
+    def count(self, layer: str, result: str):
+        if self.metrics is not None:
+            self.metrics.inc(
+                "bot_cache_requests_total", layer=layer, result=result
+            )
+
+    async def get(self, key: str) -> typing.Optional[Value]:
+        value = self.local.get(key)
+        self.count("local", "miss" if value is None else "hit")
+        if value is not None or self.remote is None:
+            return value
+
+        try:
+            value, ttl = await self.remote.get(key)
+        except ERRORS as error:
+            self.logger.warning(f"couldn't get `{key}` from Redis: {error}")
+            self.count("redis", "error")
+            return None
+
+        self.count("redis", "miss" if value is None else "hit")
+        if value is not None and ttl:
+            self.local.set(key, value, ttl)
+        return value
+
+    async def set(self, key: str, value: Value, ttl: float):
+        self.local.set(key, value, ttl)
+        if self.remote is None:
+            return
+
+        try:
+            await self.remote.set(key, value, ttl, f"{self.id}:{key}")
+        except ERRORS as error:
+            self.logger.warning(f"couldn't set `{key}` in Redis: {error}")
+
+    async def delete(self, key: str):
+        self.local.delete(key)
+        if self.remote is None:
+            return
+
+        try:
+            await self.remote.delete(key, f"{self.id}:{key}")
+        except ERRORS as error:
+            self.logger.warning(f"couldn't delete `{key}` in Redis: {error}")
+
+    async def get_or_set(
+        self,
+        key: str,
+        factory: typing.Callable[[], typing.Awaitable[Value]],
+        ttl: float,
+    ) -> Value:
+        """Get a value, or create it with `factory` and cache it. `None`
+        isn't cached"""
+        value = await self.get(key)
+        if value is None:
+            value = await factory()
+            if value is not None:
+                await self.set(key, value, ttl)
+        return value
@@ -0,0 +1,18 @@
+from discord.ext import commands
+
+from .outbox import Priority
+from .tracing import span
+
+
+class Context(commands.Context):
+    """Context of the commands, sending the replies first in the outbox and
+    timing them in the current trace"""
+
+    async def send(self, *args, **kwargs):
+        send = super().send
+        with span("send"):
+            return await self.bot.outbox.schedule(
+                self.channel.id,
+                Priority.INTERACTIVE,
+                lambda: send(*args, **kwargs),
+            )
@@ -0,0 +1,15 @@
+import os
+import sqlite3
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """Open the SQLite database at `path`, creating its folder if needed"""
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+
+    connection = sqlite3.connect(path, isolation_level=None)
+    connection.row_factory = sqlite3.Row
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
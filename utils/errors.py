@@ -0,0 +1,136 @@
+import hashlib
+import time
+import traceback
+import typing
+
+
+def fingerprint(
+    exception: BaseException,
+    stack: traceback.StackSummary = None,
+    frames: int = 3,
+) -> str:
+    """Identify an error by its type and the last `frames` of its stack"""
+    if stack is None:
+        stack = traceback.extract_tb(exception.__traceback__)
+    key = "|".join(
+        [type(exception).__qualname__]
+        + [
+            f"{frame.filename}:{frame.name}:{frame.lineno}"
+            for frame in stack[-frames:]
+        ]
+    )
+    return hashlib.sha1(key.encode()).hexdigest()[:12]
+
+
+def trim_traceback(stack: traceback.StackSummary, limit: int = 1024) -> str:
+    """Format the last frames of `stack` that fit in `limit` characters"""
+    frames = stack.format()
+    kept = []
+    length = 0
+
+    for frame in reversed(frames):
+        if length + len(frame) > limit:
+            break
+        kept.append(frame)
+        length += len(frame)
+
+    if not kept and frames:
+        # The last frame alone is too long, keep its end
+        return frames[-1][-limit:]
+
+    return "".join(reversed(kept))
+
+
+class ErrorStats:
+    __slots__ = (
+        "fingerprint",
+        "name",
+        "location",
+        "count",
+        "unreported",
+        "first_seen",
+        "last_seen",
+        "reported_at",
+    )
+
+    def __init__(self, fingerprint: str, name: str, location: str):
+        self.fingerprint = fingerprint
+        self.name = name
+        self.location = location
+        self.count = 0
+        # occurrences since the last report
+        self.unreported = 0
+        self.first_seen = self.last_seen = time.time()
+        self.reported_at: typing.Optional[float] = None
+
+
+class ErrorTracker:
+    """Counts errors by fingerprint, so each one is only reported once per
+    `window` and the rest are summed up in periodic digests"""
+
+    def __init__(self, window: float = 10 * 60, forget_after: float = 86400):
+        self.window = window
+        self.forget_after = forget_after
+        self._errors: typing.Dict[str, ErrorStats] = {}
+
+    def __len__(self) -> int:
+        return len(self._errors)
+
+    def record(
+        self, exception: BaseException, stack: traceback.StackSummary = None
+    ) -> typing.Tuple[ErrorStats, bool]:
+        """Count an error, and get whether it should be reported now"""
+        if stack is None:
+            stack = traceback.extract_tb(exception.__traceback__)
+
+        key = fingerprint(exception, stack)
+        stats = self._errors.get(key)
+        if stats is None:
+            location = (
+                'File "{0.filename}", line {0.lineno} in {0.name}'.format(
+                    stack[-1]
+                )
+                if stack
+                else "unknown"
+            )
+            stats = self._errors[key] = ErrorStats(
+                key, type(exception).__name__, location
+            )
+
+        now = time.time()
+        stats.count += 1
+        stats.unreported += 1
+        stats.last_seen = now
+
+        if stats.reported_at is None or now - stats.reported_at >= self.window:
+            stats.reported_at = now
+            return stats, True
+        return stats, False
+
+    def reported(self, stats: ErrorStats):
+        stats.unreported = 0
+
+    def digest(self) -> typing.List[typing.Tuple[ErrorStats, int]]:
+        """Get the errors that weren't reported yet with their number of
+        occurrences, most frequent first, and forget the ones that haven't
+        happened for a long time"""
+        now = time.time()
+        for key, stats in list(self._errors.items()):
+            if (
+                not stats.unreported
+                and now - stats.last_seen > self.forget_after
+            ):
+                del self._errors[key]
+
+        pending = sorted(
+            (
+                (stats, stats.unreported)
+                for stats in self._errors.values()
+                if stats.unreported
+            ),
+            key=lambda item: item[1],
+            reverse=True,
+        )
+        for stats, _ in pending:
+            stats.unreported = 0
+        return pending
@@ -0,0 +1,211 @@
+"""Connection pool shared by the HTTP clients of the bot.
+
+discord.py, the CodinGame client and the docs fetch all use the same
+`aiohttp.TCPConnector`, so the connections and resolved hosts are reused
+between them and limited in one place."""
+
+import aiohttp
+
+import asyncio
+import time
+import types
+import typing
+
+from .metrics import Metrics
+
+
+def reuse_rates(metrics: Metrics) -> typing.Dict[str, float]:
+    """Share of the connections that were kept alive, by host"""
+    counts: typing.Dict[str, typing.Dict[str, float]] = {}
+    for labels, value in metrics.counters.get(
+        "bot_http_connections_total", {}
+    ).items():
+        labels = dict(labels)
+        host = counts.setdefault(labels["host"], {"new": 0, "reused": 0})
+        host[labels["kind"]] += value
+    return {
+        host: kinds["reused"] / (kinds["new"] + kinds["reused"])
+        for host, kinds in counts.items()
+    }
+
+
+class SharedConnector(aiohttp.TCPConnector):
+    """A connector that isn't closed with the sessions using it.
+
+    discord.py creates its session with the default `connector_owner=True`
+    and closes it on each logout, the pool is closed with `shutdown`."""
+
+    def close(self) -> typing.Awaitable[None]:
+        return asyncio.sleep(0)
+
+    async def shutdown(self):
+        await super().close()
+
+
+class HTTPPool:
+    """The shared connector, and sessions using it whose connections and
+    requests are counted in the metrics"""
+
+    def __init__(
+        self,
+        metrics: Metrics,
+        *,
+        limit: int = 100,
+        limit_per_host: int = 30,
+        keepalive: float = 30.0,
+        dns_ttl: int = 300,
+        timeout: float = 30.0,
+        connect_timeout: float = 10.0,
+    ):
+        self.metrics = metrics
+        self.connector = SharedConnector(
+            limit=limit,
+            limit_per_host=limit_per_host,
+            keepalive_timeout=keepalive,
+            use_dns_cache=True,
+            ttl_dns_cache=dns_ttl,
+        )
+        self.timeout = aiohttp.ClientTimeout(
+            total=timeout, sock_connect=connect_timeout
+        )
+
+        self.trace_config = aiohttp.TraceConfig()
+        self.trace_config.on_request_start.append(self.on_request_start)
+        self.trace_config.on_request_end.append(self.on_request_end)
+        self.trace_config.on_request_exception.append(
+            self.on_request_exception
+        )
+        self.trace_config.on_connection_queued_start.append(
+            self.on_queued_start
+        )
+        self.trace_config.on_connection_queued_end.append(self.on_queued_end)
+        self.trace_config.on_connection_create_end.append(
+            self.on_connection_create_end
+        )
+        self.trace_config.on_connection_reuseconn.append(
+            self.on_connection_reuseconn
+        )
+        # Sessions freeze their trace configs, but it's also appended to the
+        # session of discord.py once created
+        self.trace_config.freeze()
+
+        self.metrics.describe(
+            "bot_http_requests_total", "HTTP requests by host and status"
+        )
+        self.metrics.describe(
+            "bot_http_connections_total",
+            "Connections used by the HTTP requests, new or reused",
+        )
+        self.metrics.describe(
+            "bot_http_pool_wait_seconds",
+            "Time the requests waited for a free connection",
+        )
+        self.metrics.gauge(
+            "bot_http_pool_connections",
+            lambda: {
+                (("state", state),): count
+                for state, count in self.usage().items()
+            },
+            "Connections of the shared pool, in use or idle, and its limit",
+        )
+
+    @property
+    def closed(self) -> bool:
+        return self.connector.closed
+
+    def session(self, **kwargs) -> aiohttp.ClientSession:
+        """A session using the pool, closing it leaves the pool open"""
+        kwargs.setdefault("timeout", self.timeout)
+        return aiohttp.ClientSession(
+            connector=self.connector,
+            connector_owner=False,
+            trace_configs=[self.trace_config],
+            **kwargs,
+        )
+
+    async def close(self):
+        await self.connector.shutdown()
+
+    def usage(self) -> typing.Dict[str, int]:
+        """Connections in use and idle, including the ones of discord.py"""
+        return {
+            "acquired": len(self.connector._acquired),
+            "idle": sum(len(conns) for conns in self.connector._conns.values()),
+            "limit": self.connector.limit,
+        }
+
+    # --------------------------------------------------------------------------
+    # Tracing
+
+    async def on_request_start(
+        self,
+        session: aiohttp.ClientSession,
+        context: types.SimpleNamespace,
+        params: aiohttp.TraceRequestStartParams,
+    ):
+        # The connection signals don't have the URL
+        context.host = params.url.host
+
+    async def on_request_end(
+        self,
+        session: aiohttp.ClientSession,
+        context: types.SimpleNamespace,
+        params: aiohttp.TraceRequestEndParams,
+    ):
+        self.metrics.inc(
+            "bot_http_requests_total",
+            host=context.host,
+            status=str(params.response.status),
+        )
+
+    async def on_request_exception(
+        self,
+        session: aiohttp.ClientSession,
+        context: types.SimpleNamespace,
+        params: aiohttp.TraceRequestExceptionParams,
+    ):
+        self.metrics.inc(
+            "bot_http_requests_total",
+            host=context.host,
+            status=type(params.exception).__name__,
+        )
+
+    async def on_queued_start(
+        self,
+        session: aiohttp.ClientSession,
+        context: types.SimpleNamespace,
+        params: aiohttp.TraceConnectionQueuedStartParams,
+    ):
+        context.queued_at = time.perf_counter()
+
+    async def on_queued_end(
+        self,
+        session: aiohttp.ClientSession,
+        context: types.SimpleNamespace,
+        params: aiohttp.TraceConnectionQueuedEndParams,
+    ):
+        self.metrics.observe(
+            "bot_http_pool_wait_seconds",
+            time.perf_counter() - context.queued_at,
+            host=context.host,
+        )
+
+    async def on_connection_create_end(
+        self,
+        session: aiohttp.ClientSession,
+        context: types.SimpleNamespace,
+        params: aiohttp.TraceConnectionCreateEndParams,
+    ):
+        self.metrics.inc(
+            "bot_http_connections_total", host=context.host, kind="new"
+        )
+
+    async def on_connection_reuseconn(
+        self,
+        session: aiohttp.ClientSession,
+        context: types.SimpleNamespace,
+        params: aiohttp.TraceConnectionReuseconnParams,
+    ):
+        self.metrics.inc(
+            "bot_http_connections_total", host=context.host, kind="reused"
+        )
@@ -0,0 +1,129 @@
+import builtins
+import importlib.util
+import os
+import sys
+import threading
+import time
+import types
+import typing
+
+
+def lazy_import(name: str) -> types.ModuleType:
+    """Import a module on the first access to one of its attributes.
+
+    Annotations using the module have to be strings, or they would import
+    it when the function is defined."""
+    if name in sys.modules:
+        return sys.modules[name]
+
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def process_uptime() -> float:
+    """Seconds since the process started, including the interpreter startup"""
+    try:
+        with open("/proc/self/stat") as file:
+            # The command name can contain spaces, it's between parentheses
+            fields = file.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as file:
+            uptime = float(file.read().split()[0])
+    except OSError:
+        return time.process_time()
+
+    # Field 22 of the stat file, the start time in clock ticks after boot
+    started = int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    return uptime - started
+
+
+class ImportRecord(typing.NamedTuple):
+    name: str
+    # In microseconds, like `python -X importtime`
+    self_time: int
+    cumulative: int
+    depth: int
+
+
+class ImportProfiler:
+    """Times the imports of new modules, like `python -X importtime` but
+    from inside the process.
+
+    `importlib.import_module` doesn't go through `__import__`, so the
+    extensions are timed by the bot's startup phase instead."""
+
+    def __init__(self):
+        self.records: typing.List[ImportRecord] = []
+        self._import = builtins.__import__
+        self._stack: typing.List[typing.List[int]] = []
+        self._thread_id: typing.Optional[int] = None
+
+    def start(self):
+        # Only the imports of the starting thread are timed
+        self._thread_id = threading.get_ident()
+        builtins.__import__ = self._timed_import
+
+    def stop(self):
+        builtins.__import__ = self._import
+
+    def _timed_import(
+        self, name, globals=None, locals=None, fromlist=(), level=0
+    ):
+        absolute = name
+        if level:
+            package = (globals or {}).get("__package__") or ""
+            try:
+                absolute = importlib.util.resolve_name(
+                    "." * level + name, package
+                )
+            except (ImportError, ValueError):
+                pass
+        if (
+            absolute in sys.modules
+            or threading.get_ident() != self._thread_id
+        ):
+            return self._import(name, globals, locals, fromlist, level)
+
+        # Time spent in nested imports, to get the self time
+        self._stack.append([0])
+        start = time.perf_counter()
+        try:
+            return self._import(name, globals, locals, fromlist, level)
+        finally:
+            cumulative = int((time.perf_counter() - start) * 1e6)
+            children = self._stack.pop()[0]
+            if self._stack:
+                self._stack[-1][0] += cumulative
+            self.records.append(
+                ImportRecord(
+                    absolute,
+                    cumulative - children,
+                    cumulative,
+                    len(self._stack),
+                )
+            )
+
+    def report(self, limit: int = 25) -> str:
+        """The slowest imports, in the format of `python -X importtime`"""
+        lines = ["import time: self [us] | cumulative | imported package"]
+        for record in sorted(
+            self.records, key=lambda record: record.cumulative, reverse=True
+        )[:limit]:
+            lines.append(
+                f"import time: {record.self_time:>9} | "
+                f"{record.cumulative:>10} | {'  ' * record.depth}{record.name}"
+            )
+        total = sum(
+            record.cumulative for record in self.records if not record.depth
+        )
+        lines.append(
+            f"{len(self.records)} imports timed, {total / 1e6:.3f}s in total"
+        )
+        return "\n".join(lines)
@@ -0,0 +1,186 @@
+import collections
+import datetime
+import sqlite3
+import time
+import typing
+
+ACTIONS = ("warn", "kick", "mute", "unmute", "ban", "unban")
+
+
+class Escalation(typing.NamedTuple):
+    """Action taken automatically once a user reaches the number of
+    infractions it's mapped from in `ESCALATIONS`"""
+
+    action: str
+    duration: typing.Optional[datetime.timedelta] = None
+
+
+class Infraction:
+    __slots__ = (
+        "id",
+        "guild_id",
+        "user_id",
+        "moderator_id",
+        "action",
+        "reason",
+        "created_at",
+        "duration",
+    )
+
+    def __init__(
+        self,
+        id: int,
+        guild_id: int,
+        user_id: int,
+        moderator_id: int,
+        action: str,
+        reason: typing.Optional[str],
+        created_at: float,
+        duration: typing.Optional[float] = None,
+    ):
+        self.id = id
+        self.guild_id = guild_id
+        self.user_id = user_id
+        self.moderator_id = moderator_id
+        self.action = action
+        self.reason = reason
+        self.created_at = created_at
+        self.duration = duration
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> "Infraction":
+        return cls(*row)
+
+    @property
+    def created(self) -> datetime.datetime:
+        return datetime.datetime.fromtimestamp(
+            self.created_at, datetime.timezone.utc
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"<Infraction id={self.id} action={self.action!r} "
+            f"user_id={self.user_id}>"
+        )
+
+
+class InfractionStore:
+    """Every moderation action, stored in SQLite and indexed by user.
+
+    The number of infractions of each user is cached in memory so the
+    escalation rules can be checked with dictionary lookups when an infraction
+    is recorded."""
+
+    def __init__(
+        self,
+        db: sqlite3.Connection,
+        escalations: typing.Dict[typing.Tuple[str, int], Escalation] = None,
+    ):
+        self.db = db
+        self.escalations = escalations or {}
+
+        self._counts: typing.Dict[
+            typing.Tuple[int, int], typing.Counter[str]
+        ] = collections.defaultdict(collections.Counter)
+
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS infractions ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "guild_id INTEGER NOT NULL, "
+            "user_id INTEGER NOT NULL, "
+            "moderator_id INTEGER NOT NULL, "
+            "action TEXT NOT NULL, "
+            "reason TEXT, "
+            "created_at REAL NOT NULL, "
+            "duration REAL)"
+        )
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS infractions_user "
+            "ON infractions (guild_id, user_id, created_at)"
+        )
+        self.load()
+
+    def __len__(self) -> int:
+        """Number of users with cached infraction counts"""
+        return len(self._counts)
+
+    def load(self):
+        """Cache the infraction counts of every user"""
+        self._counts.clear()
+        for guild_id, user_id, action, count in self.db.execute(
+            "SELECT guild_id, user_id, action, COUNT(*) FROM infractions "
+            "GROUP BY guild_id, user_id, action"
+        ):
+            self._counts[guild_id, user_id][action] = count
+
+    def add(
+        self,
+        guild_id: int,
+        user_id: int,
+        moderator_id: int,
+        action: str,
+        reason: str = None,
+        duration: datetime.timedelta = None,
+    ) -> typing.Tuple[Infraction, typing.Optional[Escalation]]:
+        """Record an infraction, and get the escalation it triggers if any"""
+        if action not in ACTIONS:
+            raise ValueError(f"Unknown infraction action: `{action}`")
+
+        infraction = Infraction(
+            None,
+            guild_id,
+            user_id,
+            moderator_id,
+            action,
+            reason,
+            time.time(),
+            duration.total_seconds() if duration else None,
+        )
+        cursor = self.db.execute(
+            "INSERT INTO infractions (guild_id, user_id, moderator_id, "
+            "action, reason, created_at, duration) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                infraction.guild_id,
+                infraction.user_id,
+                infraction.moderator_id,
+                infraction.action,
+                infraction.reason,
+                infraction.created_at,
+                infraction.duration,
+            ),
+        )
+        infraction.id = cursor.lastrowid
+
+        counts = self._counts[guild_id, user_id]
+        counts[action] += 1
+
+        return infraction, self.escalations.get((action, counts[action]))
+
+    def count(self, guild_id: int, user_id: int, action: str = None) -> int:
+        """Get the number of infractions of a user, of any or one action"""
+        counts = self._counts.get((guild_id, user_id))
+        if counts is None:
+            return 0
+        if action is None:
+            return sum(counts.values())
+        return counts[action]
+
+    def counts(self, guild_id: int, user_id: int) -> typing.Dict[str, int]:
+        """Get the number of infractions of a user for every action"""
+        return dict(self._counts.get((guild_id, user_id), {}))
+
+    def history(
+        self, guild_id: int, user_id: int, limit: int = 10, offset: int = 0
+    ) -> typing.List[Infraction]:
+        """Get the latest infractions of a user, newest first"""
+        return [
+            Infraction.from_row(row)
+            for row in self.db.execute(
+                "SELECT id, guild_id, user_id, moderator_id, action, reason, "
+                "created_at, duration FROM infractions "
+                "WHERE guild_id = ? AND user_id = ? "
+                "ORDER BY created_at DESC LIMIT ? OFFSET ?",
+                (guild_id, user_id, limit, offset),
+            )
+        ]
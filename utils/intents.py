@@ -0,0 +1,69 @@
+import discord
+
+import importlib
+import typing
+
+# What the bot itself needs to receive commands
+BASE_INTENTS = discord.Intents(
+    guilds=True, guild_messages=True, dm_messages=True
+)
+
+# Intent needed by each member cache flag
+CACHE_FLAG_INTENTS = {
+    "online": "presences",
+    "voice": "voice_states",
+    "joined": "members",
+}
+
+
+def enabled(flags: discord.flags.BaseFlags) -> typing.List[str]:
+    return [name for name, value in flags if value]
+
+
+def required_intents(
+    extensions: typing.Iterable[str],
+    *,
+    intents: typing.Dict[str, bool] = None,
+    member_cache: typing.Dict[str, bool] = None,
+    chunk_guilds: bool = None,
+    package: str = "cogs",
+) -> typing.Tuple[discord.Intents, discord.MemberCacheFlags, bool]:
+    """Get the intents, member cache flags and chunking policy needed by the
+    extensions, from the `INTENTS`, `MEMBER_CACHE` and `CHUNK_GUILDS`
+    attributes of their modules. Only the extensions in `package` are
+    imported, the third-party ones don't declare them.
+
+    `intents`, `member_cache` and `chunk_guilds` override the result, the
+    cache flags and chunking are disabled if their intent isn't enabled."""
+    required = discord.Intents._from_value(BASE_INTENTS.value)
+    cache_flags = discord.MemberCacheFlags.none()
+    chunk = False
+
+    for name in extensions:
+        if not name.startswith(package + "."):
+            continue
+
+        module = importlib.import_module(name)
+        module_intents: discord.Intents = getattr(module, "INTENTS", None)
+        if module_intents is not None:
+            required.value |= module_intents.value
+        module_cache: discord.MemberCacheFlags = getattr(
+            module, "MEMBER_CACHE", None
+        )
+        if module_cache is not None:
+            cache_flags.value |= module_cache.value
+        chunk = chunk or getattr(module, "CHUNK_GUILDS", False)
+
+    for flag, value in (intents or {}).items():
+        setattr(required, flag, value)
+    for flag, value in (member_cache or {}).items():
+        setattr(cache_flags, flag, value)
+    if chunk_guilds is not None:
+        chunk = chunk_guilds
+
+    for flag, intent in CACHE_FLAG_INTENTS.items():
+        if getattr(cache_flags, flag) and not getattr(required, intent):
+            setattr(cache_flags, flag, False)
+    chunk = chunk and required.members
+
+    return required, cache_flags, chunk
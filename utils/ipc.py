@@ -0,0 +1,308 @@
+"""Local message bus between the launcher and its cluster workers.
+
+Messages are JSON objects, one per line, over a Unix socket served by the
+launcher. A worker sends a `request` for a command, the launcher forwards it
+to every connected worker (including the sender) and answers with a `reply`
+mapping each cluster ID to the result of its handler."""
+
+from discord.backoff import ExponentialBackoff
+
+import asyncio
+import itertools
+import json
+import logging
+import os
+import typing
+
+# Stats payloads can be bigger than the default limit of 64 KiB
+LIMIT = 2 ** 22
+
+Handler = typing.Callable[..., typing.Awaitable[typing.Any]]
+
+
+class IPCError(Exception):
+    pass
+
+
+class Connection:
+    """JSON lines over a stream"""
+
+    __slots__ = ("reader", "writer")
+
+    def __init__(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        self.reader = reader
+        self.writer = writer
+
+    async def send(self, message: dict):
+        self.writer.write(json.dumps(message).encode() + b"\n")
+        await self.writer.drain()
+
+    async def receive(self) -> typing.Optional[dict]:
+        """The next message, or `None` once the connection is closed"""
+        line = await self.reader.readline()
+        if not line:
+            return None
+        return json.loads(line)
+
+    def close(self):
+        self.writer.close()
+
+
+class IPCServer:
+    """The bus, run by the launcher"""
+
+    def __init__(
+        self, path: str, logger: logging.Logger, *, timeout: float = 5.0
+    ):
+        self.path = path
+        self.logger = logger
+        self.timeout = timeout
+        self.server: typing.Optional[asyncio.AbstractServer] = None
+        self.clients: typing.Dict[int, Connection] = {}
+        self.ids = itertools.count()
+        # Forwarded requests waiting for the response of a cluster
+        self.waiting: typing.Dict[typing.Tuple[int, int], asyncio.Future] = {}
+
+    async def start(self):
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+        self.server = await asyncio.start_unix_server(
+            self.handle, self.path, limit=LIMIT
+        )
+        self.logger.info(f"IPC bus listening on {self.path}")
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        for client in self.clients.values():
+            client.close()
+        self.clients.clear()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    async def handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        connection = Connection(reader, writer)
+        cluster = None
+        try:
+            message = await connection.receive()
+            if message is None or message.get("op") != "identify":
+                return
+            cluster = message["cluster"]
+            self.clients[cluster] = connection
+            self.logger.info(f"cluster {cluster} connected to the IPC bus")
+
+            while True:
+                message = await connection.receive()
+                if message is None:
+                    break
+
+                if message["op"] == "request":
+                    asyncio.ensure_future(self.fan_out(connection, message))
+                elif message["op"] == "response":
+                    future = self.waiting.get((message["id"], cluster))
+                    if future is not None and not future.done():
+                        future.set_result(message.get("data"))
+        except (ConnectionError, ValueError) as error:
+            self.logger.warning(f"IPC connection of cluster {cluster}: {error}")
+        finally:
+            if cluster is not None and self.clients.get(cluster) is connection:
+                del self.clients[cluster]
+                self.logger.info(
+                    f"cluster {cluster} disconnected from the IPC bus"
+                )
+            connection.close()
+
+    async def fan_out(self, origin: Connection, message: dict):
+        """Forward a request to every cluster and reply with their results,
+        the clusters that don't answer in time are left out"""
+        request_id = next(self.ids)
+        loop = asyncio.get_event_loop()
+        futures = {}
+        for cluster, client in list(self.clients.items()):
+            futures[cluster] = self.waiting[request_id, cluster] = (
+                loop.create_future()
+            )
+            try:
+                await client.send(
+                    {
+                        "op": "request",
+                        "id": request_id,
+                        "command": message["command"],
+                        "args": message.get("args", {}),
+                    }
+                )
+            except ConnectionError:
+                futures[cluster].cancel()
+
+        if futures:
+            await asyncio.wait(futures.values(), timeout=self.timeout)
+        for cluster in futures:
+            del self.waiting[request_id, cluster]
+
+        try:
+            await origin.send(
+                {
+                    "op": "reply",
+                    "id": message["id"],
+                    "data": {
+                        str(cluster): future.result()
+                        for cluster, future in futures.items()
+                        if future.done() and not future.cancelled()
+                    },
+                }
+            )
+        except ConnectionError:
+            pass
+
+
+class IPCClient:
+    """Connection of a worker to the bus, reconnected until stopped.
+
+    `handlers` maps command names to coroutine functions called with the
+    arguments of the request, their results must be JSON serializable."""
+
+    def __init__(
+        self,
+        path: str,
+        cluster: int,
+        logger: logging.Logger,
+        *,
+        timeout: float = 10.0,
+    ):
+        self.path = path
+        self.cluster = cluster
+        self.logger = logger
+        self.timeout = timeout
+        self.handlers: typing.Dict[str, Handler] = {}
+        self.connection: typing.Optional[Connection] = None
+        self.ids = itertools.count()
+        self.replies: typing.Dict[int, asyncio.Future] = {}
+        self._task: typing.Optional[asyncio.Task] = None
+
+    @property
+    def connected(self) -> bool:
+        return self.connection is not None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    async def run(self):
+        backoff = ExponentialBackoff()
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(
+                    self.path, limit=LIMIT
+                )
+            except OSError as error:
+                delay = backoff.delay()
+                self.logger.warning(
+                    f"couldn't connect to the IPC bus ({error}), retrying in "
+                    f"{delay:.1f}s"
+                )
+                await asyncio.sleep(delay)
+                continue
+
+            connection = Connection(reader, writer)
+            try:
+                await connection.send(
+                    {"op": "identify", "cluster": self.cluster}
+                )
+                self.connection = connection
+                self.logger.info("connected to the IPC bus")
+                await self.listen(connection)
+            except (ConnectionError, ValueError) as error:
+                self.logger.warning(f"IPC connection lost: {error}")
+            finally:
+                self.connection = None
+                connection.close()
+                for future in self.replies.values():
+                    if not future.done():
+                        future.set_exception(
+                            IPCError("Disconnected from the IPC bus")
+                        )
+            await asyncio.sleep(backoff.delay())
+
+    async def listen(self, connection: Connection):
+        while True:
+            message = await connection.receive()
+            if message is None:
+                return
+
+            if message["op"] == "request":
+                asyncio.ensure_future(self.respond(connection, message))
+            elif message["op"] == "reply":
+                future = self.replies.get(message["id"])
+                if future is not None and not future.done():
+                    future.set_result(message["data"])
+
+    async def respond(self, connection: Connection, message: dict):
+        handler = self.handlers.get(message["command"])
+        try:
+            if handler is None:
+                raise IPCError(f"Unknown command `{message['command']}`")
+            data = await handler(**message["args"])
+        except Exception as error:
+            self.logger.exception(
+                f"IPC command `{message['command']}` failed"
+            )
+            data = {"error": f"{type(error).__name__}: {error}"}
+
+        try:
+            await connection.send(
+                {"op": "response", "id": message["id"], "data": data}
+            )
+        except ConnectionError:
+            pass
+
+    async def publish(self, command: str, **args):
+        """Run a command on every cluster without waiting for the results"""
+        if self.connection is None:
+            raise IPCError("Not connected to the IPC bus")
+
+        await self.connection.send(
+            {"op": "request", "id": None, "command": command, "args": args}
+        )
+
+    async def broadcast(
+        self, command: str, **args
+    ) -> typing.Dict[int, typing.Any]:
+        """Run a command on every cluster, get the results by cluster ID"""
+        if self.connection is None:
+            raise IPCError("Not connected to the IPC bus")
+
+        request_id = next(self.ids)
+        future = self.replies[request_id] = (
+            asyncio.get_event_loop().create_future()
+        )
+        try:
+            await self.connection.send(
+                {
+                    "op": "request",
+                    "id": request_id,
+                    "command": command,
+                    "args": args,
+                }
+            )
+            data = await asyncio.wait_for(future, self.timeout)
+        finally:
+            del self.replies[request_id]
+        return {int(cluster): result for cluster, result in data.items()}
@@ -1,19 +1,286 @@
+import concurrent.futures
+import datetime
+import gzip
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import random
+import shutil
+import time
+import typing
 
 from .text import uncolor
 
 
 class NoColorFormatter(logging.Formatter):
     def format(self, record):
-        record = logging.LogRecord(
+        return uncolor(super().format(record))
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as JSON lines, with the context passed with `extra`
+    as keys"""
+
+    FIELDS = ("guild_id", "channel_id", "user_id", "command")
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": datetime.datetime.fromtimestamp(
+                record.created, datetime.timezone.utc
+            ).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": uncolor(record.getMessage()),
+        }
+        for field in self.FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exception"] = record.exc_text
+
+        return json.dumps(data, ensure_ascii=False)
+
+
+class CompressingRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """Rotates the file when it gets bigger than `max_bytes` or older than
+    `interval` seconds, the rotated files are gzipped in a background thread"""
+
+    def __init__(
+        self,
+        filename: str,
+        *,
+        max_bytes: int = 0,
+        interval: float = 0,
+        backup_count: int = 10,
+        encoding: str = "utf-8",
+    ):
+        super().__init__(
+            filename,
+            mode="a",
+            maxBytes=max_bytes,
+            backupCount=backup_count,
+            encoding=encoding,
+        )
+        self.interval = interval
+        self.rollover_at = self.compute_rollover()
+        self.namer = lambda name: name + ".gz"
+        self.rotator = self.compress
+
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="log-compress"
+        )
+        self._compressing: typing.Optional[concurrent.futures.Future] = None
+
+    def compute_rollover(self, now: float = None) -> float:
+        """Get the end of the current `interval`, counted from the epoch so
+        daily files are rotated at midnight UTC even after a restart"""
+        if not self.interval:
+            return float("inf")
+
+        if now is None:
+            try:
+                now = os.stat(self.baseFilename).st_mtime
+            except OSError:
+                now = time.time()
+        return (now // self.interval + 1) * self.interval
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if time.time() >= self.rollover_at:
+            return True
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self):
+        # The previous file must be compressed before the backups are shifted
+        if self._compressing is not None:
+            self._compressing.result()
+
+        super().doRollover()
+        self.rollover_at = self.compute_rollover(time.time())
+
+    def compress(self, source: str, dest: str):
+        """Rename the file right away and gzip it in the background"""
+        if not os.path.exists(source):
+            return
+
+        uncompressed = dest[: -len(".gz")] if dest.endswith(".gz") else dest
+        os.replace(source, uncompressed)
+        self._compressing = self._executor.submit(
+            self._gzip, uncompressed, dest
+        )
+
+    @staticmethod
+    def _gzip(source: str, dest: str):
+        with open(source, "rb") as file, gzip.open(dest, "wb") as gzip_file:
+            shutil.copyfileobj(file, gzip_file)
+        os.remove(source)
+
+    def close(self):
+        super().close()
+        self._executor.shutdown(wait=True)
+
+
+class LazyMessage:
+    """Log message only built by `func(*args)` when a handler formats it"""
+
+    __slots__ = ("func", "args", "_text")
+
+    def __init__(self, func: typing.Callable[..., str], *args):
+        self.func = func
+        self.args = args
+        self._text: typing.Optional[str] = None
+
+    def __str__(self) -> str:
+        if self._text is None:
+            self._text = self.func(*self.args)
+        return self._text
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a fraction of the records of some channels or guilds, and caps
+    the bytes per second that get through.
+
+    Records need `guild_id`, `channel_id` and `size` attributes, passed with
+    the `extra` argument of the logging methods."""
+
+    def __init__(
+        self,
+        rates: typing.Dict[int, float] = None,
+        bytes_per_second: typing.Optional[int] = None,
+    ):
+        super().__init__()
+        self.rates = rates or {}
+        self.bytes_per_second = bytes_per_second
+
+        self.sampled_out = 0
+        self.capped = 0
+        self._allowance = float(bytes_per_second or 0)
+        self._last_check = time.monotonic()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rates = self.rates
+        if rates:
+            rate = rates.get(
+                getattr(record, "channel_id", None),
+                rates.get(getattr(record, "guild_id", None), 1.0),
+            )
+            if rate < 1.0 and random.random() >= rate:
+                self.sampled_out += 1
+                return False
+
+        if self.bytes_per_second:
+            # Token bucket refilled continuously, with one second of burst
+            now = time.monotonic()
+            self._allowance = min(
+                self._allowance
+                + (now - self._last_check) * self.bytes_per_second,
+                self.bytes_per_second,
+            )
+            self._last_check = now
+
+            size = getattr(record, "size", 0)
+            if size > self._allowance:
+                self.capped += 1
+                return False
+            self._allowance -= size
+
+        return True
+
+
+class LogQueueHandler(logging.handlers.QueueHandler):
+    """Puts the records in a bounded queue emptied by a `QueueListener`.
+
+    When the queue is full, records below `ERROR` are dropped with the `drop`
+    policy, every record waits for a free slot with the `block` policy."""
+
+    def __init__(self, queue_: queue.Queue, policy: str = "drop"):
+        super().__init__(queue_)
+        if policy not in ("drop", "block"):
+            raise ValueError(f"Unknown log queue policy: `{policy}`")
+
+        self.policy = policy
+        self.dropped = 0
+        self._unreported = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The queue never leaves the process, so the record is formatted by
+        # the handlers in the listener thread instead of here
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        if self.policy == "block" or record.levelno >= logging.ERROR:
+            self.queue.put(record)
+        else:
+            try:
+                self.queue.put_nowait(record)
+            except queue.Full:
+                self.dropped += 1
+                self._unreported += 1
+                return
+
+        if self._unreported:
+            try:
+                self.queue.put_nowait(self.dropped_record(record))
+            except queue.Full:
+                return
+            self._unreported = 0
+
+    def dropped_record(self, record: logging.LogRecord) -> logging.LogRecord:
+        return logging.LogRecord(
             record.name,
-            record.levelno,
-            record.pathname,
-            record.lineno,
-            uncolor(record.msg),
-            record.args,
-            record.exc_info,
-            record.funcName,
-            record.stack_info,
+            logging.WARNING,
+            __file__,
+            0,
+            f"log queue full, dropped {self._unreported} records",
+            None,
+            None,
         )
-        return super().format(record)
+
+
+class LogPipeline:
+    """Moves the handlers of a logger behind a bounded queue and a listener
+    thread, so slow disks or terminals don't block the event loop"""
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        handlers: typing.List[logging.Handler],
+        *,
+        maxsize: int = 10_000,
+        policy: str = "drop",
+    ):
+        self.logger = logger
+        self.handlers = handlers
+        self.queue: queue.Queue = queue.Queue(maxsize)
+        self.handler = LogQueueHandler(self.queue, policy)
+        self.listener = logging.handlers.QueueListener(
+            self.queue, *handlers, respect_handler_level=True
+        )
+        self.running = False
+
+    def start(self):
+        if self.running:
+            return
+
+        for handler in self.handlers:
+            self.logger.removeHandler(handler)
+        self.logger.addHandler(self.handler)
+        self.listener.start()
+        self.running = True
+
+    def stop(self):
+        """Flush the queue and attach the handlers directly to the logger"""
+        if not self.running:
+            return
+
+        self.logger.removeHandler(self.handler)
+        self.listener.stop()
+        for handler in self.handlers:
+            self.logger.addHandler(handler)
+        self.running = False
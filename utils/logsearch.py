@@ -0,0 +1,269 @@
+import glob
+import gzip
+import json
+import mmap
+import os
+import re
+import time
+import typing
+
+# [19/10/2021 13:37:00.000]     bot.command:     INFO: message
+RECORD_REGEX = re.compile(
+    rb"^\[(\d\d)/(\d\d)/(\d{4}) (\d\d):(\d\d):(\d\d)\.\d{3}\] *(\S+): *([A-Z]+): ",
+    re.MULTILINE,
+)
+LEVELS = {
+    "DEBUG": 1,
+    "INFO": 2,
+    "WARNING": 4,
+    "ERROR": 8,
+    "CRITICAL": 16,
+}
+BLOCK_SIZE = 64 * 1024
+INDEX_VERSION = 1
+
+
+def timestamp_key(match: typing.Match[bytes]) -> int:
+    """Sortable `YYYYmmddHHMMSS` key of the timestamp of a record"""
+    day, month, year, hour, minute, second = match.group(1, 2, 3, 4, 5, 6)
+    return int(year + month + day + hour + minute + second)
+
+
+def time_key(timestamp: float) -> int:
+    """Sortable key of a POSIX timestamp, in local time like the log files"""
+    return int(time.strftime("%Y%m%d%H%M%S", time.localtime(timestamp)))
+
+
+def level_mask(min_level: str = None) -> int:
+    """Bit mask of `min_level` and the levels above it"""
+    if min_level is None:
+        return sum(LEVELS.values())
+
+    value = LEVELS[min_level.upper()]
+    return sum(bit for bit in LEVELS.values() if bit >= value)
+
+
+class Block(typing.NamedTuple):
+    """Byte range of a log file, with the time range and levels it holds"""
+
+    start: int
+    end: int
+    first: int
+    last: int
+    levels: int
+
+
+class Result(typing.NamedTuple):
+    file: str
+    timestamp: int
+    text: str
+
+
+def index_blocks(
+    data: typing.Union[bytes, mmap.mmap],
+    start: int = 0,
+    block_size: int = BLOCK_SIZE,
+) -> typing.List[Block]:
+    """Split `data` into blocks of about `block_size` bytes on record
+    boundaries"""
+    blocks = []
+    block_start = None
+    first = last = levels = 0
+
+    for match in RECORD_REGEX.finditer(data, start):
+        if (
+            block_start is not None
+            and match.start() - block_start >= block_size
+        ):
+            blocks.append(
+                Block(block_start, match.start(), first, last, levels)
+            )
+            block_start = None
+
+        key = timestamp_key(match)
+        if block_start is None:
+            block_start = match.start()
+            first = key
+            levels = 0
+        last = key
+        levels |= LEVELS.get(match.group(8).decode(), 0)
+
+    if block_start is not None:
+        blocks.append(Block(block_start, len(data), first, last, levels))
+    return blocks
+
+
+class LogIndex:
+    """Sidecar index of the blocks of a log file, stored next to it as
+    `<file>.idx` and extended as the file grows"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.index_path = path + ".idx"
+
+    def load(self, data: mmap.mmap) -> typing.List[Block]:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as file:
+                index = json.load(file)
+        except (OSError, ValueError):
+            return []
+
+        # The file was rotated or truncated since it was indexed
+        if (
+            index.get("version") != INDEX_VERSION
+            or index["size"] > len(data)
+            or index["head"] != data[:64].hex()
+        ):
+            return []
+
+        return [Block(*block) for block in index["blocks"]]
+
+    def save(self, data: mmap.mmap, blocks: typing.List[Block]):
+        index = {
+            "version": INDEX_VERSION,
+            "size": len(data),
+            "head": data[:64].hex(),
+            "blocks": blocks,
+        }
+        with open(self.index_path, "w", encoding="utf-8") as file:
+            json.dump(index, file)
+
+    def update(self, data: mmap.mmap) -> typing.List[Block]:
+        """Get the blocks of the file, only indexing what was appended"""
+        blocks = self.load(data)
+        if blocks and blocks[-1].end == len(data):
+            return blocks
+
+        # The last block may have been incomplete, index it again
+        start = blocks.pop().start if blocks else 0
+        blocks += index_blocks(data, start)
+        try:
+            self.save(data, blocks)
+        except OSError:
+            pass
+        return blocks
+
+
+def log_files(name: str, folder: str = "log") -> typing.List[str]:
+    """Get the log file `name` and its rotated files, newest first"""
+
+    def rotation(path: str) -> int:
+        suffix = path[len(os.path.join(folder, name)) :].split(".")
+        return int(suffix[1]) if len(suffix) > 1 and suffix[1].isdigit() else 0
+
+    files = [
+        path
+        for path in glob.glob(os.path.join(folder, name) + "*")
+        if not path.endswith(".idx")
+    ]
+    return sorted(files, key=rotation)
+
+
+def search_data(
+    file: str,
+    data: typing.Union[bytes, mmap.mmap],
+    blocks: typing.List[Block],
+    pattern: typing.Pattern[bytes],
+    *,
+    since: int = None,
+    until: int = None,
+    levels: int = None,
+    logger: str = None,
+    limit: int = 100,
+) -> typing.List[Result]:
+    levels = levels or level_mask()
+    logger_bytes = logger.encode() if logger else None
+    results = []
+
+    for block in reversed(blocks):
+        if (
+            (since is not None and block.last < since)
+            or (until is not None and block.first > until)
+            or not block.levels & levels
+        ):
+            continue
+
+        # Most blocks don't match at all, skip them with a single search
+        chunk = data[block.start : block.end]
+        if not pattern.search(chunk):
+            continue
+
+        records = list(RECORD_REGEX.finditer(chunk))
+        ends = [record.start() for record in records[1:]] + [len(chunk)]
+
+        for record, end in zip(reversed(records), reversed(ends)):
+            key = timestamp_key(record)
+            name = record.group(7)
+            if (
+                (since is not None and key < since)
+                or (until is not None and key > until)
+                or not LEVELS.get(record.group(8).decode(), 0) & levels
+                or (
+                    logger_bytes is not None
+                    and name != logger_bytes
+                    and not name.startswith(logger_bytes + b".")
+                )
+            ):
+                continue
+
+            text = chunk[record.start() : end]
+            if pattern.search(text):
+                results.append(
+                    Result(file, key, text.decode("utf-8", "replace").rstrip())
+                )
+                if len(results) >= limit:
+                    return results
+
+    return results
+
+
+def search(
+    pattern: str,
+    *,
+    name: str = "root.log",
+    folder: str = "log",
+    since: float = None,
+    until: float = None,
+    min_level: str = None,
+    logger: str = None,
+    limit: int = 100,
+) -> typing.List[Result]:
+    """Search the log file `name` and its rotated files, newest first.
+
+    The current files are memory-mapped and only the blocks of their index
+    that can hold matching records are read. This is blocking, it should be
+    run in a thread."""
+    regex = re.compile(pattern.encode(), re.IGNORECASE)
+    options = dict(
+        since=since and time_key(since),
+        until=until and time_key(until),
+        levels=level_mask(min_level),
+        logger=logger,
+    )
+    results: typing.List[Result] = []
+
+    for path in log_files(name, folder):
+        remaining = limit - len(results)
+        if remaining <= 0:
+            break
+
+        if path.endswith(".gz"):
+            with gzip.open(path, "rb") as file:
+                data = file.read()
+            blocks = index_blocks(data)
+            results += search_data(
+                path, data, blocks, regex, limit=remaining, **options
+            )
+            continue
+
+        with open(path, "rb") as file:
+            if not os.fstat(file.fileno()).st_size:
+                continue
+
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                blocks = LogIndex(path).update(data)
+                results += search_data(
+                    path, data, blocks, regex, limit=remaining, **options
+                )
+
+    return results
@@ -0,0 +1,138 @@
+import asyncio
+import collections
+import logging
+import sqlite3
+import sys
+import threading
+import types
+import typing
+
+# Objects that are shared with the rest of the process, they aren't counted
+# in the size of a cache
+EXCLUDED_TYPES = (
+    type,
+    types.ModuleType,
+    types.FunctionType,
+    types.MethodType,
+    types.BuiltinFunctionType,
+    types.CodeType,
+    types.FrameType,
+    logging.Logger,
+    sqlite3.Connection,
+    asyncio.AbstractEventLoop,
+    asyncio.Future,
+    threading.Thread,
+)
+ATOMIC_TYPES = (str, bytes, bytearray, int, float, complex, bool, type(None))
+
+
+class CacheSize(typing.NamedTuple):
+    name: str
+    count: typing.Optional[int]
+    size: int
+
+
+def attributes(obj) -> typing.List:
+    """Values of the `__dict__` and `__slots__` of an object"""
+    values = list(getattr(obj, "__dict__", {}).values())
+    for cls in type(obj).__mro__:
+        for slot in getattr(cls, "__slots__", ()):
+            if slot in ("__dict__", "__weakref__"):
+                continue
+            try:
+                values.append(getattr(obj, slot))
+            except AttributeError:
+                pass
+    return values
+
+
+def approximate_size(
+    obj,
+    *,
+    exclude: typing.Tuple[type, ...] = (),
+    ignore: typing.Iterable[int] = (),
+    sample: int = 100,
+    max_depth: int = 8,
+) -> int:
+    """Approximate deep size of `obj` in bytes.
+
+    Objects referenced more than once are counted once, objects of the
+    `exclude` types or whose `id` is in `ignore` aren't counted, and
+    containers bigger than `sample` have the size of their items
+    extrapolated from `sample` of them."""
+    exclude = EXCLUDED_TYPES + tuple(exclude)
+    seen: typing.Set[int] = set(ignore)
+
+    def size(obj, depth: int) -> float:
+        if id(obj) in seen or isinstance(obj, exclude) or depth > max_depth:
+            return 0
+        seen.add(id(obj))
+
+        total = sys.getsizeof(obj, 0)
+        if isinstance(obj, ATOMIC_TYPES):
+            return total
+
+        # Dictionaries have (key, value) children
+        if isinstance(obj, dict):
+            children = list(obj.items())
+        elif isinstance(
+            obj, (list, tuple, set, frozenset, collections.deque)
+        ):
+            children = [(child,) for child in obj]
+        else:
+            children = [(child,) for child in attributes(obj)]
+
+        def children_size(children: typing.List[tuple]) -> float:
+            return sum(
+                size(child, depth + 1) for item in children for child in item
+            )
+
+        if len(children) > sample:
+            step = len(children) / sample
+            sampled = [children[int(i * step)] for i in range(sample)]
+            return total + len(children) / sample * children_size(sampled)
+        return total + children_size(children)
+
+    return int(size(obj, 0))
+
+
+def cache_sizes(
+    caches: typing.Dict[str, typing.Any],
+    *,
+    exclude: typing.Tuple[type, ...] = (),
+    ignore: typing.Iterable[int] = (),
+) -> typing.List[CacheSize]:
+    """Number of items and approximate size of caches, biggest first.
+
+    The objects in several caches are only counted in the first one, a
+    cache referencing another one doesn't count it, and the `ignore`
+    objects aren't counted."""
+    ignore = set(ignore)
+    items = {
+        name: {id(item) for item in cache}
+        if isinstance(cache, (list, tuple, set, frozenset))
+        else {id(cache)}
+        for name, cache in caches.items()
+    }
+
+    sizes = []
+    counted = set(ignore)
+    for name, cache in caches.items():
+        try:
+            count = len(cache)
+        except TypeError:
+            count = None
+
+        others = {id(other) for other in caches.values() if other is not cache}
+        size = approximate_size(cache, exclude=exclude, ignore=counted | others)
+        sizes.append(CacheSize(name, count, size))
+        counted |= items[name]
+    return sorted(sizes, key=lambda cache: cache.size, reverse=True)
+
+
+def format_bytes(size: float) -> str:
+    for unit in ("B", "KiB", "MiB"):
+        if abs(size) < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
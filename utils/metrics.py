@@ -0,0 +1,339 @@
+import asyncio
+import bisect
+import contextlib
+import logging
+import time
+import typing
+
+# Upper bounds in seconds, the last bucket is `+Inf`
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+Labels = typing.Tuple[typing.Tuple[str, str], ...]
+
+
+def escape(value) -> str:
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace('"', '\\"')
+        .replace("\n", "\\n")
+    )
+
+
+def format_labels(labels: Labels, **extra) -> str:
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ""
+    return (
+        "{"
+        + ",".join(f'{name}="{escape(value)}"' for name, value in pairs)
+        + "}"
+    )
+
+
+class Histogram:
+    """Fixed-bucket histogram, like the Prometheus one"""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: typing.Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Approximate quantile, as the upper bound of its bucket"""
+        if not self.count:
+            return 0.0
+
+        rank = q * self.count
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                break
+        return (
+            self.buckets[index] if index < len(self.buckets) else float("inf")
+        )
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def merge(self, other: "Histogram"):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.sum += other.sum
+        self.count += other.count
+
+
+class Summary(typing.NamedTuple):
+    """Histograms of a label value, all statuses merged"""
+
+    name: str
+    histogram: Histogram
+    errors: int
+
+
+class Metrics:
+    """Registry of counters, histograms and gauges, rendered in the
+    Prometheus text format"""
+
+    def __init__(self):
+        self.histograms: typing.Dict[
+            str, typing.Dict[Labels, Histogram]
+        ] = {}
+        self.counters: typing.Dict[str, typing.Dict[Labels, float]] = {}
+        self.gauges: typing.Dict[
+            str,
+            typing.Callable[
+                [], typing.Union[float, typing.Dict[Labels, float]]
+            ],
+        ] = {}
+        self.descriptions: typing.Dict[str, str] = {}
+
+    def describe(self, name: str, description: str):
+        self.descriptions[name] = description
+
+    def inc(self, name: str, value: float = 1, **labels):
+        counter = self.counters.setdefault(name, {})
+        key = tuple(labels.items())
+        counter[key] = counter.get(key, 0) + value
+
+    def observe(
+        self,
+        name: str,
+        value: float,
+        *,
+        buckets: typing.Sequence[float] = DEFAULT_BUCKETS,
+        **labels,
+    ):
+        histograms = self.histograms.setdefault(name, {})
+        key = tuple(labels.items())
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = Histogram(buckets)
+        histogram.observe(value)
+
+    def gauge(
+        self,
+        name: str,
+        callback: typing.Callable[
+            [], typing.Union[float, typing.Dict[Labels, float]]
+        ],
+        description: str = None,
+    ):
+        """Register a gauge whose value(s) are computed when rendering"""
+        self.gauges[name] = callback
+        if description:
+            self.describe(name, description)
+
+    @contextlib.contextmanager
+    def time(self, name: str, **labels):
+        """Time the block into the `name` histogram, with a `status` label
+        set to `success` or `error`"""
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.observe(
+                name, time.perf_counter() - start, **labels, status="error"
+            )
+            raise
+        else:
+            self.observe(
+                name, time.perf_counter() - start, **labels, status="success"
+            )
+
+    def summarize(self, name: str, label: str) -> typing.List[Summary]:
+        """Merge the `name` histograms by the value of `label`, busiest
+        first"""
+        merged: typing.Dict[str, Histogram] = {}
+        errors: typing.Dict[str, int] = {}
+
+        for labels, histogram in self.histograms.get(name, {}).items():
+            values = dict(labels)
+            key = values.get(label, "")
+            if key not in merged:
+                merged[key] = Histogram(histogram.buckets)
+                errors[key] = 0
+            merged[key].merge(histogram)
+            if values.get("status") == "error":
+                errors[key] += histogram.count
+
+        return sorted(
+            (Summary(key, merged[key], errors[key]) for key in merged),
+            key=lambda summary: summary.histogram.count,
+            reverse=True,
+        )
+
+    def dump(self) -> dict:
+        """The counters and histograms as JSON, to be merged into another
+        registry with `load`"""
+        return {
+            "counters": {
+                name: [
+                    [list(labels), value] for labels, value in counter.items()
+                ]
+                for name, counter in self.counters.items()
+            },
+            "histograms": {
+                name: [
+                    [
+                        list(labels),
+                        list(histogram.buckets),
+                        histogram.counts,
+                        histogram.sum,
+                        histogram.count,
+                    ]
+                    for labels, histogram in histograms.items()
+                ]
+                for name, histograms in self.histograms.items()
+            },
+        }
+
+    def load(self, data: dict):
+        """Add the counters and histograms dumped by another registry"""
+        for name, values in data.get("counters", {}).items():
+            counter = self.counters.setdefault(name, {})
+            for labels, value in values:
+                key = tuple(tuple(pair) for pair in labels)
+                counter[key] = counter.get(key, 0) + value
+
+        for name, values in data.get("histograms", {}).items():
+            histograms = self.histograms.setdefault(name, {})
+            for labels, buckets, counts, total, count in values:
+                key = tuple(tuple(pair) for pair in labels)
+                if key not in histograms:
+                    histograms[key] = Histogram(tuple(buckets))
+                other = Histogram(tuple(buckets))
+                other.counts, other.sum, other.count = counts, total, count
+                histograms[key].merge(other)
+
+    def render(self) -> str:
+        lines = []
+
+        def header(name: str, metric_type: str):
+            if name in self.descriptions:
+                lines.append(f"# HELP {name} {self.descriptions[name]}")
+            lines.append(f"# TYPE {name} {metric_type}")
+
+        for name, counter in sorted(self.counters.items()):
+            header(name, "counter")
+            for labels, value in counter.items():
+                lines.append(f"{name}{format_labels(labels)} {value}")
+
+        for name, callback in sorted(self.gauges.items()):
+            try:
+                values = callback()
+            except Exception:
+                continue
+            header(name, "gauge")
+            if not isinstance(values, dict):
+                values = {(): values}
+            for labels, value in values.items():
+                lines.append(f"{name}{format_labels(labels)} {value}")
+
+        for name, histograms in sorted(self.histograms.items()):
+            header(name, "histogram")
+            for labels, histogram in histograms.items():
+                cumulative = 0
+                for bound, count in zip(
+                    list(histogram.buckets) + ["+Inf"], histogram.counts
+                ):
+                    cumulative += count
+                    lines.append(
+                        f"{name}_bucket{format_labels(labels, le=bound)} "
+                        f"{cumulative}"
+                    )
+                lines.append(
+                    f"{name}_sum{format_labels(labels)} {histogram.sum}"
+                )
+                lines.append(
+                    f"{name}_count{format_labels(labels)} {histogram.count}"
+                )
+
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """Minimal HTTP server exposing the metrics on `GET /metrics`"""
+
+    def __init__(
+        self,
+        metrics: Metrics,
+        host: str = "127.0.0.1",
+        port: int = 9100,
+        logger: logging.Logger = None,
+    ):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self.logger = logger or logging.getLogger(__name__)
+        self.server: typing.Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        if self.server is not None:
+            return
+        self.server = await asyncio.start_server(
+            self.handle, self.host, self.port
+        )
+        self.logger.info(
+            f"serving metrics on http://{self.host}:{self.port}/metrics"
+        )
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5)
+            # Skip the headers
+            while (await asyncio.wait_for(reader.readline(), 5)).strip():
+                pass
+
+            parts = request.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1] in (
+                "/",
+                "/metrics",
+            ):
+                status = "200 OK"
+                body = self.metrics.render().encode()
+            else:
+                status = "404 Not Found"
+                body = b"Not found\n"
+
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,189 @@
+import asyncio
+import collections
+import logging
+import sys
+import threading
+import time
+import traceback
+import typing
+
+from .metrics import Metrics
+
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Block(typing.NamedTuple):
+    """The event loop was blocked, with the stack of what blocked it"""
+
+    started_at: float
+    duration: float
+    stack: traceback.StackSummary
+
+
+class LoopMonitor:
+    """Measures the lag of the event loop with a heartbeat task, and captures
+    the stack of the loop thread from a watchdog thread when the heartbeat is
+    late by more than `threshold`"""
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        metrics: Metrics,
+        logger: logging.Logger,
+        *,
+        interval: float = 0.5,
+        threshold: float = 0.25,
+        debug: bool = False,
+        window: int = 600,
+        blocks: int = 20,
+        alert_threshold: float = 1.0,
+        alert_interval: float = 15 * 60,
+        on_alert: typing.Callable[
+            [float, typing.List[Block]], typing.Awaitable
+        ] = None,
+    ):
+        self.loop = loop
+        self.metrics = metrics
+        self.logger = logger
+        self.interval = interval
+        self.threshold = threshold
+        self.debug = debug
+        self.alert_threshold = alert_threshold
+        self.alert_interval = alert_interval
+        self.on_alert = on_alert
+        self._alerted_at: typing.Optional[float] = None
+
+        # Lag of the last `window` heartbeats, for the percentiles
+        self.lags: typing.Deque[float] = collections.deque(maxlen=window)
+        self.blocks: typing.Deque[Block] = collections.deque(maxlen=blocks)
+        self.pending_blocks: typing.List[Block] = []
+
+        self._beat = time.monotonic()
+        self._loop_thread_id: typing.Optional[int] = None
+        self._task: typing.Optional[asyncio.Task] = None
+        self._thread: typing.Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+
+        self.metrics.gauge(
+            "bot_loop_lag_p99_seconds",
+            lambda: self.percentile(0.99),
+            "99th percentile of the event loop lag over the last heartbeats",
+        )
+        self.metrics.describe(
+            "bot_loop_lag_seconds", "Lag of the event loop heartbeat"
+        )
+        self.metrics.describe(
+            "bot_loop_blocks_total",
+            "Number of times the event loop was blocked",
+        )
+        # Created here since the watchdog thread can't add it while rendering
+        self.metrics.inc("bot_loop_blocks_total", 0)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def percentile(self, q: float) -> float:
+        if not self.lags:
+            return 0.0
+        lags = sorted(self.lags)
+        return lags[min(int(q * len(lags)), len(lags) - 1)]
+
+    def start(self):
+        if self.running:
+            return
+
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopped.clear()
+
+        if self.debug:
+            # asyncio logs the callbacks slower than this on the `asyncio`
+            # logger, debug mode has an overhead so it's opt-in
+            self.loop.set_debug(True)
+            self.loop.slow_callback_duration = self.threshold
+
+        self._task = self.loop.create_task(self.heartbeat())
+        self._thread = threading.Thread(
+            target=self.watchdog, name="loop-watchdog", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.debug:
+            self.loop.set_debug(False)
+
+    async def heartbeat(self):
+        while True:
+            start = self.loop.time()
+            self._beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+            lag = max(self.loop.time() - start - self.interval, 0.0)
+            self.lags.append(lag)
+            self.metrics.observe(
+                "bot_loop_lag_seconds", lag, buckets=LAG_BUCKETS
+            )
+            self.check_alert()
+
+    def check_alert(self):
+        """Alert when the loop was blocked or the p99 lag is too high, at
+        most once per `alert_interval`"""
+        if self.on_alert is None or not (
+            self.pending_blocks or self.percentile(0.99) >= self.alert_threshold
+        ):
+            return
+
+        now = time.monotonic()
+        if (
+            self._alerted_at is not None
+            and now - self._alerted_at < self.alert_interval
+        ):
+            return
+
+        self._alerted_at = now
+        self.loop.create_task(
+            self.on_alert(self.percentile(0.99), self.pop_blocks())
+        )
+
+    def watchdog(self):
+        """Runs in a thread, captures the stack of the loop thread once per
+        blocked heartbeat"""
+        captured_beat = None
+        while not self._stopped.wait(self.threshold / 2):
+            beat = self._beat
+            late = time.monotonic() - beat - self.interval
+            if late < self.threshold or beat == captured_beat:
+                continue
+
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+
+            captured_beat = beat
+            stack = traceback.extract_stack(frame)
+            block = Block(
+                time.time() - late,
+                late,
+                traceback.StackSummary.from_list(stack[-20:]),
+            )
+            with self._lock:
+                self.blocks.append(block)
+                self.pending_blocks.append(block)
+
+            self.metrics.inc("bot_loop_blocks_total")
+            self.logger.warning(
+                f"event loop blocked for more than {late:.2f}s in:\n"
+                + "".join(block.stack.format()[-5:])
+            )
+
+    def pop_blocks(self) -> typing.List[Block]:
+        """Get the blocks captured since the last call"""
+        with self._lock:
+            blocks, self.pending_blocks = self.pending_blocks, []
+        return blocks
@@ -0,0 +1,262 @@
+"""Scheduler of the messages sent by the bot.
+
+Without it, the log listeners, the moderation logs, the error DMs and the
+command replies all wait on discord.py's rate limits in the order they were
+sent, so a burst of logs delays the replies. Here each channel has a queue,
+and the most urgent message of the channels that aren't rate limited is sent
+first, with a slot kept for the command replies."""
+
+import discord
+
+import asyncio
+import enum
+import heapq
+import itertools
+import logging
+import time
+import typing
+
+from .metrics import Metrics
+
+# How often the channels waiting for their rate limit are checked, discord.py
+# doesn't tell when it releases them
+RATE_LIMIT_POLL = 0.1
+
+Key = typing.Hashable
+
+
+class Priority(enum.IntEnum):
+    INTERACTIVE = 0  # command replies
+    MODERATION = 1  # mod log and DMs to the sanctioned users
+    SERVER_LOG = 2
+    DIAGNOSTICS = 3  # errors and alerts DMed to the owner
+
+
+class Send:
+    """A message waiting in the queue of its channel"""
+
+    __slots__ = ("priority", "id", "send", "future", "queued_at")
+
+    def __init__(
+        self,
+        priority: Priority,
+        id: int,
+        send: typing.Callable[[], typing.Awaitable[typing.Any]],
+        future: asyncio.Future,
+    ):
+        self.priority = priority
+        self.id = id
+        self.send = send
+        self.future = future
+        self.queued_at = time.perf_counter()
+
+    def __lt__(self, other: "Send") -> bool:
+        return (self.priority, self.id) < (other.priority, other.id)
+
+
+def channel_key(destination: discord.abc.Messageable) -> Key:
+    """The channel a message to `destination` is sent in, the DM channel of
+    a user is only known once it's created"""
+    if isinstance(destination, discord.abc.User):
+        channel = destination.dm_channel
+        return channel.id if channel is not None else ("user", destination.id)
+    return destination.id
+
+
+class Outbox:
+    """Per-channel queues of messages sent by priority.
+
+    A channel sends one message at a time, and waits while its rate limit
+    bucket is exhausted without taking a slot. At most `concurrency`
+    messages are sent at once, `reserved` of these slots are only used by
+    the command replies."""
+
+    def __init__(
+        self,
+        http: discord.http.HTTPClient,
+        metrics: Metrics,
+        logger: logging.Logger,
+        *,
+        concurrency: int = 5,
+        reserved: int = 1,
+    ):
+        self.http = http
+        self.metrics = metrics
+        self.logger = logger
+        self.concurrency = concurrency
+        self.reserved = reserved
+
+        self.queues: typing.Dict[Key, typing.List[Send]] = {}
+        # Channels with a message being sent
+        self.sending: typing.Set[Key] = set()
+        self.deliveries: typing.Set[asyncio.Task] = set()
+        self.ids = itertools.count()
+        self.wakeup = asyncio.Event()
+        self._task: typing.Optional[asyncio.Task] = None
+
+        self.metrics.describe(
+            "bot_send_duration_seconds",
+            "Time to send a message by priority, queueing included",
+        )
+        self.metrics.describe(
+            "bot_send_wait_seconds", "Time the messages waited in the queue"
+        )
+        self.metrics.gauge(
+            "bot_send_queue_length",
+            self.queue_lengths,
+            "Messages waiting to be sent by priority",
+        )
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self.run())
+
+    async def stop(self, timeout: float = 10.0):
+        """Stop scheduling, send the queued messages right away and wait up
+        to `timeout` for the messages being sent"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for queue in self.queues.values():
+            for send in queue:
+                if not send.future.done():
+                    self.start_delivery(None, send)
+        self.queues.clear()
+
+        if not self.deliveries:
+            return
+        _, pending = await asyncio.wait(self.deliveries, timeout=timeout)
+        if pending:
+            self.logger.warning(
+                f"{len(pending)} messages still being sent after "
+                f"{timeout:g}s, cancelling them"
+            )
+            for task in pending:
+                task.cancel()
+
+    def queue_lengths(self) -> typing.Dict[tuple, float]:
+        lengths = {
+            (("priority", priority.name.lower()),): 0 for priority in Priority
+        }
+        for queue in self.queues.values():
+            for send in queue:
+                lengths[(("priority", send.priority.name.lower()),)] += 1
+        return lengths
+
+    async def send(
+        self,
+        destination: discord.abc.Messageable,
+        priority: Priority,
+        *args,
+        **kwargs,
+    ) -> discord.Message:
+        """`destination.send`, scheduled with `priority`"""
+        return await self.schedule(
+            channel_key(destination),
+            priority,
+            lambda: destination.send(*args, **kwargs),
+        )
+
+    async def schedule(
+        self,
+        key: Key,
+        priority: Priority,
+        send: typing.Callable[[], typing.Awaitable[typing.Any]],
+    ) -> typing.Any:
+        """Call `send` when it's the turn of the message, and return its
+        result. Called directly when the outbox isn't running"""
+        if self._task is None:
+            return await send()
+
+        future = asyncio.get_event_loop().create_future()
+        heapq.heappush(
+            self.queues.setdefault(key, []),
+            Send(priority, next(self.ids), send, future),
+        )
+        self.wakeup.set()
+        # Cancelling the caller cancels the future, the message is skipped
+        return await future
+
+    def rate_limited(self, key: Key) -> bool:
+        """Whether discord.py holds the bucket of the channel's messages"""
+        lock = self.http._locks.get(
+            f"{key}:None:/channels/{{channel_id}}/messages"
+        )
+        return lock is not None and lock.locked()
+
+    async def run(self):
+        while True:
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.start_sends())
+            except asyncio.TimeoutError:
+                pass
+
+    def start_sends(self) -> typing.Optional[float]:
+        """Start the most urgent messages that can be sent, returns how long
+        to wait before checking the rate limited channels again"""
+        if not self.http._global_over.is_set():
+            return RATE_LIMIT_POLL
+
+        waiting = False
+        while len(self.sending) < self.concurrency:
+            best: typing.Optional[Key] = None
+            for key, queue in list(self.queues.items()):
+                while queue and queue[0].future.done():
+                    heapq.heappop(queue)
+                if not queue:
+                    del self.queues[key]
+                elif key in self.sending:
+                    continue
+                elif self.rate_limited(key):
+                    waiting = True
+                elif best is None or queue[0] < self.queues[best][0]:
+                    best = key
+
+            if best is None:
+                break
+            queue = self.queues[best]
+            if (
+                queue[0].priority != Priority.INTERACTIVE
+                and len(self.sending) >= self.concurrency - self.reserved
+            ):
+                break
+
+            send = heapq.heappop(queue)
+            if not queue:
+                del self.queues[best]
+            self.sending.add(best)
+            self.start_delivery(best, send)
+
+        return RATE_LIMIT_POLL if waiting else None
+
+    def start_delivery(self, key: typing.Optional[Key], send: Send):
+        task = asyncio.ensure_future(self.deliver(key, send))
+        self.deliveries.add(task)
+        task.add_done_callback(self.deliveries.discard)
+
+    async def deliver(self, key: typing.Optional[Key], send: Send):
+        started = time.perf_counter()
+        priority = send.priority.name.lower()
+        self.metrics.observe(
+            "bot_send_wait_seconds", started - send.queued_at, priority=priority
+        )
+        try:
+            result = await send.send()
+        except asyncio.CancelledError:
+            send.future.cancel()
+            raise
+        except Exception as error:
+            if not send.future.done():
+                send.future.set_exception(error)
+        else:
+            if not send.future.done():
+                send.future.set_result(result)
+        finally:
+            self.sending.discard(key)
+            self.wakeup.set()
+            self.metrics.observe(
+                "bot_send_duration_seconds",
+                time.perf_counter() - send.queued_at,
+                priority=priority,
+            )
@@ -0,0 +1,132 @@
+import collections
+import os
+import sys
+import threading
+import time
+import types
+import typing
+
+
+def short_path(filename: str) -> str:
+    """Path of a source file relative to the bot or to its site-packages"""
+    for marker in ("site-packages" + os.sep, "lib" + os.sep + "python"):
+        index = filename.rfind(marker)
+        if index != -1:
+            return filename[index + len(marker) :]
+    try:
+        return os.path.relpath(filename)
+    except ValueError:
+        return filename
+
+
+class StackSampler:
+    """Samples the stacks of the threads of the process from a background
+    thread every `interval` seconds, without tracing every call like
+    `cProfile` does.
+
+    The stacks are aggregated in the collapsed format of `flamegraph.pl` and
+    speedscope: one `frame;frame;frame count` line per distinct stack."""
+
+    def __init__(self, interval: float = 0.005, max_depth: int = 128):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks: typing.Counter[typing.Tuple[str, ...]] = (
+            collections.Counter()
+        )
+        self.samples = 0
+        self.started_at: typing.Optional[float] = None
+        self.duration = 0.0
+        # CPU time spent by the sampler thread itself
+        self.overhead = 0.0
+
+        self._labels: typing.Dict[types.CodeType, str] = {}
+        self._stopped = threading.Event()
+        self._thread: typing.Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def overhead_ratio(self) -> float:
+        """CPU time of the sampler over the profiled wall time"""
+        return self.overhead / self.duration if self.duration else 0.0
+
+    def label(self, code: types.CodeType) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = (
+                f"{code.co_name} "
+                f"({short_path(code.co_filename)}:{code.co_firstlineno})"
+            )
+        return label
+
+    def start(self):
+        if self.running:
+            return
+        self._stopped.clear()
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(
+            target=self.run, name="stack-sampler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def run(self):
+        own_id = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        start_cpu = time.thread_time()
+
+        while not self._stopped.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    stack.append(self.label(frame.f_code))
+                    frame = frame.f_back
+
+                if thread_id not in names:
+                    names = {
+                        thread.ident: thread.name
+                        for thread in threading.enumerate()
+                    }
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[tuple(reversed(stack))] += 1
+            self.samples += 1
+
+        self.overhead = time.thread_time() - start_cpu
+        self.duration = time.perf_counter() - self.started_at
+
+    def collapsed(self) -> str:
+        """The stacks in the collapsed format, for flame graphs"""
+        return "\n".join(
+            f"{';'.join(stack)} {count}"
+            for stack, count in sorted(self.stacks.items())
+        )
+
+    def top(
+        self, n: int = 10, *, thread: str = None
+    ) -> typing.Tuple[
+        typing.List[typing.Tuple[str, int]], typing.List[typing.Tuple[str, int]]
+    ]:
+        """Get the `n` functions with the most samples where they were
+        running (self) and where they were on the stack (total)"""
+        own = collections.Counter()
+        total = collections.Counter()
+
+        for stack, count in self.stacks.items():
+            if thread is not None and stack[0] != thread:
+                continue
+            if len(stack) > 1:
+                own[stack[-1]] += count
+            for label in set(stack[1:]):
+                total[label] += count
+
+        return own.most_common(n), total.most_common(n)
@@ -0,0 +1,75 @@
+import sqlite3
+import time
+import typing
+
+
+class GatewaySession(typing.NamedTuple):
+    """What the gateway needs to resume a session"""
+
+    shard_id: int
+    session_id: str
+    sequence: typing.Optional[int]
+    gateway: str
+    saved_at: float
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.saved_at
+
+
+class SessionStore:
+    """The gateway sessions of the last process, stored in SQLite when it
+    shuts down so the next one can resume them instead of identifying.
+
+    A session is only tried once, it's removed when it's loaded."""
+
+    def __init__(self, db: sqlite3.Connection):
+        self.db = db
+
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS gateway_sessions ("
+            "shard_id INTEGER PRIMARY KEY, "
+            "session_id TEXT NOT NULL, "
+            "sequence INTEGER, "
+            "gateway TEXT NOT NULL, "
+            "saved_at REAL NOT NULL)"
+        )
+
+    def save(
+        self,
+        shard_id: int,
+        session_id: str,
+        sequence: typing.Optional[int],
+        gateway: str,
+    ) -> GatewaySession:
+        session = GatewaySession(
+            shard_id, session_id, sequence, gateway, time.time()
+        )
+        self.db.execute(
+            "INSERT OR REPLACE INTO gateway_sessions (shard_id, session_id, "
+            "sequence, gateway, saved_at) VALUES (?, ?, ?, ?, ?)",
+            session,
+        )
+        return session
+
+    def pop(
+        self, shard_id: int, max_age: float
+    ) -> typing.Optional[GatewaySession]:
+        """Get and remove the session of a shard, if it's recent enough to
+        be resumed"""
+        row = self.db.execute(
+            "SELECT shard_id, session_id, sequence, gateway, saved_at "
+            "FROM gateway_sessions WHERE shard_id = ?",
+            (shard_id,),
+        ).fetchone()
+        if row is None:
+            return None
+
+        self.db.execute(
+            "DELETE FROM gateway_sessions WHERE shard_id = ?", (shard_id,)
+        )
+        session = GatewaySession(*row)
+        return session if session.age <= max_age else None
+
+    def clear(self):
+        self.db.execute("DELETE FROM gateway_sessions")
@@ -0,0 +1,174 @@
+import collections
+import re
+import time
+import typing
+
+from .wordfilter import normalize
+
+BITS = 64
+BANDS = 16
+BAND_BITS = BITS // BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+
+SHINGLE_SIZE = 5
+MAX_LENGTH = 1024  # only the start of long messages is fingerprinted
+
+WHITESPACE_REGEX = re.compile(r"\s+")
+
+# Every byte spread over 8 little-endian 16-bit counters, one per bit, so the
+# bits of all the shingle hashes can be counted with a single big int sum
+_SPREAD = [
+    b"".join(((byte >> bit) & 1).to_bytes(2, "little") for bit in range(8))
+    for byte in range(256)
+]
+
+
+def simhash(text: str) -> typing.Optional[int]:
+    """64-bit SimHash of the character shingles of `text`
+
+    Returns `None` if `text` is too short to be fingerprinted."""
+    text = WHITESPACE_REGEX.sub(" ", normalize(text[:MAX_LENGTH])).strip()
+    shingles = {
+        text[index : index + SHINGLE_SIZE]
+        for index in range(len(text) - SHINGLE_SIZE + 1)
+    }
+    if not shingles:
+        return None
+
+    spread = _SPREAD.__getitem__
+    total = 0
+    for shingle in shingles:
+        total += int.from_bytes(
+            b"".join(
+                map(
+                    spread,
+                    (hash(shingle) & 0xFFFFFFFFFFFFFFFF).to_bytes(8, "little"),
+                )
+            ),
+            "little",
+        )
+
+    threshold = len(shingles) / 2
+    counts = memoryview(total.to_bytes(BITS * 2, "little")).cast("H")
+    fingerprint = 0
+    for bit, count in enumerate(counts):
+        if count > threshold:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class Entry(typing.NamedTuple):
+    time: float
+    author_id: int
+    channel_id: int
+    fingerprint: int
+
+
+class DuplicateDetector:
+    """Time-bounded index of the fingerprints of recent messages.
+
+    Fingerprints are split into bands and indexed by author and band, two
+    fingerprints that differ by less than `BANDS` bits share at least one
+    band, so only the entries of those buckets are compared. Every bucket
+    and the whole index are capped so the memory and the work done for each
+    message are bounded."""
+
+    def __init__(
+        self,
+        *,
+        channels: int = 3,
+        window: float = 60.0,
+        distance: int = 12,
+        min_length: int = 30,
+        bucket_size: int = 16,
+        max_entries: int = 50_000,
+    ):
+        self.channels = channels
+        self.window = window
+        self.distance = min(distance, BANDS - 1)
+        self.min_length = min_length
+        self.bucket_size = bucket_size
+        self.max_entries = max_entries
+
+        self._buckets: typing.Dict[
+            typing.Tuple[int, int, int], typing.Deque[Entry]
+        ] = {}
+        self._entries: typing.Deque[
+            typing.Tuple[Entry, typing.List[typing.Tuple[int, int, int]]]
+        ] = collections.deque()
+        self._flagged: typing.Dict[int, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def expire(self, now: float):
+        entries = self._entries
+        while entries and (
+            now - entries[0][0].time > self.window
+            or len(entries) > self.max_entries
+        ):
+            entry, keys = entries.popleft()
+            for key in keys:
+                bucket = self._buckets.get(key)
+                if bucket and bucket[0] is entry:
+                    bucket.popleft()
+                if not bucket:
+                    self._buckets.pop(key, None)
+
+        for author_id, flagged_at in list(self._flagged.items()):
+            if now - flagged_at > self.window:
+                del self._flagged[author_id]
+
+    def check(
+        self,
+        author_id: int,
+        channel_id: int,
+        content: str,
+        now: float = None,
+    ) -> typing.Optional[typing.Set[int]]:
+        """Record a message and get the channels where its author posted
+        near-duplicates of it, if there are enough of them"""
+        if len(content) < self.min_length:
+            return None
+
+        fingerprint = simhash(content)
+        if fingerprint is None:
+            return None
+
+        now = time.monotonic() if now is None else now
+        self.expire(now)
+
+        entry = Entry(now, author_id, channel_id, fingerprint)
+        keys = [
+            (author_id, band, (fingerprint >> (band * BAND_BITS)) & BAND_MASK)
+            for band in range(BANDS)
+        ]
+
+        channels = {channel_id}
+        for key in keys:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = collections.deque(
+                    maxlen=self.bucket_size
+                )
+
+            for other in bucket:
+                if (
+                    other.channel_id not in channels
+                    and hamming(fingerprint, other.fingerprint) <= self.distance
+                ):
+                    channels.add(other.channel_id)
+
+            bucket.append(entry)
+
+        self._entries.append((entry, keys))
+
+        if len(channels) < self.channels or author_id in self._flagged:
+            return None
+
+        self._flagged[author_id] = now
+        return channels
@@ -0,0 +1,124 @@
+import collections
+import time
+import typing
+
+
+class UserState:
+    """Sliding windows of the recent messages of a user"""
+
+    __slots__ = (
+        "last_seen",
+        "times",
+        "hashes",
+        "hash_counts",
+        "mentions",
+        "mention_total",
+    )
+
+    def __init__(self, rate: int):
+        self.last_seen: float = 0.0
+        # timestamps of the last `rate` messages
+        self.times: typing.Deque[float] = collections.deque(maxlen=rate)
+        # content hashes of the last messages
+        self.hashes: typing.Deque[int] = collections.deque()
+        self.hash_counts: typing.Counter[int] = collections.Counter()
+        # (timestamp, mention count) of the last messages
+        self.mentions: typing.Deque[typing.Tuple[float, int]] = (
+            collections.deque()
+        )
+        self.mention_total: int = 0
+
+
+class SpamTracker:
+    """Per-user spam counters updated in O(1) for every message.
+
+    Every window has a fixed size, and the state of a user is dropped once
+    they haven't sent a message for `idle` seconds."""
+
+    def __init__(
+        self,
+        *,
+        rate: typing.Tuple[int, float] = (8, 10.0),
+        duplicates: typing.Tuple[int, int] = (4, 10),
+        mentions: typing.Tuple[int, float] = (10, 30.0),
+        mention_window: int = 20,
+        idle: float = 300.0,
+    ):
+        self.rate, self.rate_per = rate
+        self.duplicates, self.duplicate_window = duplicates
+        self.mentions, self.mentions_per = mentions
+        self.mention_window = mention_window
+        self.idle = idle
+
+        self._users: typing.OrderedDict[int, UserState] = (
+            collections.OrderedDict()
+        )
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def reset(self, user_id: int):
+        self._users.pop(user_id, None)
+
+    def expire(self, now: float):
+        """Drop the state of the users that have been quiet for too long"""
+        users = self._users
+        while users:
+            user_id, state = next(iter(users.items()))
+            if now - state.last_seen < self.idle:
+                break
+            del users[user_id]
+
+    def check(
+        self,
+        user_id: int,
+        content: str,
+        mentions: int = 0,
+        now: float = None,
+    ) -> typing.Optional[str]:
+        """Record a message and get the spam rule it breaks, if any"""
+        now = time.monotonic() if now is None else now
+        self.expire(now)
+
+        state = self._users.pop(user_id, None)
+        if state is None:
+            state = UserState(self.rate)
+        # Most recently seen users are kept at the end
+        self._users[user_id] = state
+        state.last_seen = now
+
+        # Message rate
+        times = state.times
+        times.append(now)
+        if len(times) == self.rate and now - times[0] <= self.rate_per:
+            return "rate"
+
+        # Duplicate content
+        if content:
+            content_hash = hash(content.casefold())
+            state.hashes.append(content_hash)
+            state.hash_counts[content_hash] += 1
+            if len(state.hashes) > self.duplicate_window:
+                oldest = state.hashes.popleft()
+                state.hash_counts[oldest] -= 1
+                if not state.hash_counts[oldest]:
+                    del state.hash_counts[oldest]
+
+            if state.hash_counts[content_hash] >= self.duplicates:
+                return "duplicate"
+
+        # Mentions
+        if mentions or state.mentions:
+            window = state.mentions
+            window.append((now, mentions))
+            state.mention_total += mentions
+            while window and (
+                len(window) > self.mention_window
+                or now - window[0][0] > self.mentions_per
+            ):
+                state.mention_total -= window.popleft()[1]
+
+            if state.mention_total >= self.mentions:
+                return "mentions"
+
+        return None
@@ -1,3 +1,4 @@
+import re
 import textwrap
 from textwrap import shorten
 
@@ -38,12 +39,8 @@ def color(text: str, color: str) -> str:
     return text
 
 
+COLOR_REGEX = re.compile("\033\\[[0-9;]*m")
+
+
 def uncolor(text: str) -> str:
-    colors = [
-        getattr(Colors, color)
-        for color in dir(Colors)
-        if not color.startswith("__")
-    ]
-    for color in colors:
-        text = text.replace(color, "")
-    return text
+    return COLOR_REGEX.sub("", text)
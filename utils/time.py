@@ -0,0 +1,52 @@
+import datetime
+import re
+
+# ---------------------------------------------------------------------------------------------
+# Durations
+
+DURATION_UNITS = {
+    "s": 1,
+    "m": 60,
+    "h": 60 * 60,
+    "d": 24 * 60 * 60,
+    "w": 7 * 24 * 60 * 60,
+}
+DURATION_REGEX = re.compile(r"(\d+)\s*([smhdw])", re.IGNORECASE)
+
+
+def parse_duration(text: str) -> datetime.timedelta:
+    """Parse a duration like `1d12h` or `30m` into a `timedelta`
+
+    Raises `ValueError` if `text` isn't a valid duration."""
+    text = text.strip()
+    position = 0
+    seconds = 0
+
+    for match in DURATION_REGEX.finditer(text):
+        if text[position : match.start()].strip():
+            break
+        seconds += int(match.group(1)) * DURATION_UNITS[match.group(2).lower()]
+        position = match.end()
+
+    if not seconds or text[position:].strip():
+        raise ValueError(f"Invalid duration: `{text}`")
+
+    return datetime.timedelta(seconds=seconds)
+
+
+def format_duration(duration: datetime.timedelta) -> str:
+    """Format a `timedelta` like `1 day, 2 hours, 5 mins`"""
+    seconds = int(duration.total_seconds())
+    parts = []
+    for name, amount in [
+        ("week", DURATION_UNITS["w"]),
+        ("day", DURATION_UNITS["d"]),
+        ("hour", DURATION_UNITS["h"]),
+        ("min", DURATION_UNITS["m"]),
+        ("sec", DURATION_UNITS["s"]),
+    ]:
+        value, seconds = divmod(seconds, amount)
+        if value:
+            parts.append(f"{value} {name}{'s' * (value > 1)}")
+
+    return ", ".join(parts) or "0 secs"
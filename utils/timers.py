@@ -0,0 +1,209 @@
+import asyncio
+import datetime
+import heapq
+import json
+import sqlite3
+import time
+import typing
+
+if typing.TYPE_CHECKING:
+    from bot import CodinGameBot
+
+# Sleep at most this long before re-checking the heap, so clock jumps and very
+# long timers don't leave the sleeper waiting on a stale deadline
+MAX_SLEEP = 24 * 60 * 60
+
+
+class Timer:
+    """A persistent timer, dispatched as `on_{event}_timer_complete`"""
+
+    __slots__ = ("id", "event", "expires_at", "created_at", "data")
+
+    def __init__(
+        self,
+        id: int,
+        event: str,
+        expires_at: float,
+        created_at: float,
+        data: dict,
+    ):
+        self.id = id
+        self.event = event
+        self.expires_at = expires_at
+        self.created_at = created_at
+        self.data = data
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> "Timer":
+        return cls(
+            row["id"],
+            row["event"],
+            row["expires_at"],
+            row["created_at"],
+            json.loads(row["data"]),
+        )
+
+    @property
+    def expires(self) -> datetime.datetime:
+        return datetime.datetime.fromtimestamp(
+            self.expires_at, datetime.timezone.utc
+        )
+
+    @property
+    def created(self) -> datetime.datetime:
+        return datetime.datetime.fromtimestamp(
+            self.created_at, datetime.timezone.utc
+        )
+
+    @property
+    def duration(self) -> datetime.timedelta:
+        return datetime.timedelta(seconds=self.expires_at - self.created_at)
+
+    def __repr__(self) -> str:
+        return (
+            f"<Timer id={self.id} event={self.event!r} "
+            f"expires={self.expires.isoformat()}>"
+        )
+
+
+class TimerManager:
+    """Min-heap of pending timers, written through to SQLite.
+
+    A single sleeper task waits for the earliest timer and is woken up when a
+    timer that expires sooner is created. Timers that expired while the bot was
+    offline are dispatched as soon as the sleeper starts."""
+
+    def __init__(self, bot: "CodinGameBot", db: sqlite3.Connection):
+        self.bot: "CodinGameBot" = bot
+        self.db = db
+        self.logger = self.bot.logger.getChild("timers")
+
+        self._heap: typing.List[typing.Tuple[float, int]] = []
+        self._timers: typing.Dict[int, Timer] = {}
+        self._wakeup: typing.Optional[asyncio.Event] = None
+        self._task: typing.Optional[asyncio.Task] = None
+
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS timers ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "event TEXT NOT NULL, "
+            "expires_at REAL NOT NULL, "
+            "created_at REAL NOT NULL, "
+            "data TEXT NOT NULL)"
+        )
+        self.load()
+
+    # --------------------------------------------------------------------------
+    # Storage
+
+    def load(self):
+        """Restore the pending timers from the database"""
+        self._heap.clear()
+        self._timers.clear()
+
+        for row in self.db.execute("SELECT * FROM timers"):
+            timer = Timer.from_row(row)
+            self._timers[timer.id] = timer
+            self._heap.append((timer.expires_at, timer.id))
+
+        heapq.heapify(self._heap)
+        self.logger.debug(f"restored {len(self._timers)} pending timers")
+
+    def create(self, event: str, expires: datetime.datetime, **data) -> Timer:
+        """Schedule `on_{event}_timer_complete` to be dispatched at `expires`"""
+        created_at = time.time()
+        expires_at = expires.timestamp()
+
+        cursor = self.db.execute(
+            "INSERT INTO timers (event, expires_at, created_at, data) "
+            "VALUES (?, ?, ?, ?)",
+            (event, expires_at, created_at, json.dumps(data)),
+        )
+        timer = Timer(cursor.lastrowid, event, expires_at, created_at, data)
+
+        self._timers[timer.id] = timer
+        heapq.heappush(self._heap, (timer.expires_at, timer.id))
+
+        # Wake the sleeper up if this timer is now the next one due
+        if self._heap[0][1] == timer.id and self._wakeup is not None:
+            self._wakeup.set()
+
+        self.logger.debug(f"created {timer!r}")
+        return timer
+
+    def cancel(self, timer: Timer):
+        """Cancel a pending timer, it is lazily removed from the heap"""
+        if self._remove(timer):
+            self.logger.debug(f"cancelled {timer!r}")
+
+    def _remove(self, timer: Timer) -> bool:
+        if self._timers.pop(timer.id, None) is None:
+            return False
+
+        self.db.execute("DELETE FROM timers WHERE id = ?", (timer.id,))
+        return True
+
+    def find(self, event: str, **data) -> typing.List[Timer]:
+        """Get the pending `event` timers whose data matches `data`"""
+        return [
+            timer
+            for timer in self._timers.values()
+            if timer.event == event
+            and all(timer.data.get(key) == value for key, value in data.items())
+        ]
+
+    def __len__(self) -> int:
+        return len(self._timers)
+
+    # --------------------------------------------------------------------------
+    # Sleeper task
+
+    def peek(self) -> typing.Optional[Timer]:
+        """Get the next timer due, dropping cancelled ones from the heap"""
+        while self._heap:
+            timer = self._timers.get(self._heap[0][1])
+            if timer is not None:
+                return timer
+            heapq.heappop(self._heap)
+
+        return None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = self.bot.loop.create_task(self.dispatch_timers())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def dispatch_timers(self):
+        await self.bot.wait_until_ready()
+
+        while True:
+            self._wakeup.clear()
+            timer = self.peek()
+
+            if timer is None:
+                await self._wakeup.wait()
+                continue
+
+            delay = timer.expires_at - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(
+                        self._wakeup.wait(), min(delay, MAX_SLEEP)
+                    )
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._heap)
+            self._remove(timer)
+
+            self.logger.debug(
+                f"dispatching {timer!r}"
+                + (f" ({-delay:.0f}s late)" if -delay >= 1 else "")
+            )
+            self.bot.dispatch(f"{timer.event}_timer_complete", timer)
@@ -0,0 +1,149 @@
+import collections
+import contextlib
+import contextvars
+import time
+import typing
+
+
+class Span(typing.NamedTuple):
+    name: str
+    # seconds since the start of the trace
+    start: float
+    duration: float
+    depth: int
+
+
+class Trace:
+    """Timings of the stages of a single command invocation.
+
+    Stages are either consecutive marks (`mark`) covering the whole
+    invocation, or nested spans (`span`) around a block of code."""
+
+    __slots__ = (
+        "name",
+        "info",
+        "started_at",
+        "start",
+        "end",
+        "last",
+        "depth",
+        "spans",
+    )
+
+    def __init__(self, name: str, **info):
+        self.name = name
+        self.info = info
+        self.started_at = time.time()
+        self.start = self.last = time.perf_counter()
+        self.end: typing.Optional[float] = None
+        self.depth = 0
+        self.spans: typing.List[Span] = []
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+    def mark(self, name: str):
+        """Record the time since the previous mark as the stage `name`"""
+        now = time.perf_counter()
+        self.spans.append(
+            Span(name, self.last - self.start, now - self.last, 0)
+        )
+        self.last = now
+
+    @contextlib.contextmanager
+    def span(self, name: str):
+        start = time.perf_counter()
+        self.depth += 1
+        try:
+            yield
+        finally:
+            self.depth -= 1
+            self.spans.append(
+                Span(
+                    name,
+                    start - self.start,
+                    time.perf_counter() - start,
+                    self.depth + 1,
+                )
+            )
+
+    def finish(self, name: str = "other"):
+        """Mark the rest of the invocation as `name` and stop the trace"""
+        if self.end is None:
+            self.mark(name)
+            self.end = self.last
+
+    def format(self) -> str:
+        lines = []
+        width = max(
+            [len(span.name) + 2 * span.depth for span in self.spans] + [5]
+        )
+        for span in sorted(
+            self.spans, key=lambda span: (span.start, span.depth)
+        ):
+            lines.append(
+                f"{'  ' * span.depth}{span.name:<{width - 2 * span.depth}} "
+                f"{span.duration * 1000:>8.1f} ms"
+            )
+        lines.append(f"{'total':<{width}} {self.duration * 1000:>8.1f} ms")
+        return "\n".join(lines)
+
+
+current_trace: "contextvars.ContextVar[typing.Optional[Trace]]" = (
+    contextvars.ContextVar("current_trace", default=None)
+)
+
+
+@contextlib.contextmanager
+def span(name: str):
+    """Time a block as a stage of the current trace, if any"""
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+
+    with trace.span(name):
+        yield
+
+
+def mark(name: str):
+    """Mark a stage of the current trace, if any"""
+    trace = current_trace.get()
+    if trace is not None:
+        trace.mark(name)
+
+
+class Tracer:
+    """Traces the invocations and keeps the slowest ones in a ring buffer"""
+
+    def __init__(self, threshold: float = 1.0, size: int = 50):
+        self.threshold = threshold
+        self.traces: typing.Deque[Trace] = collections.deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self.traces)
+
+    def start(self, name: str, **info) -> Trace:
+        """Start a trace, it becomes the current trace of the task"""
+        trace = Trace(name, **info)
+        current_trace.set(trace)
+        return trace
+
+    def finish(self, trace: Trace, name: str = "other") -> bool:
+        """Stop a trace, and keep it if it's slow. Get whether it was kept"""
+        trace.finish(name)
+        if current_trace.get() is trace:
+            current_trace.set(None)
+
+        if trace.duration < self.threshold:
+            return False
+        self.traces.append(trace)
+        return True
+
+    def last(self, index: int = 0) -> typing.Optional[Trace]:
+        """Get the `index`-th most recent slow trace"""
+        try:
+            return self.traces[-1 - index]
+        except IndexError:
+            return None
@@ -0,0 +1,211 @@
+import collections
+import re
+import typing
+import unicodedata
+
+# Characters commonly used to dodge filters, mapped to what they look like
+LOOKALIKES = {
+    "0": "o",
+    "1": "i",
+    "3": "e",
+    "4": "a",
+    "5": "s",
+    "7": "t",
+    "8": "b",
+    "@": "a",
+    "$": "s",
+    # Cyrillic
+    "а": "a",
+    "в": "b",
+    "е": "e",
+    "к": "k",
+    "м": "m",
+    "н": "h",
+    "о": "o",
+    "р": "p",
+    "с": "c",
+    "т": "t",
+    "у": "y",
+    "х": "x",
+    "і": "i",
+    "ј": "j",
+    "ѕ": "s",
+    # Greek
+    "α": "a",
+    "β": "b",
+    "ε": "e",
+    "ι": "i",
+    "κ": "k",
+    "ν": "v",
+    "ο": "o",
+    "ρ": "p",
+    "τ": "t",
+    "υ": "u",
+    "χ": "x",
+}
+LOOKALIKES_TABLE = str.maketrans(LOOKALIKES)
+
+# Invisible characters that are removed before matching
+INVISIBLE_REGEX = re.compile("[\u00ad\u200b-\u200f\u2060\ufeff]")
+
+REGEX_PREFIX = "re:"
+# Backreferences by number or name and conditionals, not escaped
+BACKREFERENCE_REGEX = re.compile(r"(?<!\\)(?:\\\\)*(?:\\[1-9]|\(\?P=|\(\?\()")
+
+
+def fold(text: str) -> str:
+    """Fold case and compatibility characters of `text`"""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return INVISIBLE_REGEX.sub("", text)
+
+
+def normalize(text: str) -> str:
+    """Fold case, compatibility characters and look-alikes of `text`"""
+    return fold(text).translate(LOOKALIKES_TABLE)
+
+
+def check_regex(pattern: str):
+    """Raise `re.error` if the regex is invalid, and `ValueError` if it
+    can't be combined with the others: its groups are numbered after the
+    groups of the regexes before it and named groups must be unique"""
+    regex = re.compile(pattern)
+    if regex.groupindex:
+        raise ValueError("named groups aren't allowed")
+    if BACKREFERENCE_REGEX.search(pattern):
+        raise ValueError("backreferences and conditionals aren't allowed")
+
+
+def is_word_char(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+
+class Match(typing.NamedTuple):
+    pattern: str
+    start: int
+    end: int
+
+
+class WordFilter:
+    """Blocklist compiled into a single Aho-Corasick automaton.
+
+    Entries are matched as whole words, unless they start or end with `*`
+    which allows them to be a part of a larger word. Entries starting with
+    `re:` are regexes without named groups or backreferences, all of them
+    are combined into a single regex which doesn't see through look-alikes
+    so digits can still be matched. Matching a message costs the same
+    whatever the number of entries, so a new filter should be built and
+    swapped in when the blocklist changes."""
+
+    def __init__(self, entries: typing.Iterable[str] = ()):
+        self.entries: typing.List[str] = []
+
+        # Automaton: goto transitions, failure links and outputs of each state
+        self._goto: typing.List[typing.Dict[str, int]] = [{}]
+        self._fail: typing.List[int] = [0]
+        self._output: typing.List[typing.List[int]] = [[]]
+
+        # (entry, normalized length, match start of words, match end of words)
+        self._patterns: typing.List[typing.Tuple[str, int, bool, bool]] = []
+        self._regexes: typing.List[str] = []
+
+        for entry in dict.fromkeys(entries):
+            if entry.startswith(REGEX_PREFIX):
+                check_regex(entry[len(REGEX_PREFIX) :])
+                self._regexes.append(entry)
+            else:
+                self._add(entry)
+            self.entries.append(entry)
+
+        self._build()
+        self._regex: typing.Optional[typing.Pattern[str]] = (
+            re.compile(
+                "|".join(
+                    f"(?P<r{index}>{entry[len(REGEX_PREFIX) :]})"
+                    for index, entry in enumerate(self._regexes)
+                )
+            )
+            if self._regexes
+            else None
+        )
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _add(self, entry: str):
+        keyword = normalize(entry.strip("*"))
+        if not keyword:
+            return
+
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+
+        self._output[state].append(len(self._patterns))
+        self._patterns.append(
+            (
+                entry,
+                len(keyword),
+                entry.startswith("*") or not is_word_char(keyword[0]),
+                entry.endswith("*") or not is_word_char(keyword[-1]),
+            )
+        )
+
+    def _build(self):
+        # Breadth-first traversal to compute the failure links
+        queue = collections.deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(char, 0)
+
+                self._fail[next_state] = fail
+                self._output[next_state] += self._output[fail]
+
+    def search(self, text: str) -> typing.Optional[Match]:
+        """Get the first blocklist entry found in `text`"""
+        folded = fold(text)
+        text = folded.translate(LOOKALIKES_TABLE)
+        goto, fail, output = self._goto, self._fail, self._output
+        patterns = self._patterns
+
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+
+            for pattern_index in output[state]:
+                entry, length, partial_start, partial_end = patterns[
+                    pattern_index
+                ]
+                start = index - length + 1
+                if (
+                    partial_start
+                    or start == 0
+                    or not is_word_char(text[start - 1])
+                ) and (
+                    partial_end
+                    or index + 1 == len(text)
+                    or not is_word_char(text[index + 1])
+                ):
+                    return Match(entry, start, index + 1)
+
+        if self._regex is not None:
+            match = self._regex.search(folded)
+            if match:
+                entry = self._regexes[int(match.lastgroup[1:])]
+                return Match(entry, match.start(), match.end())
+
+        return None